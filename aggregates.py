@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class RunningStats:
+    """
+    单个指标的流式统计: Welford 算法计算均值和方差,
+    Poisson bootstrap 为每个副本维护加权和, 数据只需遍历一次即可得到置信区间
+    """
+
+    def __init__(self, resamples):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._weights = np.zeros(resamples)
+        self._sums = np.zeros(resamples)
+
+    def add(self, value, weights):
+        """weights: 该观测在每个 bootstrap 副本中出现的次数"""
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+        self._weights += weights
+        self._sums += weights * value
+
+    def merge(self, other):
+        """合并另一组观测的统计量 (Chan 等人的并行 Welford 合并), bootstrap 加权和直接相加"""
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.n = n
+        self._weights += other._weights
+        self._sums += other._sums
+
+    @property
+    def variance(self):
+        """样本方差 (n-1)"""
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def confidence_interval(self, confidence=0.95):
+        """bootstrap 百分位置信区间"""
+        drawn = self._weights > 0
+        if not drawn.any():
+            return self.mean, self.mean
+        means = self._sums[drawn] / self._weights[drawn]
+        alpha = (1 - confidence) / 2
+        low, high = np.percentile(means, [100 * alpha, 100 * (1 - alpha)])
+        return float(low), float(high)
+
+
+class GroupedStats:
+    """
+    按 (分组, 指标) 维护 RunningStats。
+    每个故事只更新它所在的最细分组, 上层分组在最后由 rollup 合并得到;
+    同一个故事的各指标共用一组 bootstrap 权重, 相当于按故事重抽样
+    """
+
+    def __init__(self, resamples=1000, seed=0):
+        self.resamples = resamples
+        self.groups = {}
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, group, values):
+        """group: 该故事所属的分组键; values: {指标: 数值}"""
+        # 在线 bootstrap: 每个观测在每个副本中出现的次数服从 Poisson(1)
+        weights = self._rng.poisson(1.0, self.resamples)
+        for metric, value in values.items():
+            stats = self.groups.get((group, metric))
+            if stats is None:
+                stats = self.groups[(group, metric)] = RunningStats(self.resamples)
+            stats.add(value, weights)
+
+    def rollup(self, parent_of):
+        """把每个分组合并到 parent_of(分组) 得到的上层分组中"""
+        for (group, metric), stats in list(self.groups.items()):
+            parent = self.groups.get((parent_of(group), metric))
+            if parent is None:
+                parent = self.groups[(parent_of(group), metric)] = RunningStats(self.resamples)
+            parent.merge(stats)
+
+    def get(self, group, metric):
+        return self.groups.get((group, metric))
+
+    def rows(self, confidence=0.95):
+        """[(分组, 指标, n, 均值, 方差, CI 下限, CI 上限)]"""
+        rows = []
+        for (group, metric), stats in self.groups.items():
+            low, high = stats.confidence_interval(confidence)
+            rows.append((group, metric, stats.n, stats.mean, stats.variance, low, high))
+        return rows
@@ -0,0 +1,286 @@
+import json
+import os
+import sys
+import time
+import numpy as np
+from scipy.stats import rankdata
+
+# ================= Configuration =================
+# Evaluator result files on the HANNA benchmark: one record per story with
+# gold_scores and pred_scores / pred_scores_avg / pred_scores_expected
+RESULT_FILES = [
+    "gpt4o_eval_on_hanna_results.json",
+    "finetuned_gpt4o_eval_on_hanna_results.json",
+]
+CRITERIA = ["relevance", "coherence", "empathy", "surprise", "engagement", "complexity"]
+PRED_KEYS = ["pred_scores", "pred_scores_avg", "pred_scores_expected"]
+
+# Bootstrap settings
+N_BOOTSTRAP = 5000
+CONFIDENCE = 0.95
+SEED = 0
+
+OUTPUT_FILE = "evaluator_calibration_results.json"
+# =================================================
+
+# Per-story mean over all criteria, reported as an extra column
+COLUMNS = CRITERIA + ["overall"]
+
+
+def short_name(path, pred_key, multiple_keys):
+    """Readable evaluator name from its file name (and prediction key when a file has several)"""
+    name = os.path.basename(path).replace("_eval_on_hanna_results", "").replace(".json", "")
+    return f"{name}[{pred_key}]" if multiple_keys else name
+
+
+def load_evaluators(path):
+    """
+    Load one result file into NumPy arrays.
+    Returns one evaluator per prediction key present in the file, each with
+    story keys (snippet + gold scores identify a HANNA story), gold and pred
+    arrays of shape (n_stories, len(COLUMNS)).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    present = [k for k in PRED_KEYS if any(k in r for r in records)]
+    evaluators = []
+    for pred_key in present:
+        keys, gold, pred = [], [], []
+        for r in records:
+            scores = r.get(pred_key)
+            if not scores or not all(c in scores and c in r["gold_scores"] for c in CRITERIA):
+                continue
+            keys.append((r["input_story_snippet"], tuple(r["gold_scores"][c] for c in CRITERIA)))
+            gold.append([r["gold_scores"][c] for c in CRITERIA])
+            pred.append([scores[c] for c in CRITERIA])
+        gold = np.array(gold, dtype=float).reshape(-1, len(CRITERIA))
+        pred = np.array(pred, dtype=float).reshape(-1, len(CRITERIA))
+        evaluators.append({
+            "name": short_name(path, pred_key, len(present) > 1),
+            "file": path,
+            "pred_key": pred_key,
+            "keys": keys,
+            "gold": np.column_stack([gold, gold.mean(axis=1)]),
+            "pred": np.column_stack([pred, pred.mean(axis=1)]),
+        })
+    return evaluators
+
+
+# ==================== Vectorised Metrics ====================
+# Every metric takes arrays of shape (..., n_stories, n_columns) and reduces
+# the story axis, so one call scores all criteria of all bootstrap resamples
+# (Kendall works from resample counts instead, see kendall_tau_b).
+
+def pearson(x, y):
+    xc = x - x.mean(axis=-2, keepdims=True)
+    yc = y - y.mean(axis=-2, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (xc * yc).sum(axis=-2) / np.sqrt((xc ** 2).sum(axis=-2) * (yc ** 2).sum(axis=-2))
+
+
+def spearman(x, y):
+    """Pearson correlation of average ranks (handles ties)"""
+    return pearson(rankdata(x, axis=-2), rankdata(y, axis=-2))
+
+
+def kendall_tau_b(x, y, counts=None):
+    """
+    Kendall's tau-b over all story pairs:
+    (concordant - discordant) / sqrt(pairs untied in x * pairs untied in y)
+
+    x, y: (n_stories, n_columns). For bootstrap resamples pass counts
+    (n_resamples, n_stories), how often each story was drawn. Every pair sum
+    is then the quadratic form counts . S . counts over the (n, n, n_columns)
+    pairwise sign matrix S of the original data, so resamples are never
+    materialised. A story paired with its own copy has sign 0 and drops out,
+    as it does in tau-b.
+    """
+    if counts is None:
+        return kendall_tau_b(x, y, np.ones((1, len(x))))[0]
+    n, columns = x.shape
+    sx = np.sign(x[:, None, :] - x[None, :, :])
+    sy = np.sign(y[:, None, :] - y[None, :, :])
+
+    def pair_sum(signs):
+        weighted = (counts @ signs.reshape(n, n * columns)).reshape(-1, n, columns)
+        return np.einsum("bj,bjc->bc", counts, weighted)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pair_sum(sx * sy) / np.sqrt(pair_sum(np.abs(sx)) * pair_sum(np.abs(sy)))
+
+
+def mae(x, y):
+    return np.abs(x - y).mean(axis=-2)
+
+
+METRICS = {
+    "pearson": pearson,
+    "spearman": spearman,
+    "kendall": kendall_tau_b,
+    "mae": mae,
+}
+
+
+def bootstrap_metrics(gold, pred, indices):
+    """Metric values for every resample: {metric: array (n_resamples, n_columns)}"""
+    n_resamples, n = indices.shape
+    counts = np.bincount((indices + n * np.arange(n_resamples)[:, None]).ravel(),
+                         minlength=n_resamples * n).reshape(n_resamples, n).astype(float)
+    gold_resamples, pred_resamples = gold[indices], pred[indices]
+    return {
+        metric: kendall_tau_b(gold, pred, counts) if fn is kendall_tau_b else fn(gold_resamples, pred_resamples)
+        for metric, fn in METRICS.items()
+    }
+
+
+def summarize(point, samples, confidence=CONFIDENCE):
+    """{column: {"value", "ci_low", "ci_high"}} from a point estimate and its bootstrap samples"""
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid="ignore"):
+        low, high = np.nanpercentile(samples, [100 * alpha, 100 * (1 - alpha)], axis=0)
+    return {
+        column: {"value": _number(point[k]), "ci_low": _number(low[k]), "ci_high": _number(high[k])}
+        for k, column in enumerate(COLUMNS)
+    }
+
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+# ==================== Analyses ====================
+
+def evaluate_evaluator(evaluator, rng):
+    """Point estimates and bootstrap CIs for one evaluator on all of its stories"""
+    gold, pred = evaluator["gold"], evaluator["pred"]
+    indices = rng.integers(0, len(gold), size=(N_BOOTSTRAP, len(gold)))
+    samples = bootstrap_metrics(gold, pred, indices)
+    return {metric: summarize(METRICS[metric](gold, pred), samples[metric]) for metric in METRICS}
+
+
+def compare_paired(evaluators, rng):
+    """
+    Side-by-side comparison on the stories every evaluator scored.
+    All evaluators share the same resamples, so each difference to the first
+    (reference) evaluator gets a paired bootstrap CI.
+    """
+    common = set(evaluators[0]["keys"])
+    for evaluator in evaluators[1:]:
+        common &= set(evaluator["keys"])
+    common = sorted(common)
+    if len(common) < 3:
+        return None
+
+    aligned = []
+    for evaluator in evaluators:
+        position = {key: i for i, key in enumerate(evaluator["keys"])}
+        rows = [position[key] for key in common]
+        aligned.append((evaluator["gold"][rows], evaluator["pred"][rows]))
+
+    indices = rng.integers(0, len(common), size=(N_BOOTSTRAP, len(common)))
+    samples = [bootstrap_metrics(gold, pred, indices) for gold, pred in aligned]
+    points = [{metric: fn(gold, pred) for metric, fn in METRICS.items()} for gold, pred in aligned]
+
+    reference = evaluators[0]["name"]
+    differences = {}
+    for evaluator, point, sample in zip(evaluators[1:], points[1:], samples[1:]):
+        differences[evaluator["name"]] = {
+            metric: summarize(point[metric] - points[0][metric], sample[metric] - samples[0][metric])
+            for metric in METRICS
+        }
+    return {
+        "reference": reference,
+        "n": len(common),
+        "scores": {
+            evaluator["name"]: {metric: summarize(point[metric], sample[metric]) for metric in METRICS}
+            for evaluator, point, sample in zip(evaluators, points, samples)
+        },
+        "differences": differences,
+    }
+
+
+def _excludes_zero(entry):
+    return entry["ci_low"] is not None and (entry["ci_low"] > 0 or entry["ci_high"] < 0)
+
+
+def _cell(entry, mark_significant=False):
+    if entry["value"] is None:
+        return "n/a"
+    mark = "*" if mark_significant and _excludes_zero(entry) else ""
+    return f"{entry['value']:.2f} [{entry['ci_low']:.2f}, {entry['ci_high']:.2f}]{mark}"
+
+
+def print_table(title, results, mark_significant=False, width=24):
+    """One table per metric: criteria as rows, evaluators as columns"""
+    names = list(results)
+    for metric in METRICS:
+        print(f"\n[{metric.upper()}] {title}")
+        print(f"  {'Criterion':<12}" + "".join(f"{name[:width - 2]:>{width}}" for name in names))
+        for column in COLUMNS:
+            print(f"  {column:<12}" + "".join(f"{_cell(results[name][metric][column], mark_significant):>{width}}" for name in names))
+
+
+def main():
+    files = sys.argv[1:] or RESULT_FILES
+    start_time = time.time()
+    rng = np.random.default_rng(SEED)
+
+    evaluators = []
+    for path in files:
+        if not os.path.exists(path):
+            print(f"[ERROR] File not found: {path}")
+            continue
+        for evaluator in load_evaluators(path):
+            print(f"[INFO] {evaluator['name']}: {len(evaluator['keys'])} stories ({evaluator['pred_key']} from {path})")
+            evaluators.append(evaluator)
+    if not evaluators:
+        print("[ERROR] No evaluator results loaded!")
+        return
+
+    print("\n" + "=" * 70)
+    print(f"Evaluator Calibration on HANNA ({CONFIDENCE:.0%} bootstrap CI, {N_BOOTSTRAP} resamples)")
+    print("=" * 70)
+
+    # 1. Each evaluator on all of its own stories
+    results = {evaluator["name"]: evaluate_evaluator(evaluator, rng) for evaluator in evaluators}
+    print_table("Each evaluator on all of its stories", results)
+
+    # 2. Paired comparison on the shared stories
+    paired = compare_paired(evaluators, rng) if len(evaluators) > 1 else None
+    if paired:
+        print("\n" + "=" * 70)
+        print(f"Paired comparison on {paired['n']} shared stories (difference to {paired['reference']})")
+        print("=" * 70)
+        print_table("Difference to reference, * = CI excludes 0", paired["differences"], mark_significant=True)
+        for name, metrics in paired["differences"].items():
+            significant = [
+                f"{metric}/{column}" for metric, columns in metrics.items()
+                for column, entry in columns.items() if _excludes_zero(entry)
+            ]
+            print(f"\n  {name} vs {paired['reference']}: "
+                  f"{', '.join(significant) + ' differ significantly' if significant else 'no significant differences'}")
+
+    output = {
+        "n_bootstrap": N_BOOTSTRAP,
+        "confidence": CONFIDENCE,
+        "evaluators": {
+            evaluator["name"]: {
+                "file": evaluator["file"],
+                "pred_key": evaluator["pred_key"],
+                "n": len(evaluator["keys"]),
+                "metrics": results[evaluator["name"]],
+            }
+            for evaluator in evaluators
+        },
+        "paired": paired,
+    }
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+
+    print(f"\n[OK] Results saved to: {OUTPUT_FILE}")
+    print(f"[OK] Computed in {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,67 @@
 import os
 import re
+import sys
+import csv
 import json
+import math
 import time
-import concurrent.futures
-from openai import OpenAI
+import random
+import asyncio
+import openai
+from collections import deque
+from openai import AsyncOpenAI
+from score_store import ScoreStore, story_hash
+from aggregates import GroupedStats
 
-# 初始化 Client
-    
-client = OpenAI()
+# 设置环境变量 OPENAI_BASE_URL 可指向本地故障注入服务器 (full system/fake_openai_server.py)
+BASE_URL = os.environ.get("OPENAI_BASE_URL")
 
 # 评估维度的定义
 CRITERIA = ["Relevance", "Coherence", "Empathy", "Surprise", "Engagement", "Complexity"]
 
-def parse_scores(response_text):
+# 评分库: 按 (故事内容哈希, 评估模型, 提示词版本) 保存每个故事的分数
+EVAL_MODEL = "finetune-gpt-4o"
+PROMPT_VERSION = "v1" # 修改评估提示词后请递增, 旧分数将不再复用
+SCORE_STORE_PATH = "evaluation_scores.sqlite"
+
+# 自适应并发 (AIMD): 根据观测到的延迟和 429 调整同时在途的请求数
+MIN_CONCURRENCY = 4
+MAX_CONCURRENCY = 256
+TARGET_LATENCY = 30.0 # 秒; 延迟超过该值时不再增加并发
+MAX_RETRIES = 5       # 429 / 5xx / 超时 / 解析失败的最大重试次数
+
+# 一次运行评估 STORIES_ROOT 下的所有实验条件 (baseline_stories_<T>, batch_stories_ablation_<A>_<I>, ...)
+STORIES_ROOT = "stories"
+FULL_SYSTEM = (3, 3) # 完整系统对应的 (智能体数, 迭代轮数), 即 full system/config.py 的默认值
+BOOTSTRAP_RESAMPLES = 1000
+CONFIDENCE = 0.95
+
+# 打包评估: 每个请求评估 K 个同主题故事, 请求数和固定提示词开销约降为 1/K
+PACK_SIZE = 1
+CALIBRATION_FILES = ["gpt4o_eval_on_hanna_results.json", "finetuned_gpt4o_eval_on_hanna_results.json"]
+# 参考文件只保存了写作提示的前约 85 个字符, 没有故事正文; 校准需要 HANNA 数据集中的完整故事
+# (github.com/dig-team/hanna-benchmark-asg 的 hanna_stories_annotations.csv)
+HANNA_STORIES_PATH = "hanna_stories_annotations.csv"
+
+# logprob 评估: 请求分数 token 的 top_logprobs, 一次调用即可得到每个维度的期望分数和标准差,
+# 比整数分数更细, 无需重复评估取平均
+SCORE_LOGPROBS = False
+TOP_LOGPROBS = 5
+
+def prompt_version(pack_size=None):
+    """打包评估使用不同的提示词, 分数单独存储; logprob 模式的记录额外带有期望分数"""
+    pack_size = pack_size or PACK_SIZE
+    version = PROMPT_VERSION if pack_size == 1 else f"{PROMPT_VERSION}-pack{pack_size}"
+    return f"{version}-logprobs" if SCORE_LOGPROBS else version
+
+def parse_scores(response_text, num_stories=None):
     """
     使用正则表达式从 GPT 输出中提取分数。
+    num_stories 不为 None 时解析打包评估的输出 ("Story 1:" ... "Story K:" 编号块),
+    返回长度为 num_stories 的列表; 缺失、重复或不完整的块对应位置为 None
     """
+    if num_stories is not None:
+        return parse_packed_scores(response_text, num_stories)
     scores = {}
     for criterion in CRITERIA:
         # 匹配 pattern: Criterion: [number] 或 Criterion: number
@@ -31,18 +77,67 @@ def parse_scores(response_text):
             scores[criterion] = 0 
     return scores
 
-def evaluate_single_story(filepath, theme):
+def story_blocks(response_text):
+    """打包输出中的编号块: [(编号, 起始位置, 结束位置)]"""
+    headers = list(re.finditer(r"^[#*\s]*Story\s+(\d+)\s*[:.)\-]?[*#]*", response_text, re.IGNORECASE | re.MULTILINE))
+    return [(int(header.group(1)), header.end(), following.start() if following else len(response_text))
+            for header, following in zip(headers, headers[1:] + [None])]
+
+def parse_packed_scores(response_text, num_stories):
+    blocks = {}
+    for number, start, end in story_blocks(response_text):
+        scores = parse_scores(response_text[start:end])
+        if number in blocks or not all(scores.values()):
+            blocks[number] = None # 重复编号或缺少维度: 该块不可信
+        else:
+            blocks[number] = scores
+    # 出现超出范围的编号说明输出与输入没有对齐, 整批重新评估
+    if any(n < 1 or n > num_stories for n in blocks):
+        return [None] * num_stories
+    return [blocks.get(i) for i in range(1, num_stories + 1)]
+
+def expected_scores(response_text, tokens, start=0, end=None):
     """
-    读取单个故事文件，调用 GPT-4o 进行评分
+    根据分数 token 的 top_logprobs 计算 response_text[start:end] 中每个维度的期望分数和标准差
+    tokens: response.choices[0].logprobs.content; 返回 {维度: {"mean": 期望, "std": 标准差}}
     """
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            story_content = f.read().strip()
-            
-        if not story_content or len(story_content) < 50: # 跳过空文件或过短的文件
-            return None
+    if not tokens or "".join(t.token for t in tokens) != response_text:
+        return {}
+    offsets = []
+    position = 0
+    for token in tokens:
+        offsets.append(position)
+        position += len(token.token)
+    end = len(response_text) if end is None else end
+
+    expected = {}
+    for criterion in CRITERIA:
+        match = re.compile(f"{criterion}:\\s*\\[?(\\d)\\]?", re.IGNORECASE).search(response_text, start, end)
+        if not match:
+            continue
+        # 包含分数数字的 token
+        index = max(i for i, offset in enumerate(offsets) if offset <= match.start(1))
+        probs = {}
+        for alternative in tokens[index].top_logprobs or []:
+            digit = alternative.token.strip(" []*")
+            if digit in ("1", "2", "3", "4", "5"):
+                probs[int(digit)] = probs.get(int(digit), 0.0) + math.exp(alternative.logprob)
+        total = sum(probs.values())
+        if total == 0:
+            continue
+        # 只在 1-5 上重新归一化
+        mean = sum(score * p for score, p in probs.items()) / total
+        variance = sum((score - mean) ** 2 * p for score, p in probs.items()) / total
+        expected[criterion] = {"mean": round(mean, 4), "std": round(math.sqrt(variance), 4)}
+    return expected
+
+def writing_prompt(theme):
+    if theme is None: # HANNA 等外部语料: 写作提示已包含在故事开头
+        return "The writing prompt is given at the beginning of the story content."
+    return f"You need to write a creative science fiction which is related to {theme}, you need to show how {theme} will be in the future."
 
-        prompt = f"""
+def build_prompt(theme, story_content):
+    return f"""
 You are a story evaluator, you will evaluate a story which is written based on the given background. You need to score the story by the following criteria: Relevance, Coherence, Empathy, Surprise, Engagement, and Complexity.
 You only need to output the result in the following format:
 Relevance: [1-5]
@@ -53,151 +148,552 @@ Engagement: [1-5]
 Complexity: [1-5]
 
 Writing Prompt:
-You need to write a creative science fiction which is related to {theme}, you need to show how {theme} will be in the future.
+{writing_prompt(theme)}
 
 Story Content:
 {story_content}
 """
-        response = client.chat.completions.create(
-            model="finetune-gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a strict and objective literary critic."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        
-        result_text = response.choices[0].message.content
-        scores = parse_scores(result_text)
-        
-        # 验证解析是否成功
-        if sum(scores.values()) == 0:
-            print(f"  [Warning] Failed to parse scores for {os.path.basename(filepath)}.")
-            return None
-            
-        return scores
-
-    except Exception as e:
-        print(f"  [Error] Evaluating {os.path.basename(filepath)} failed: {e}")
+
+def build_packed_prompt(entries):
+    """entries: [(theme, story_content)], 每个故事一个编号块"""
+    stories = "\n\n".join(
+        f"### Story {i}\nWriting Prompt:\n{writing_prompt(theme)}\n\nStory Content:\n{story_content}"
+        for i, (theme, story_content) in enumerate(entries, 1)
+    )
+    return f"""
+You are a story evaluator, you will evaluate {len(entries)} stories, each written based on its own given background. Score every story independently by the following criteria: Relevance, Coherence, Empathy, Surprise, Engagement, and Complexity.
+You only need to output the result in the following format, one numbered block per story, in the same order as the stories (Story 1 to Story {len(entries)}):
+Story 1:
+Relevance: [1-5]
+Coherence: [1-5]
+Empathy: [1-5]
+Surprise: [1-5]
+Engagement: [1-5]
+Complexity: [1-5]
+Story 2:
+...
+
+{stories}
+"""
+
+def read_story(filepath):
+    """读取故事正文; 空文件或过短的文件返回 None"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        story_content = f.read().strip()
+    if not story_content or len(story_content) < 50: # 跳过空文件或过短的文件
+        return None
+    return story_content
+
+class AdaptiveLimiter:
+    """
+    AIMD 并发控制: 慢启动阶段每次成功 +1, 之后每轮 (约 limit 次成功) +1;
+    遇到 429 或超时减半 (每个往返周期最多一次)
+    等待者按先来先到排队, 每空出一个名额只唤醒一个等待者, 避免成百上千个协程被同时唤醒又重新睡眠
+    """
+
+    def __init__(self, initial=MIN_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY,
+                 target_latency=TARGET_LATENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.slow_start = True
+        self._last_decrease = 0.0
+        self._waiters = deque()
+
+    def _wake(self):
+        """把空出的名额直接交给队首的等待者 (in_flight 在唤醒前就已计入)"""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def acquire(self):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已经交给了这个协程, 取消时要还回去
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    async def release(self, latency, throttled=False):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if throttled:
+            if now - self._last_decrease > max(1.0, latency):
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+            self.slow_start = False
+        elif latency > self.target_latency:
+            self.slow_start = False
+        else:
+            self.limit = min(self.maximum, self.limit + (1.0 if self.slow_start else 1.0 / self.limit))
+        self._wake()
+
+def is_transient(error):
+    """429、5xx、超时和连接错误可以重试"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, asyncio.TimeoutError))
+
+async def evaluate_pack_async(aclient, pack, limiter, store, version):
+    """
+    异步评估一个请求 (单个故事或打包的 K 个故事): 失败时指数退避重试, 得到的分数立即写入评分库
+    pack: [(item, story_content)]
+    返回 (已评分条目, 失败条目, 需重新排队的条目); 打包输出中未对齐或不完整的故事会被重新排队为单篇评估
+    """
+    if len(pack) == 1:
+        prompt = build_prompt(pack[0][0]["theme"], pack[0][1])
+    else:
+        prompt = build_packed_prompt([(item["theme"], story_content) for item, story_content in pack])
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire()
+        start = time.monotonic()
+        throttled = False
+        try:
+            response = await aclient.chat.completions.create(
+                model=EVAL_MODEL,
+                messages=[
+                    {"role": "system", "content": "You are a strict and objective literary critic."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0,
+                **({"logprobs": True, "top_logprobs": TOP_LOGPROBS} if SCORE_LOGPROBS else {})
+            )
+            result_text = response.choices[0].message.content
+            tokens = response.choices[0].logprobs.content if SCORE_LOGPROBS and response.choices[0].logprobs else None
+            if len(pack) == 1:
+                ranges = [(0, len(result_text))]
+                parsed = [parse_scores(result_text)]
+                if sum(parsed[0].values()) == 0:
+                    parsed = [None]
+            else:
+                parsed = parse_scores(result_text, len(pack))
+                blocks = {number: (start, end) for number, start, end in story_blocks(result_text)}
+                ranges = [blocks.get(i, (0, 0)) for i in range(1, len(pack) + 1)]
+            scored = []
+            requeue = []
+            for (item, story_content), scores, (block_start, block_end) in zip(pack, parsed, ranges):
+                if scores:
+                    expected = expected_scores(result_text, tokens, block_start, block_end) if tokens else None
+                    store.put(item["hash"], EVAL_MODEL, version, scores, result_text, item["path"], item["theme"], expected)
+                    scored.append(item)
+                else:
+                    requeue.append((item, story_content))
+            if len(pack) > 1 or scored:
+                return scored, [], requeue
+            error = "unparseable output"
+        except Exception as e:
+            if not is_transient(e):
+                print(f"  [Error] Evaluating {', '.join(item['filename'] for item, _ in pack)} failed: {e}")
+                return [], [item for item, _ in pack], []
+            throttled = getattr(e, "status_code", None) == 429 or isinstance(e, (openai.APITimeoutError, asyncio.TimeoutError))
+            error = e
+        finally:
+            await limiter.release(time.monotonic() - start, throttled)
+
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1.5))
+    print(f"  [Error] Evaluating {', '.join(item['filename'] for item, _ in pack)} failed after {MAX_RETRIES} retries: {error}")
+    return [], [item for item, _ in pack], []
+
+def make_packs(items, pack_size):
+    """按 (实验条件, 主题) 分组后每 pack_size 个故事打成一包, 同一请求中不会混入不同条件的故事"""
+    groups = {}
+    for item in items:
+        story_content = item.get("content") or read_story(item["path"])
+        groups.setdefault((item.get("condition"), item["theme"]), []).append((item, story_content))
+    return [group[i:i + pack_size] for group in groups.values() for i in range(0, len(group), pack_size)]
+
+def make_async_client():
+    """
+    SDK 自带的重试 (默认 max_retries=2) 会在客户端内部吞掉 429 和 5xx, AdaptiveLimiter 就收不到限流信号,
+    还会与 MAX_RETRIES 叠加; 因此关闭 SDK 重试, 重试和退避全部由 evaluate_pack_async 负责
+    """
+    return AsyncOpenAI(base_url=BASE_URL, max_retries=0)
+
+async def evaluate_all_async(pending, store, pack_size=None, version=None):
+    """
+    并发评估所有待评估故事; 在途请求数由 AdaptiveLimiter 控制, 而非固定线程数
+    返回评估失败的文件列表
+    """
+    pack_size = pack_size or PACK_SIZE
+    version = version or prompt_version(pack_size)
+    aclient = make_async_client()
+    limiter = AdaptiveLimiter()
+    start_time = time.time()
+    failed = []
+    requeued = 0
+    completed_count = 0
+    last_report = 0
+
+    tasks = {asyncio.create_task(evaluate_pack_async(aclient, pack, limiter, store, version))
+             for pack in make_packs(pending, pack_size)}
+    while tasks:
+        done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            scored, pack_failed, requeue = task.result()
+            completed_count += len(scored) + len(pack_failed)
+            failed.extend(pack_failed)
+            # 未对齐的故事单独重新评估, 避免再次打包出错
+            requeued += len(requeue)
+            tasks.update(asyncio.create_task(evaluate_pack_async(aclient, [entry], limiter, store, version))
+                         for entry in requeue)
+        if completed_count - last_report >= 50: # 每50个打印一次进度
+            last_report = completed_count
+            elapsed = time.time() - start_time
+            print(f"  Progress: {completed_count}/{len(pending)} | {completed_count / elapsed:.2f} stories/s | "
+                  f"concurrency limit {int(limiter.limit)}")
+
+    elapsed = time.time() - start_time
+    if pending:
+        print(f"Scored {len(pending) - len(failed)}/{len(pending)} stories in {elapsed:.1f}s "
+              f"({(len(pending) - len(failed)) / max(elapsed, 1e-9):.2f} stories/s, final concurrency limit {int(limiter.limit)}).")
+    if requeued:
+        print(f"  {requeued} stories had misaligned or partial packed output and were re-scored individually.")
+    await aclient.close()
+    return failed
+
+def write_hanna_results(path, items, samples, store, version):
+    """
+    以 HANNA 参考文件的格式保存评分结果, 供 calibrate_evaluator.py 与其他评估器比较
+    评分用的是完整故事, 但 input_story_snippet 写入参考文件中的片段, calibrate_evaluator.py 才能按 (片段, 人工标注分数) 对齐
+    """
+    records = []
+    for item, sample in zip(items, samples.values()):
+        record = store.get(item["hash"], EVAL_MODEL, version)
+        if not record:
+            continue
+        entry = {
+            "input_story_snippet": sample["snippet"],
+            "story_id": item["story_id"],
+            "gold_scores": sample["gold"],
+            "pred_scores": {c.lower(): score for c, score in record["scores"].items()},
+        }
+        if record["expected"]: # logprob 模式
+            entry["pred_scores_expected"] = {c.lower(): e["mean"] for c, e in record["expected"].items()}
+        records.append(entry)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2, ensure_ascii=False)
+
+def load_hanna_stories(path):
+    """
+    读取 HANNA 数据集 (每个故事 3 行, 每行一位标注者), 返回 {Story ID: {"prompt", "story", "gold"}}
+    gold 为各维度标注的均值 (保留 1 位小数), 与参考文件中的 gold_scores 一致
+    """
+    stories = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            story = stories.setdefault(row["Story ID"], {"prompt": row["Prompt"], "story": row["Story"], "ratings": {}})
+            for c in CRITERIA:
+                story["ratings"].setdefault(c.lower(), []).append(float(row[c]))
+    for story in stories.values():
+        story["gold"] = {c: round(sum(r) / len(r), 1) for c, r in story.pop("ratings").items()}
+    return stories
+
+def match_hanna_story(snippet, gold, stories):
+    """参考文件中的一条记录 -> 对应的 Story ID: 写作提示以片段开头且人工标注分数相同; 无法唯一确定时返回 None"""
+    prefix = snippet.removeprefix("Writing Prompt:\n").removesuffix("...").strip()
+    matches = [
+        story_id for story_id, story in stories.items()
+        if story["prompt"].strip().startswith(prefix)
+        and all(abs(story["gold"][c] - gold[c]) < 0.051 for c in gold)
+    ]
+    return matches[0] if len(matches) == 1 else None
+
+def run_packing_calibration(pack_size=None):
+    """
+    打包评估校准: 用 HANNA 参考文件中的故事 (完整正文来自 HANNA_STORIES_PATH), 分别以单篇和打包 (K 篇) 方式评分,
+    检查两者是否一致, 并与参考文件中的单篇预测分数及人工标注分数比较;
+    两种方式的结果另存为 HANNA 格式, 可用 calibrate_evaluator.py 计算相关系数和置信区间
+    """
+    pack_size = pack_size or (PACK_SIZE if PACK_SIZE > 1 else 5)
+    if not os.path.exists(HANNA_STORIES_PATH):
+        # 参考文件里的 input_story_snippet 只是截断的写作提示, 对它评分不能说明打包评估在真实故事上是否可靠
+        print(f"[ERROR] {HANNA_STORIES_PATH} not found. The reference files only contain truncated writing "
+              f"prompts, not the stories, so calibration needs the full HANNA stories "
+              f"(hanna_stories_annotations.csv from github.com/dig-team/hanna-benchmark-asg).")
         return None
+    stories = load_hanna_stories(HANNA_STORIES_PATH)
+
+    # 片段只是写作提示的开头, 不同故事可能相同, 因此用片段 + 人工标注分数找到 HANNA 中的故事, 按 Story ID 区分
+    samples = {}
+    unmatched = 0
+    for path in CALIBRATION_FILES:
+        with open(path, "r", encoding="utf-8") as f:
+            for record in json.load(f):
+                story_id = match_hanna_story(record["input_story_snippet"], record["gold_scores"], stories)
+                if story_id is None:
+                    unmatched += 1
+                    continue
+                sample = samples.setdefault(story_id, {"gold": record["gold_scores"], "refs": {},
+                                                       "snippet": record["input_story_snippet"]})
+                sample["refs"][path] = record.get("pred_scores") or record.get("pred_scores_avg")
+    items = []
+    for story_id in samples:
+        story = stories[story_id]
+        content = f"Writing Prompt:\n{story['prompt'].strip()}\n\nStory:\n{story['story'].strip()}"
+        items.append({"path": None, "theme": None, "filename": f"hanna_{story_id}", "story_id": story_id,
+                      "hash": story_hash(content), "content": content})
+    if unmatched:
+        print(f"[Warning] {unmatched} reference records could not be matched to a unique HANNA story and are skipped.")
+    print(f"Calibrating packed evaluation (K={pack_size}) on {len(items)} HANNA stories...")
+
+    store = ScoreStore(":memory:")
+    asyncio.run(evaluate_all_async(items, store, pack_size=1, version="calibration-single"))
+    asyncio.run(evaluate_all_async(items, store, pack_size=pack_size, version="calibration-packed"))
+
+    report = {"pack_size": pack_size, "criteria": {}}
+    print(f"\n{'Criterion':<12} {'n':>4} {'|packed-single|':>15} {'agree':>6} {'bias':>6} {'single-gold':>12} {'packed-gold':>12}")
+    for c in CRITERIA:
+        rows = []
+        for item, sample in zip(items, samples.values()):
+            single = store.get(item["hash"], EVAL_MODEL, "calibration-single")
+            packed = store.get(item["hash"], EVAL_MODEL, "calibration-packed")
+            if single and packed:
+                rows.append((single["scores"][c], packed["scores"][c], sample["gold"][c.lower()],
+                             {path: ref[c.lower()] for path, ref in sample["refs"].items()}))
+        if not rows:
+            continue
+        n = len(rows)
+        stats = {
+            "n": n,
+            "mae_packed_vs_single": sum(abs(p - s) for s, p, _, _ in rows) / n,
+            "agreement": sum(p == s for s, p, _, _ in rows) / n,
+            "bias_packed_minus_single": sum(p - s for s, p, _, _ in rows) / n,
+            "mae_single_vs_gold": sum(abs(s - g) for s, _, g, _ in rows) / n,
+            "mae_packed_vs_gold": sum(abs(p - g) for _, p, g, _ in rows) / n,
+        }
+        for path in CALIBRATION_FILES:
+            ref_rows = [(s, p, refs[path]) for s, p, _, refs in rows if path in refs]
+            if ref_rows:
+                stats[f"mae_single_vs_{path}"] = sum(abs(s - ref) for s, _, ref in ref_rows) / len(ref_rows)
+                stats[f"mae_packed_vs_{path}"] = sum(abs(p - ref) for _, p, ref in ref_rows) / len(ref_rows)
+        report["criteria"][c] = stats
+        print(f"{c:<12} {n:>4} {stats['mae_packed_vs_single']:>15.2f} {stats['agreement']:>6.0%} "
+              f"{stats['bias_packed_minus_single']:>+6.2f} {stats['mae_single_vs_gold']:>12.2f} {stats['mae_packed_vs_gold']:>12.2f}")
+    result_files = [f"{EVAL_MODEL}_single_eval_on_hanna_results.json", f"{EVAL_MODEL}_pack{pack_size}_eval_on_hanna_results.json"]
+    write_hanna_results(result_files[0], items, samples, store, "calibration-single")
+    write_hanna_results(result_files[1], items, samples, store, "calibration-packed")
+    store.close()
+
+    with open("packing_calibration.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("Saved packing_calibration.json")
+    print(f"Compare against the reference evaluators with:\n  python calibrate_evaluator.py "
+          f"{' '.join(CALIBRATION_FILES + result_files)}")
+    return report
 
 def clean_theme_name(folder_name):
     """
     从文件夹名提取主题。
     例如: "Shoes_A3_I3" -> "Shoes"
     例如: "Kitchen_Knife_A3_I3" -> "Kitchen Knife"
+    例如: "Coffee_Baseline" -> "Coffee"
     """
-    # 移除 _A{数字}_I{数字} 的后缀
-    cleaned = re.sub(r'_A\d+_I\d+$', '', folder_name)
+    # 移除 _A{数字}_I{数字} 或 _Baseline 的后缀
+    cleaned = re.sub(r'(_A\d+_I\d+|_Baseline)$', '', folder_name)
     # 将下划线替换回空格
     cleaned = cleaned.replace('_', ' ')
     return cleaned
 
-def run_evaluation():
-    root_dir = "batch_stories_ablation" # 请确保这是你的根目录文件夹名
-    
-    if not os.path.exists(root_dir):
-        print(f"Directory '{root_dir}' not found. Please check the folder name.")
-        return
+def parse_condition(dir_name):
+    """
+    从实验目录名或主题文件夹名识别实验条件, 返回 (条件名, 属性) 或 None
+    例如: "baseline_stories_0.8" -> "baseline_T0.8"
+    例如: "batch_stories_ablation_1_3" 或 "Coffee_A1_I3" -> "ablation_A1_I3"
+    """
+    match = re.search(r"baseline_stories_(\d+(?:\.\d+)?)$", dir_name)
+    if match:
+        return f"baseline_T{match.group(1)}", {"family": "baseline", "temperature": match.group(1)}
+    if dir_name.endswith("_Baseline"):
+        return "baseline", {"family": "baseline"}
+    match = re.search(r"ablation_(\d+)_(\d+)$", dir_name) or re.search(r"_A(\d+)_I(\d+)$", dir_name)
+    if match:
+        agents, iterations = int(match.group(1)), int(match.group(2))
+        family = "full_system" if (agents, iterations) == FULL_SYSTEM else "ablation"
+        return f"{family}_A{agents}_I{iterations}", {"family": family, "agents": agents, "iterations": iterations}
+    return None
 
-    # 1. 扫描所有 txt 文件
+def describe_folder(root_dir, subdir):
+    """
+    故事所在文件夹 -> (条件名, 条件属性, 主题)
+    外层实验目录名优先于主题文件夹的后缀 (例如 batch_stories_ablation_3_0 下的 *_A1_I1)
+    """
+    parts = [os.path.basename(os.path.abspath(root_dir))] + os.path.relpath(subdir, root_dir).split(os.sep)
+    for part in parts:
+        condition = parse_condition(part)
+        if condition:
+            return condition[0], condition[1], clean_theme_name(parts[-1])
+    return "unknown", {"family": "unknown"}, clean_theme_name(parts[-1])
+
+def discover_stories(root_dir):
+    """扫描 root_dir 下所有故事, 每个条目带有实验条件和主题"""
     all_files = []
-    print(f"Scanning '{root_dir}' for story files...")
-    
+    conditions = {}
     # 遍历所有子目录
     for subdir, dirs, files in os.walk(root_dir):
-        # 获取当前文件夹名称（作为主题来源）
-        folder_name = os.path.basename(subdir)
-        
+        dirs.sort()
         # 如果当前是在根目录下，跳过文件扫描（只扫描子文件夹里的文件）
         if subdir == root_dir:
             continue
-
-        current_theme = clean_theme_name(folder_name)
-        
-        for file in files:
+        condition, attributes, theme = describe_folder(root_dir, subdir)
+        for file in sorted(files):
             # 宽松匹配：只要是 txt 且不是系统隐藏文件
             if file.lower().endswith(".txt") and not file.startswith("."):
+                conditions[condition] = attributes
                 all_files.append({
                     "path": os.path.join(subdir, file),
-                    "theme": current_theme,
+                    "theme": theme,
+                    "condition": condition,
                     "filename": file
                 })
+    return all_files, conditions
+
+def interleave_conditions(items):
+    """轮流从各条件中取故事, 中途中断时每个条件都已评估了一部分"""
+    rank = {}
+    ordered = []
+    for item in items:
+        rank[item["condition"]] = rank.get(item["condition"], 0) + 1
+        ordered.append((rank[item["condition"]], item))
+    return [item for _, item in sorted(ordered, key=lambda pair: pair[0])]
+
+def run_evaluation(root_dir=STORIES_ROOT):
+    if not os.path.exists(root_dir):
+        print(f"Directory '{root_dir}' not found. Please check the folder name.")
+        return
+
+    # 1. 扫描所有 txt 文件, 从目录名识别实验条件和主题
+    print(f"Scanning '{root_dir}' for story files...")
+    all_files, conditions = discover_stories(root_dir)
 
     total_files = len(all_files)
-    print(f"Found {total_files} stories to evaluate.")
+    print(f"Found {total_files} stories in {len(conditions)} conditions: {', '.join(conditions)}")
     
     # 简单的调试：打印前3个找到的文件，看看是否正确
     if total_files > 0:
         print("Example files found:")
         for i in range(min(3, total_files)):
             f = all_files[i]
-            print(f"  - [{f['theme']}] {f['filename']}")
+            print(f"  - [{f['condition']} / {f['theme']}] {f['filename']}")
     else:
-        print("No files found! Please check if 'batch_stories_ablation' folder contains .txt files.")
+        print(f"No files found! Please check if '{root_dir}' contains story folders with .txt files.")
         return
 
-    # 2. 多线程评估
-    results = []
-    eval_concurrency = 20 # 提高并发以加快速度
-    
-    print(f"\nStarting evaluation with {eval_concurrency} threads...")
+    # 2. 跳过评分库中已有的故事 (内容未变且模型/提示词版本相同), 中断后重跑即从断点继续
+    store = ScoreStore(SCORE_STORE_PATH)
+    version = prompt_version()
+    scored = store.scored_hashes(EVAL_MODEL, version)
+    for item in all_files:
+        story_content = read_story(item["path"])
+        item["hash"] = story_hash(story_content) if story_content else None
+    pending = interleave_conditions([item for item in all_files if item["hash"] and item["hash"] not in scored])
+    print(f"\n{total_files - len(pending)} stories already scored, {len(pending)} to evaluate "
+          f"(model: {EVAL_MODEL}, prompt: {version}).")
+
+    # 3. 所有条件在同一次异步运行中评估, 并发数自适应 (每个结果立即写入评分库)
+    print(f"\nStarting evaluation with adaptive concurrency ({MIN_CONCURRENCY}-{MAX_CONCURRENCY} in flight)"
+          f"{f', {PACK_SIZE} stories per request' if PACK_SIZE > 1 else ''}...")
     start_time = time.time()
+    failed = asyncio.run(evaluate_all_async(pending, store))
+    if failed:
+        print(f"  [Warning] {len(failed)} stories could not be scored; rerun to retry them.")
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=eval_concurrency) as executor:
-        future_to_file = {
-            executor.submit(evaluate_single_story, item["path"], item["theme"]): item 
-            for item in all_files
-        }
-        
-        completed_count = 0
-        for future in concurrent.futures.as_completed(future_to_file):
-            item = future_to_file[future]
-            completed_count += 1
-            if completed_count % 50 == 0: # 每50个打印一次进度
-                print(f"  Progress: {completed_count}/{total_files}...")
-                
-            scores = future.result()
-            if scores:
-                results.append(scores)
-
-    # 3. 统计结果
-    if not results:
+    # 4. 流式汇总整棵目录中所有已评分的故事 (包括之前运行的结果):
+    #    每个条件以及每个 (条件, 主题) 的均值、方差 (Welford) 和 bootstrap 置信区间
+    aggregates = GroupedStats(BOOTSTRAP_RESAMPLES)
+    total_scored = 0
+    with open("evaluation_per_story.csv", "w", encoding="utf-8", newline="") as f:
+        # csv.writer 负责引号转义: 路径、条件或主题中可能含有逗号
+        writer = csv.writer(f)
+        writer.writerow(["Path", "Condition", "Theme"] + CRITERIA +
+                        [name for c in CRITERIA for name in (f"{c}_Expected", f"{c}_Std")])
+        for item in all_files:
+            record = store.get(item["hash"], EVAL_MODEL, version) if item["hash"] else None
+            if not record:
+                continue
+            total_scored += 1
+            scores = record["scores"]
+            expected = record["expected"] or {}
+            values = {c: scores.get(c, 0) for c in CRITERIA}
+            values["Overall"] = sum(values.values()) / len(CRITERIA)
+            # logprob 模式: 期望分数作为额外指标
+            values.update({f"{c} (expected)": expected[c]["mean"] for c in CRITERIA if c in expected})
+            aggregates.add((item["condition"], item["theme"]), values)
+            writer.writerow([item["path"], item["condition"], item["theme"]] +
+                            [scores.get(c, 0) for c in CRITERIA] +
+                            [value for c in CRITERIA
+                             for value in ((expected[c]["mean"], expected[c]["std"]) if c in expected else ("", ""))])
+    store.close()
+    aggregates.rollup(lambda group: (group[0], "ALL"))
+
+    # 5. 统计结果
+    if not total_scored:
         print("No valid results obtained.")
         return
 
     print("\n" + "="*50)
     print("EVALUATION REPORT")
     print("="*50)
-    print(f"Total Stories Evaluated: {len(results)}")
-    
-    avg_scores = {c: 0.0 for c in CRITERIA}
-    for res in results:
-        for c in CRITERIA:
-            avg_scores[c] += res.get(c, 0)
-    
-    for c in CRITERIA:
-        avg_scores[c] = avg_scores[c] / len(results)
-
-    total_avg = sum(avg_scores.values()) / len(CRITERIA)
-
-    # 4. 输出统计
-    print("\n[Average Scores by Dimension]")
-    for c in CRITERIA:
-        print(f"{c:<15}: {avg_scores[c]:.2f}")
-    
-    print("-" * 30)
-    print(f"{'OVERALL SCORE':<15}: {total_avg:.2f}")
+    print(f"Total Stories Evaluated: {total_scored}")
+    print(f"\n[Average Scores by Condition] (Overall with {CONFIDENCE:.0%} bootstrap CI)")
+    header = f"{'Condition':<24} {'N':>5} " + " ".join(f"{c[:10]:>10}" for c in CRITERIA) + f" {'Overall':>22}"
+    print(header)
+    print("-" * len(header))
+    for condition in conditions:
+        overall = aggregates.get((condition, "ALL"), "Overall")
+        if overall is None:
+            continue
+        low, high = overall.confidence_interval(CONFIDENCE)
+        print(f"{condition:<24} {overall.n:>5} " +
+              " ".join(f"{aggregates.get((condition, 'ALL'), c).mean:>10.2f}" for c in CRITERIA) +
+              f" {overall.mean:>6.2f} [{low:.2f}, {high:.2f}]")
     print("="*50)
     
-    # 保存结果到 CSV
-    with open("evaluation_final.csv", "w", encoding="utf-8") as f:
-        f.write("Dimension,Score\n")
-        for c in CRITERIA:
-            f.write(f"{c},{avg_scores[c]:.2f}\n")
-        f.write(f"Overall,{total_avg:.2f}\n")
+    # 保存结果到 CSV: 每个条件一行
+    with open("evaluation_final.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Condition", "N"] + CRITERIA + ["Overall"])
+        for condition in conditions:
+            overall = aggregates.get((condition, "ALL"), "Overall")
+            if overall is not None:
+                writer.writerow([condition, overall.n] +
+                                [f"{aggregates.get((condition, 'ALL'), c).mean:.2f}" for c in CRITERIA] +
+                                [f"{overall.mean:.2f}"])
+
+    # 整洁长表: 每行一个 (条件, 主题, 指标)
+    with open("evaluation_conditions.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Condition", "Family", "Temperature", "Agents", "Iterations", "Theme", "Metric",
+                         "N", "Mean", "Variance", "Std", "CI_Low", "CI_High"])
+        order = list(conditions)
+        rows = sorted(aggregates.rows(CONFIDENCE), key=lambda row: (order.index(row[0][0]), row[0][1] != "ALL"))
+        for (condition, theme), metric, n, mean, variance, low, high in rows:
+            attributes = conditions[condition]
+            writer.writerow([condition, attributes["family"], attributes.get("temperature", ""),
+                             attributes.get("agents", ""), attributes.get("iterations", ""), theme, metric,
+                             n, f"{mean:.4f}", f"{variance:.4f}", f"{math.sqrt(variance):.4f}", f"{low:.4f}", f"{high:.4f}"])
+    print("Saved evaluation_final.csv, evaluation_per_story.csv and evaluation_conditions.csv")
 
     print(f"Evaluation finished in {time.time() - start_time:.2f} seconds.")
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    # python evaluate.py calibrate [K]: 用 HANNA 参考文件检查打包评估与单篇评估是否一致
+    if len(sys.argv) > 1 and sys.argv[1] == "calibrate":
+        run_packing_calibration(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    else:
+        # python evaluate.py [root]: 默认评估 STORIES_ROOT 下的所有实验条件
+        run_evaluation(sys.argv[1] if len(sys.argv) > 1 else STORIES_ROOT)
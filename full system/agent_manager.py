@@ -1,7 +1,9 @@
 import concurrent.futures
-from openai import OpenAI
-from config import SYSTEM_PROMPT, NUM_AGENTS, NUM_ITERATIONS
-from utils import parse_json_response
+from config import SYSTEM_PROMPT, NUM_AGENTS, NUM_ITERATIONS, AP_MODEL_STRUCTURE
+from llm_client import chat_completion, structured_completion
+from budget import current_budget, submit_in_context
+from tracing import span
+from schemas import AGENTS_SCHEMA, JUDGE_SCHEMA, FINAL_JUDGE_SCHEMA, RECONCILE_SCHEMA
 
 class AgentManager:
     def __init__(self, openai_client):
@@ -19,14 +21,11 @@ You are an overall agent. Your goal is to create {NUM_AGENTS} distinct expert ag
 Output in JSON format:
 {{ "agents": [ {{ "name": "Creative Name", "expertise": "Field of expertise", "personality": "Personality/Tone", "perspective": "Their core belief about the future of {topic}" }} ] }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
-            temperature=1.0,
-            response_format={"type": "json_object"}
+        result = structured_completion(
+            self.client, "persona_hire", AGENTS_SCHEMA,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
         )
-        result = parse_json_response(response.choices[0].message.content)
-        self.agents = result.get("agents", [])[:NUM_AGENTS]
+        self.agents = result["agents"][:NUM_AGENTS] if result is not None else []
 
         if not self.agents:
             print("  [Warning] No agents were generated. Check the API response.")
@@ -57,14 +56,14 @@ Be bold. Be weird.
 
 Output a unique, bold idea (max 50 words). TEXT ONLY.
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
-            temperature=1.2
+        response = chat_completion(
+            self.client, "proposal",
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
         )
         return response.choices[0].message.content.strip()
 
-    def _judge_proposals(self, proposals: list, element_type: str, topic: str) -> dict:
+    def _judge_proposals(self, proposals: list, element_type: str, topic: str):
+        """The judge's pick as a dict, or None if its reply was unusable after repairs."""
         proposals_text = "\n".join([
             f"Proposal {i+1} ({p['agent']}): {p['content']}"
             for i, p in enumerate(proposals)
@@ -81,15 +80,13 @@ Here are proposals from different experts:
 Output JSON:
 {{ "selected_agent": "Name", "selected_content": "Content", "reason": "Reason for selection" }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
-            temperature=0,
-            response_format={"type": "json_object"}
+        return structured_completion(
+            self.client, "judge", JUDGE_SCHEMA,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
         )
-        return parse_json_response(response.choices[0].message.content)
 
-    def _final_judge(self, iteration_results: list, element_type: str, topic: str) -> dict:
+    def _final_judge(self, iteration_results: list, element_type: str, topic: str):
+        """Best content across iterations, or None if the final judge's reply was unusable after repairs."""
         candidates_summary = "".join([
             f"Iteration {r['iteration']}: {r['judgment']['selected_content']} (Reason: {r['judgment']['reason']})\n"
             for r in iteration_results
@@ -104,51 +101,96 @@ Choose the absolute best final content for this element.
 Output JSON:
 {{ "final_content": "The final refined content text", "reason": "Final justification" }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
-            temperature=0,
-            response_format={"type": "json_object"}
+        return structured_completion(
+            self.client, "final_judge", FINAL_JUDGE_SCHEMA,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
         )
-        return parse_json_response(response.choices[0].message.content)
-
-    def run_multi_agent_generation(self, element_type: str, element_desc: str, topic: str, full_context_str: str) -> str:
-        """Run NUM_ITERATIONS rounds of parallel brainstorming, then select the best result."""
-        print(f"  > Generating '{element_type}'...")
-        iteration_results = []
-        agent_history = {agent['name']: [] for agent in self.agents}
-
-        for i in range(1, NUM_ITERATIONS + 1):
-            # All agents brainstorm in parallel
-            proposals = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_AGENTS) as executor:
-                future_to_agent = {
-                    executor.submit(
-                        self._agent_think,
-                        agent,
-                        f"{element_type} ({element_desc})",
-                        full_context_str,
-                        agent_history[agent['name']]
-                    ): agent
-                    for agent in self.agents
-                }
-                for future in concurrent.futures.as_completed(future_to_agent):
-                    agent = future_to_agent[future]
-                    try:
-                        content = future.result()
-                        proposals.append({"agent": agent['name'], "content": content})
-                        agent_history[agent['name']].append(content)
-                    except Exception as e:
-                        print(f"    Agent {agent['name']} failed: {e}")
-
-            if not proposals:
-                continue
-
-            # Judge picks the best proposal from this round
-            judgment = self._judge_proposals(proposals, element_type, topic)
-            iteration_results.append({"iteration": i, "judgment": judgment})
-
-        # Final judge selects the best result across all iterations
-        final_result = self._final_judge(iteration_results, element_type, topic)
-        print(f"    -> Final Decision: {final_result.get('final_content', '')[:50]}...")
-        return final_result.get("final_content")
+
+    def reconcile_objects(self, drafts: dict, topic: str):
+        """Edit independently drafted objects into one mutually consistent set; None if the reply was unusable."""
+        drafts_text = "\n".join([f"- {name}: {content}" for name, content in drafts.items()])
+
+        prompt = f"""
+Topic: {topic}
+The six Objects of the Future AP Model below were drafted independently, without seeing each other.
+
+{drafts_text}
+
+You are the Chief Editor. Reconcile them into ONE coherent future society:
+remove contradictions, align names, actors and technologies across objects, and make the causal links implied by the AP Model plausible.
+Keep each object's boldest idea and keep each one concise (max 60 words).
+
+Output JSON with exactly these keys:
+{{ {", ".join(f'"{name}": "Reconciled content"' for name in AP_MODEL_STRUCTURE["objects"])} }}
+"""
+        return structured_completion(
+            self.client, "reconcile", RECONCILE_SCHEMA,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+        )
+
+    def run_multi_agent_generation(self, element_type: str, element_desc: str, topic: str, full_context_str: str) -> str | None:
+        """Run NUM_ITERATIONS rounds of parallel brainstorming, then select the best result.
+
+        Rounds whose judgment is unusable are left out; returns None if no round produced one.
+        """
+        with span(element_type, "element"):
+            print(f"  > Generating '{element_type}'...")
+            iteration_results = []
+            agent_history = {agent['name']: [] for agent in self.agents}
+
+            budget = current_budget()
+            for i in range(1, NUM_ITERATIONS + 1):
+                agents = self.agents
+                if budget and budget.near_limit():
+                    if iteration_results:
+                        budget.degrade("fewer_iterations")
+                        break
+                    if budget.exhausted():
+                        budget.degrade("single_agent")
+                        agents = self.agents[:1]
+
+                # All agents brainstorm in parallel
+                with span(f"round {i}", "round"):
+                    proposals = []
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_AGENTS) as executor:
+                        future_to_agent = {
+                            submit_in_context(
+                                executor,
+                                self._agent_think,
+                                agent,
+                                f"{element_type} ({element_desc})",
+                                full_context_str,
+                                agent_history[agent['name']]
+                            ): agent
+                            for agent in agents
+                        }
+                        for future in concurrent.futures.as_completed(future_to_agent):
+                            agent = future_to_agent[future]
+                            try:
+                                content = future.result()
+                                proposals.append({"agent": agent['name'], "content": content})
+                                agent_history[agent['name']].append(content)
+                            except Exception as e:
+                                print(f"    Agent {agent['name']} failed: {e}")
+
+                    # Judge picks the best proposal from this round
+                    if proposals:
+                        judgment = self._judge_proposals(proposals, element_type, topic)
+                        if judgment is None:
+                            print(f"    [Warning] Round {i} judgment for '{element_type}' was unusable; round skipped.")
+                        else:
+                            iteration_results.append({"iteration": i, "judgment": judgment})
+
+            if not iteration_results:
+                print(f"    [Warning] No usable judgment for '{element_type}'.")
+                return None
+
+            # Final judge selects the best result across all iterations
+            final_result = self._final_judge(iteration_results, element_type, topic)
+            if final_result is None:
+                # Fall back to the latest round's winner rather than losing the element
+                final_content = iteration_results[-1]["judgment"]["selected_content"]
+            else:
+                final_content = final_result["final_content"]
+            print(f"    -> Final Decision: {final_content[:50]}...")
+            return final_content
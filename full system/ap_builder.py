@@ -1,61 +1,231 @@
+import copy
 import json
-from config import AP_MODEL_STRUCTURE
+import time
+import concurrent.futures
+from config import AP_MODEL_STRUCTURE, OBJECT_STRATEGY, SEARCH_MAX_WORKERS, GROUNDING_MAX_WAIT
 from agent_manager import AgentManager
+from telemetry import current_telemetry
+from budget import current_budget, submit_in_context
+from tracing import span
 
 class APBuilder:
-    def __init__(self, openai_client):
+    _ERA = "Future (Maturity/Transformation Period)"
+
+    def __init__(self, openai_client, object_strategy: str = OBJECT_STRATEGY, search_service=None):
         self.client = openai_client
         self.agent_manager = AgentManager(openai_client)
+        self.object_strategy = object_strategy
+        # With a SearchService, arrows are grounded in web search results gathered in the background
+        self.search_service = search_service
+        self._grounding = {}  # arrow name -> Future of its search synthesis
 
     def generate_future_stage_multi_agent(self, tech_topic: str) -> dict:
         """Build the 18-element AP model (6 objects + 12 arrows) for the given topic set in the future."""
-        print(f"\n--- Generating Stage 3 (Future) with Multi-Agents ---")
-
-        self.agent_manager.generate_agents(tech_topic)
+        with span("ap_model", theme=tech_topic):
+            print(f"\n--- Generating Stage 3 (Future) with Multi-Agents ---")
+            grounding_pool = self._start_grounding(tech_topic)
+            try:
+                with span("generate_agents"):
+                    self.agent_manager.generate_agents(tech_topic)
 
-        model = {
-            "stage": "Stage 3",
-            "era": "Future (Maturity Period)",
-            "nodes": {},
-            "arrows": []
-        }
-        base_context = f"## Theme: {tech_topic}\n## Era: Future (Maturity/Transformation Period)\n"
+                model = {
+                    "stage": "Stage 3",
+                    "era": "Future (Maturity Period)",
+                    "nodes": {},
+                    "arrows": []
+                }
+                base_context = f"## Theme: {tech_topic}\n## Era: {self._ERA}\n"
 
-        self._generate_objects(model, tech_topic, base_context)
-        self._generate_arrows(model, tech_topic, base_context)
+                with span("objects", strategy=self.object_strategy):
+                    start = time.perf_counter()
+                    if self.object_strategy == "parallel":
+                        self._generate_objects_parallel(model, tech_topic, base_context)
+                    else:
+                        self._generate_objects(model, tech_topic, base_context)
+                    current_telemetry().record_latency(f"phase.objects.{self.object_strategy}", time.perf_counter() - start)
+                with span("arrows"):
+                    self._generate_arrows(model, tech_topic, base_context)
+            finally:
+                # Also on failure, so an aborted build neither leaks the pool nor leaves its findings to the next build
+                if grounding_pool:
+                    # Searches still running past their deadline are abandoned
+                    grounding_pool.shutdown(wait=False, cancel_futures=True)
+                self._grounding = {}
 
         return model
 
+    def _start_grounding(self, tech_topic: str):
+        """Kick off the 12 arrow searches so they overlap agent hiring and object brainstorming."""
+        if self.search_service is None:
+            return None
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS + 1)
+        self._grounding = self.search_service.submit_grounding(pool, tech_topic, self._ERA)
+        return pool
+
+    def _grounding_context(self, arrow_name: str) -> str:
+        """Findings that have arrived so far, waiting up to GROUNDING_MAX_WAIT for this arrow's own."""
+        if not self._grounding:
+            return ""
+        own = self._grounding.get(arrow_name)
+        if own is not None:
+            concurrent.futures.wait([own], timeout=GROUNDING_MAX_WAIT)
+            current_telemetry().incr("grounding.on_time" if own.done() else "grounding.missed_deadline")
+        lines = []
+        for name, future in self._grounding.items():
+            if not future.done() or future.cancelled() or future.exception():
+                continue
+            finding = future.result()
+            if finding and finding.get("definition"):
+                lines.append(f"- {name}: {finding['definition']} (Example: {finding.get('example', '')})")
+        if not lines:
+            return ""
+        return "\n## Real-world Findings (from web search):\n" + "\n".join(lines) + "\n"
+
     def _snapshot_context(self, base_context: str, model: dict) -> str:
         """Append the model built so far to the base context string."""
+        budget = current_budget()
+        if budget and budget.near_limit():
+            budget.degrade("compact_context")
+            return base_context + f"\n## Stage 3 (Generated so far):\n{json.dumps(model, separators=(',', ':'), ensure_ascii=False)}"
         return base_context + f"\n## Stage 3 (Generated so far):\n{json.dumps(model, indent=2, ensure_ascii=False)}"
 
+    def _generate_object(self, model: dict, obj_name: str, topic: str, base_context: str):
+        context = self._snapshot_context(base_context, model)
+        model["nodes"][obj_name] = self.agent_manager.run_multi_agent_generation(
+            element_type=f"Object: {obj_name}",
+            element_desc="",
+            topic=topic,
+            full_context_str=context
+        )
+
+    def _generate_arrow(self, model: dict, arrow_name: str, topic: str, base_context: str) -> dict:
+        info = AP_MODEL_STRUCTURE["arrows"][arrow_name]
+        context = self._snapshot_context(base_context, model) + self._grounding_context(arrow_name)
+        content = self.agent_manager.run_multi_agent_generation(
+            element_type=f"Arrow: {arrow_name}",
+            element_desc=f"From '{info['from']}' to '{info['to']}'",
+            topic=topic,
+            full_context_str=context
+        )
+        return {
+            "source": info["from"],
+            "target": info["to"],
+            "type": arrow_name,
+            "definition": content,
+            "example": "Future Concept"
+        }
+
     def _generate_objects(self, model: dict, topic: str, base_context: str):
         print("\n[Phase 1] Generating Objects...")
         for obj_name in AP_MODEL_STRUCTURE["objects"]:
-            context = self._snapshot_context(base_context, model)
-            content = self.agent_manager.run_multi_agent_generation(
-                element_type=f"Object: {obj_name}",
-                element_desc="",
-                topic=topic,
-                full_context_str=context
-            )
-            model["nodes"][obj_name] = content
+            self._generate_object(model, obj_name, topic, base_context)
+
+    def _generate_objects_parallel(self, model: dict, topic: str, base_context: str):
+        """Brainstorm all six objects concurrently from the theme alone, then reconcile them in one call."""
+        print("\n[Phase 1] Generating Objects in parallel...")
+        drafts = {}
+        objects = AP_MODEL_STRUCTURE["objects"]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(objects)) as executor:
+            future_to_obj = {
+                submit_in_context(
+                    executor,
+                    self.agent_manager.run_multi_agent_generation,
+                    element_type=f"Object: {obj_name}",
+                    element_desc="",
+                    topic=topic,
+                    full_context_str=self._snapshot_context(base_context, model)
+                ): obj_name
+                for obj_name in objects
+            }
+            for future in concurrent.futures.as_completed(future_to_obj):
+                drafts[future_to_obj[future]] = future.result()
+
+        reconciled = self.agent_manager.reconcile_objects(drafts, topic)
+        if reconciled is None:
+            print("  [Warning] Reconciliation reply was unusable; keeping the independent drafts.")
+            reconciled = {}
+        for obj_name in objects:
+            model["nodes"][obj_name] = reconciled.get(obj_name) or drafts[obj_name]
 
     def _generate_arrows(self, model: dict, topic: str, base_context: str):
         print("\n[Phase 2] Generating Arrows...")
+        for arrow_name in AP_MODEL_STRUCTURE["arrows"]:
+            model["arrows"].append(self._generate_arrow(model, arrow_name, topic, base_context))
+
+    # ------------------------------------------------------------------ #
+    #  Incremental rebuild                                                #
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def affected_elements(invalidated) -> set:
+        """Invalidated elements plus every arrow whose source or target object is invalidated.
+
+        One hop only: no other object is added, since objects do not depend on arrows.
+        """
+        unknown = set(invalidated) - set(AP_MODEL_STRUCTURE["objects"]) - set(AP_MODEL_STRUCTURE["arrows"])
+        if unknown:
+            raise ValueError(f"Unknown AP elements: {sorted(unknown)}")
+        affected = set(invalidated)
         for arrow_name, info in AP_MODEL_STRUCTURE["arrows"].items():
-            context = self._snapshot_context(base_context, model)
-            content = self.agent_manager.run_multi_agent_generation(
-                element_type=f"Arrow: {arrow_name}",
-                element_desc=f"From '{info['from']}' to '{info['to']}'",
-                topic=topic,
-                full_context_str=context
-            )
-            model["arrows"].append({
-                "source": info["from"],
-                "target": info["to"],
-                "type": arrow_name,
-                "definition": content,
-                "example": "Future Concept"
-            })
+            if info["from"] in affected or info["to"] in affected:
+                affected.add(arrow_name)
+        return affected
+
+    def rebuild_elements(self, model: dict, tech_topic: str, invalidated, agents: list = None):
+        """Regenerate the invalidated elements of an existing model and the arrows that depend on them.
+
+        Everything else is reused as-is. Propagation is one hop (see
+        affected_elements): the arrows of an invalidated object are redone,
+        but objects generated after it in a full run are not, although they
+        saw it as context. The context also differs from a full run: a
+        regenerated element sees every reused element, including those that
+        come after it in canonical order, and objects are drafted one at a
+        time without search grounding, whatever the object strategy.
+
+        Pass the original `agents` to keep the same personas for this call
+        only; otherwise the builder's current personas are used, or a new set
+        is hired if it has none. Returns (new_model, report).
+        """
+        affected = self.affected_elements(invalidated)
+        new_model = copy.deepcopy(model)
+        print(f"\n--- Rebuilding {len(affected)} of 18 AP elements for {tech_topic} ---")
+
+        previous_agents = self.agent_manager.agents
+        if agents:
+            self.agent_manager.agents = list(agents)
+        elif not self.agent_manager.agents:
+            with span("generate_agents"):
+                self.agent_manager.generate_agents(tech_topic)
+        try:
+            report = self._rebuild(new_model, tech_topic, affected)
+        finally:
+            if agents:
+                self.agent_manager.agents = previous_agents
+        return new_model, report
+
+    def _rebuild(self, new_model: dict, tech_topic: str, affected: set) -> dict:
+        """Regenerate the `affected` elements of `new_model` in place; returns the reused/recomputed report."""
+
+        base_context = f"## Theme: {tech_topic}\n## Era: {self._ERA}\n"
+        # Drop stale content first so it cannot leak into the context of regenerated elements
+        for obj_name in AP_MODEL_STRUCTURE["objects"]:
+            if obj_name in affected:
+                new_model["nodes"].pop(obj_name, None)
+        new_model["arrows"] = [a for a in new_model["arrows"] if a["type"] not in affected]
+
+        for obj_name in AP_MODEL_STRUCTURE["objects"]:
+            if obj_name in affected:
+                self._generate_object(new_model, obj_name, tech_topic, base_context)
+        # Keep nodes and arrows in the canonical AP_MODEL_STRUCTURE order
+        new_model["nodes"] = {k: new_model["nodes"][k] for k in AP_MODEL_STRUCTURE["objects"] if k in new_model["nodes"]}
+
+        kept_arrows = {a["type"]: a for a in new_model["arrows"]}
+        for arrow_name in AP_MODEL_STRUCTURE["arrows"]:
+            if arrow_name in affected:
+                kept_arrows[arrow_name] = self._generate_arrow(new_model, arrow_name, tech_topic, base_context)
+                new_model["arrows"] = [kept_arrows[n] for n in AP_MODEL_STRUCTURE["arrows"] if n in kept_arrows]
+
+        recomputed = [e for e in AP_MODEL_STRUCTURE["objects"] + list(AP_MODEL_STRUCTURE["arrows"]) if e in affected]
+        reused = [e for e in AP_MODEL_STRUCTURE["objects"] + list(AP_MODEL_STRUCTURE["arrows"]) if e not in affected]
+        print(f"  > Reused {len(reused)} element generations, recomputed {len(recomputed)}.")
+        return {"recomputed": recomputed, "reused": reused}
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from config import SYSTEM_PROMPT, AP_DIGEST_SUMMARIZE, AP_DIGEST_TOKEN_BUDGETS
+from llm_client import chat_completion
+from utils import content_hash
+
+_CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting prompt sections
+
+_CACHE_SIZE = 256
+_cache = OrderedDict()  # content hash -> APDigest
+_cache_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def _compact_lines(ap_data: dict) -> list:
+    """One line per AP element, dropping JSON indentation and placeholder fields."""
+    lines = [f"Stage: {ap_data.get('stage', 'Stage 3')} | Era: {ap_data.get('era', 'Future')}", "Objects:"]
+    for name, content in ap_data.get("nodes", {}).items():
+        lines.append(f"- {name}: {content}")
+    lines.append("Arrows:")
+    for arrow in ap_data.get("arrows", []):
+        lines.append(f"- {arrow['type']} ({arrow['source']} -> {arrow['target']}): {arrow['definition']}")
+    return lines
+
+
+def _truncate_to_budget(lines: list, max_tokens: int) -> str:
+    """Shorten every element evenly so the whole digest fits in max_tokens."""
+    text = "\n".join(lines)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    per_line_chars = max(40, (max_tokens * _CHARS_PER_TOKEN) // max(1, len(lines)))
+    return "\n".join(l if len(l) <= per_line_chars else l[:per_line_chars - 3] + "..." for l in lines)
+
+
+class APDigest:
+    """Compact, hashed view of one AP model, serialised once and shared by every Overseer call."""
+
+    def __init__(self, ap_data: dict, summary: str = None):
+        self.lines = _compact_lines(ap_data)
+        self.text = "\n".join(self.lines)
+        self.content_hash = content_hash(ap_data)
+        self.summary = summary
+
+    def for_role(self, role: str) -> str:
+        """Digest text for a prompt, kept within that role's token budget."""
+        budget = AP_DIGEST_TOKEN_BUDGETS.get(role)
+        if budget is None or estimate_tokens(self.text) <= budget:
+            return self.text
+        if self.summary and estimate_tokens(self.summary) <= budget:
+            return self.summary
+        return _truncate_to_budget(self.lines, budget)
+
+
+def _summarize(client, digest: APDigest) -> str:
+    prompt = f"""
+Condense the following Future AP Model into a dense reference sheet for an editor.
+Keep every one of the 18 elements (6 objects and 12 arrows) with its name, and preserve concrete names, numbers and causal links.
+Output plain text, one line per element.
+
+{digest.text}
+"""
+    response = chat_completion(
+        client, "digest",
+        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content.strip()
+
+
+def build_ap_digest(ap_data: dict, client=None) -> APDigest:
+    """Build (or reuse) the digest for an AP model. Digests are cached by content hash."""
+    digest = APDigest(ap_data)
+    with _cache_lock:
+        cached = _cache.get(digest.content_hash)
+    if cached:
+        return cached
+
+    over_budget = any(estimate_tokens(digest.text) > b for b in AP_DIGEST_TOKEN_BUDGETS.values())
+    if AP_DIGEST_SUMMARIZE and client is not None and over_budget:
+        digest.summary = _summarize(client, digest)
+    with _cache_lock:
+        digest = _cache.setdefault(digest.content_hash, digest)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return digest
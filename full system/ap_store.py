@@ -0,0 +1,137 @@
+import json
+import sqlite3
+import threading
+import time
+from config import AP_STORE_PATH
+from utils import content_hash
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ap_models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    theme TEXT NOT NULL,
+    num_agents INTEGER,
+    num_iterations INTEGER,
+    personas TEXT,               -- JSON list of the agents that built the model
+    model TEXT NOT NULL,         -- JSON Stage 3 model
+    content_hash TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ap_elements (
+    model_id INTEGER NOT NULL REFERENCES ap_models(id),
+    kind TEXT NOT NULL,          -- 'object' or 'arrow'
+    element TEXT NOT NULL,
+    content TEXT,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (model_id, element)
+);
+CREATE INDEX IF NOT EXISTS idx_models_theme ON ap_models(theme);
+CREATE INDEX IF NOT EXISTS idx_elements_element ON ap_elements(element);
+CREATE INDEX IF NOT EXISTS idx_elements_hash ON ap_elements(content_hash);
+"""
+
+
+def _row_to_record(row) -> dict:
+    return {
+        "id": row["id"],
+        "theme": row["theme"],
+        "num_agents": row["num_agents"],
+        "num_iterations": row["num_iterations"],
+        "personas": json.loads(row["personas"] or "[]"),
+        "model": json.loads(row["model"]),
+        "content_hash": row["content_hash"],
+        "created_at": row["created_at"],
+    }
+
+
+class APModelStore:
+    """SQLite repository of generated Stage 3 AP models, queryable by theme, element and content hash."""
+
+    def __init__(self, path: str = AP_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def save(self, theme: str, model: dict, personas: list = None, num_agents: int = None, num_iterations: int = None) -> int:
+        """Store a model and its elements; returns the model id. Identical models are stored once."""
+        model_hash = content_hash(model)
+        with self._lock, self._conn:
+            existing = self._conn.execute("SELECT id FROM ap_models WHERE content_hash = ?", (model_hash,)).fetchone()
+            if existing:
+                return existing["id"]
+            cursor = self._conn.execute(
+                "INSERT INTO ap_models (theme, num_agents, num_iterations, personas, model, content_hash, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (theme, num_agents, num_iterations, json.dumps(personas or [], ensure_ascii=False),
+                 json.dumps(model, ensure_ascii=False), model_hash, time.time())
+            )
+            model_id = cursor.lastrowid
+            elements = [("object", name, content) for name, content in model.get("nodes", {}).items()]
+            elements += [("arrow", a["type"], a.get("definition")) for a in model.get("arrows", [])]
+            self._conn.executemany(
+                "INSERT INTO ap_elements (model_id, kind, element, content, content_hash) VALUES (?, ?, ?, ?, ?)",
+                [(model_id, kind, name, content, content_hash(content)) for kind, name, content in elements]
+            )
+        return model_id
+
+    def get(self, model_id: int):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM ap_models WHERE id = ?", (model_id,)).fetchone()
+        return _row_to_record(row) if row else None
+
+    def find_by_hash(self, model_hash: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM ap_models WHERE content_hash = ?", (model_hash,)).fetchone()
+        return _row_to_record(row) if row else None
+
+    def find_by_theme(self, theme: str, num_agents: int = None, num_iterations: int = None, limit: int = None) -> list:
+        query = "SELECT * FROM ap_models WHERE theme = ?"
+        params = [theme]
+        if num_agents is not None:
+            query += " AND num_agents = ?"
+            params.append(num_agents)
+        if num_iterations is not None:
+            query += " AND num_iterations = ?"
+            params.append(num_iterations)
+        query += " ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [_row_to_record(r) for r in rows]
+
+    def find_by_element(self, element: str, theme: str = None, contains: str = None) -> list:
+        """Return {model_id, theme, element, content} rows for one AP element across stored models."""
+        query = ("SELECT e.model_id, m.theme, e.element, e.content FROM ap_elements e "
+                 "JOIN ap_models m ON m.id = e.model_id WHERE e.element = ?")
+        params = [element]
+        if theme is not None:
+            query += " AND m.theme = ?"
+            params.append(theme)
+        if contains is not None:
+            query += " AND e.content LIKE ?"
+            params.append(f"%{contains}%")
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY e.model_id", params).fetchall()
+        return [dict(r) for r in rows]
+
+    def find_by_element_hash(self, element_hash: str) -> list:
+        """Models that contain an element with exactly this content."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model_id, element FROM ap_elements WHERE content_hash = ?", (element_hash,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def themes(self) -> dict:
+        """Number of stored models per theme."""
+        with self._lock:
+            rows = self._conn.execute("SELECT theme, COUNT(*) AS n FROM ap_models GROUP BY theme").fetchall()
+        return {r["theme"]: r["n"] for r in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,37 +1,136 @@
 import os
+import json
+import threading
 import traceback
 import concurrent.futures
 from openai import OpenAI
-from config import OPENAI_API_KEY, NUM_AGENTS, NUM_ITERATIONS, MAX_CONCURRENT_STORIES
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, TAVILY_API_KEY, GROUNDING_ENABLED, NUM_AGENTS, NUM_ITERATIONS, MAX_CONCURRENT_STORIES,
+    PIPELINE_MODE, AP_STAGE_WORKERS, STORY_STAGE_WORKERS, PIPELINE_QUEUE_SIZE,
+    FANOUT_MODELS_PER_THEME, FANOUT_STORIES_PER_MODEL, AP_STORE_PATH,
+    STORY_TOKEN_BUDGET, STORY_CALL_BUDGET, STORY_TIME_BUDGET,
+    BATCH_TOKEN_BUDGET, BATCH_CALL_BUDGET, BATCH_TIME_BUDGET, TRACE_STORIES,
+)
 from ap_builder import APBuilder
 from story_generator import StoryGenerator
+from telemetry import TELEMETRY
+from review_policy import ReviewPolicy
+from pipeline import run_two_stage
+from ap_digest import build_ap_digest
+from ap_store import APModelStore
+from budget import Budget, use_budget
+from tracing import Tracer, use_tracer
+from utils import content_hash
 
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not found in config.py")
 
 # The OpenAI client is thread-safe, so a single shared instance is fine here
-global_client = OpenAI(api_key=OPENAI_API_KEY)
+global_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
-def process_single_story(theme, index, output_dir):
-    try:
-        print(f"  [Story {index} | START] Processing {theme}...")
+# Shared by every story so the Overseer acceptance rate is learned across the batch
+review_policy = ReviewPolicy()
+
+# One search service for the whole batch, so its cache and rate limit are shared by every story
+if GROUNDING_ENABLED:
+    from search_service import SearchService
+    search_service = SearchService(OPENAI_API_KEY, TAVILY_API_KEY)
+else:
+    search_service = None
+
+# Every AP model is kept so the story stage can be re-run without regenerating it
+ap_store = APModelStore(AP_STORE_PATH)
+
+# Story budgets draw from the batch budget, so expensive stories degrade instead of starving the rest
+batch_budget = Budget(BATCH_TOKEN_BUDGET, BATCH_CALL_BUDGET, BATCH_TIME_BUDGET)
+budget_records = {}  # output_dir -> [per-story budget summary]
+budget_lock = threading.Lock()
+
+# Every story is linked to the stored AP model (id and content hash) it was written from
+provenance_records = {}  # output_dir -> [per-story provenance]
+provenance_lock = threading.Lock()
+
+def new_story_budget():
+    return Budget(STORY_TOKEN_BUDGET, STORY_CALL_BUDGET, STORY_TIME_BUDGET, parent=batch_budget)
+
+def new_model_budget():
+    """Budget for an AP model shared by several stories: no per-story limits, but charged to the batch."""
+    return Budget(parent=batch_budget)
 
-        # Each story needs its own APBuilder and StoryGenerator instances
-        # because AgentManager stores per-run agent state internally
-        local_builder = APBuilder(global_client)
-        local_gen = StoryGenerator(global_client)
+def record_budget(output_dir, filename, budget):
+    with budget_lock:
+        budget_records.setdefault(output_dir, []).append({"story_file": filename, **budget.summary()})
 
+def save_budget_records():
+    for output_dir, records in budget_records.items():
+        with open(os.path.join(output_dir, "budget_report.json"), "w", encoding='utf-8') as f:
+            json.dump(sorted(records, key=lambda r: r["story_file"]), f, indent=2)
+    degraded = sum(1 for records in budget_records.values() for r in records if r["degradations"])
+    total = sum(len(records) for records in budget_records.values())
+    print(f"[Budget] batch used {batch_budget.tokens:,} tokens in {batch_budget.calls:,} calls; "
+          f"{degraded}/{total} stories degraded")
+
+def record_provenance(output_dir, filename, stage3_model, model_id, **extra):
+    with provenance_lock:
+        provenance_records.setdefault(output_dir, []).append({
+            "story_file": filename,
+            **extra,
+            "ap_model_id": model_id,
+            "ap_model_hash": content_hash(stage3_model),
+        })
+
+def save_provenance_records():
+    for output_dir, records in provenance_records.items():
+        with open(os.path.join(output_dir, "provenance.json"), "w", encoding='utf-8') as f:
+            json.dump(sorted(records, key=lambda r: r["story_file"]), f, indent=2, ensure_ascii=False)
+
+def story_name(theme, index):
+    return f"{theme.replace(' ', '_')}_story_{index:02d}"
+
+def new_tracer(name):
+    """Per-story span recorder, or None when TRACE_STORIES is off."""
+    return Tracer(name) if TRACE_STORIES else None
+
+def save_trace(tracer, output_dir):
+    if tracer is not None:
+        tracer.save(os.path.join(output_dir, "traces"))
+
+def build_ap_model(theme, budget=None, tracer=None):
+    """Build a Stage 3 model and persist it; returns (model, store id)."""
+    # Each story needs its own APBuilder instance because AgentManager
+    # stores per-run agent state internally
+    local_builder = APBuilder(global_client, search_service=search_service)
+    with use_budget(budget), use_tracer(tracer):
         stage3_model = local_builder.generate_future_stage_multi_agent(tech_topic=theme)
-        all_stages_data = {"Stage 3": stage3_model}
+    model_id = ap_store.save(theme, stage3_model, local_builder.agent_manager.agents, NUM_AGENTS, NUM_ITERATIONS)
+    return stage3_model, model_id
 
-        final_outline = local_gen.generate_outline(all_stages_data)
+def write_story(theme, index, output_dir, stage3_model, model_id, ap_digest=None, budget=None, tracer=None,
+                **provenance):
+    local_gen = StoryGenerator(global_client, review_policy)
+    budget = budget or new_story_budget()
+    tracer = tracer or new_tracer(story_name(theme, index))
+    with use_budget(budget), use_tracer(tracer):
+        final_outline = local_gen.generate_outline({"Stage 3": stage3_model}, ap_digest)
 
-        filename = f"{theme.replace(' ', '_')}_story_{index:02d}.txt"
-        filepath = os.path.join(output_dir, filename)
-        with open(filepath, "w", encoding='utf-8') as f:
-            f.write(final_outline)
+    filename = f"{story_name(theme, index)}.txt"
+    filepath = os.path.join(output_dir, filename)
+    with open(filepath, "w", encoding='utf-8') as f:
+        f.write(final_outline)
 
-        print(f"  [Story {index} | DONE] Saved to {filename}")
+    record_budget(output_dir, filename, budget)
+    record_provenance(output_dir, filename, stage3_model, model_id, **provenance)
+    save_trace(tracer, output_dir)
+    print(f"  [Story {index} | DONE] Saved to {filename}")
+    return filename
+
+def process_single_story(theme, index, output_dir):
+    try:
+        print(f"  [Story {index} | START] Processing {theme}...")
+        budget = new_story_budget()
+        tracer = new_tracer(story_name(theme, index))
+        stage3_model, model_id = build_ap_model(theme, budget, tracer)
+        write_story(theme, index, output_dir, stage3_model, model_id, budget=budget, tracer=tracer)
         return True, index
 
     except Exception as e:
@@ -39,34 +138,137 @@ def process_single_story(theme, index, output_dir):
         traceback.print_exc()
         return False, index
 
+def run_staged_generation(jobs):
+    """AP-model workers feed finished models through a bounded queue to story workers."""
+    def produce(job):
+        theme, index, _ = job
+        print(f"  [Story {index} | AP STAGE] Building AP model for {theme}...")
+        budget = new_story_budget()
+        tracer = new_tracer(story_name(theme, index))
+        stage3_model, model_id = build_ap_model(theme, budget, tracer)
+        return stage3_model, model_id, budget, tracer
+
+    def consume(job, built):
+        theme, index, output_dir = job
+        stage3_model, model_id, budget, tracer = built
+        print(f"  [Story {index} | STORY STAGE] Writing story for {theme}...")
+        # Time spent waiting in the queue is not the story's: its wall-time limit starts here
+        budget.restart_clock()
+        write_story(theme, index, output_dir, stage3_model, model_id, budget=budget, tracer=tracer)
+
+    stats = run_two_stage(jobs, produce, consume, AP_STAGE_WORKERS, STORY_STAGE_WORKERS, PIPELINE_QUEUE_SIZE)
+    print(stats.report())
+
+def run_fanout_generation(themes):
+    """Build FANOUT_MODELS_PER_THEME AP models per theme and write FANOUT_STORIES_PER_MODEL stories from each.
+
+    Every model is saved next to its stories, and its file is added to each
+    story's provenance record.
+    """
+    output_dirs = {}
+    for theme in themes:
+        folder_name = f"{theme.replace(' ', '_')}_A{NUM_AGENTS}_I{NUM_ITERATIONS}"
+        output_dirs[theme] = os.path.join("batch_stories_fanout", folder_name)
+        os.makedirs(os.path.join(output_dirs[theme], "ap_models"), exist_ok=True)
+
+    def model_job(theme, k):
+        tracer = new_tracer(f"{theme.replace(' ', '_')}_ap_model_{k:02d}")
+        budget = new_model_budget()
+        stage3_model, model_id = build_ap_model(theme, budget, tracer)
+        # One digest per model, shared by all of its stories
+        with use_budget(budget), use_tracer(tracer):
+            ap_digest = build_ap_digest(stage3_model, global_client)
+        save_trace(tracer, output_dirs[theme])
+        return stage3_model, model_id, ap_digest
+
+    def story_job(theme, index, model_file, model_id, stage3_model, ap_digest):
+        write_story(theme, index, output_dirs[theme], stage3_model, model_id, ap_digest, ap_model_file=model_file)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=AP_STAGE_WORKERS) as ap_pool, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=STORY_STAGE_WORKERS) as story_pool:
+        model_futures = {
+            ap_pool.submit(model_job, theme, k): (theme, k)
+            for theme in themes
+            for k in range(1, FANOUT_MODELS_PER_THEME + 1)
+        }
+        story_futures = []
+        for future in concurrent.futures.as_completed(model_futures):
+            theme, k = model_futures[future]
+            try:
+                stage3_model, model_id, ap_digest = future.result()
+            except Exception as e:
+                print(f"  [AP Model {theme} #{k} | ERROR] Failed: {e}")
+                traceback.print_exc()
+                continue
+
+            model_file = os.path.join("ap_models", f"{theme.replace(' ', '_')}_ap_model_{k:02d}.json")
+            with open(os.path.join(output_dirs[theme], model_file), "w", encoding='utf-8') as f:
+                json.dump({"Stage 3": stage3_model}, f, indent=2, ensure_ascii=False)
+
+            print(f"  [AP Model {theme} #{k} | DONE] Fanning out to {FANOUT_STORIES_PER_MODEL} stories...")
+            for m in range(FANOUT_STORIES_PER_MODEL):
+                index = (k - 1) * FANOUT_STORIES_PER_MODEL + m + 1
+                story_futures.append(story_pool.submit(story_job, theme, index, model_file, model_id, stage3_model, ap_digest))
+
+        for future in concurrent.futures.as_completed(story_futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"  [Story | ERROR] Failed: {e}")
+                traceback.print_exc()
+
 def run_batch_generation():
     themes = ["Grocery", "Password", "Soccer", "Smartphone"]
     stories_per_theme = 100
 
     print(f"=== Starting Batch Generation ===")
-    print(f"Agents: {NUM_AGENTS} | Iterations: {NUM_ITERATIONS} | Max Concurrent: {MAX_CONCURRENT_STORIES}")
+    if FANOUT_MODELS_PER_THEME:
+        print(f"Agents: {NUM_AGENTS} | Iterations: {NUM_ITERATIONS} | Fan-out: {FANOUT_MODELS_PER_THEME} models x "
+              f"{FANOUT_STORIES_PER_MODEL} stories per theme")
+    elif PIPELINE_MODE == "staged":
+        print(f"Agents: {NUM_AGENTS} | Iterations: {NUM_ITERATIONS} | AP Workers: {AP_STAGE_WORKERS} | "
+              f"Story Workers: {STORY_STAGE_WORKERS} | Queue: {PIPELINE_QUEUE_SIZE}")
+    else:
+        print(f"Agents: {NUM_AGENTS} | Iterations: {NUM_ITERATIONS} | Max Concurrent: {MAX_CONCURRENT_STORIES}")
     print(f"Themes: {themes}")
     print("=" * 50)
 
-    for theme in themes:
-        print(f"\n>>> Processing Theme: {theme}")
+    if FANOUT_MODELS_PER_THEME:
+        output_root = "batch_stories_fanout"
+        run_fanout_generation(themes)
+    else:
+        output_root = "batch_stories_ablation"
+        jobs = []
+        for theme in themes:
+            folder_name = f"{theme.replace(' ', '_')}_A{NUM_AGENTS}_I{NUM_ITERATIONS}"
+            output_dir = os.path.join(output_root, folder_name)
+            os.makedirs(output_dir, exist_ok=True)
+            jobs.extend((theme, i, output_dir) for i in range(1, stories_per_theme + 1))
 
-        folder_name = f"{theme.replace(' ', '_')}_A{NUM_AGENTS}_I{NUM_ITERATIONS}"
-        output_dir = os.path.join("batch_stories_ablation", folder_name)
-        os.makedirs(output_dir, exist_ok=True)
+        if PIPELINE_MODE == "staged":
+            # One pipeline across all themes keeps both stages busy at theme boundaries
+            run_staged_generation(jobs)
+        else:
+            for theme in themes:
+                print(f"\n>>> Processing Theme: {theme}")
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_STORIES) as executor:
-            futures = [
-                executor.submit(process_single_story, theme, i, output_dir)
-                for i in range(1, stories_per_theme + 1)
-            ]
-            for future in concurrent.futures.as_completed(futures):
-                future.result()  # errors are caught and logged inside process_single_story
+                with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_STORIES) as executor:
+                    futures = [
+                        executor.submit(process_single_story, *job)
+                        for job in jobs if job[0] == theme
+                    ]
+                    for future in concurrent.futures.as_completed(futures):
+                        future.result()  # errors are caught and logged inside process_single_story
 
     print("\n" + "=" * 50)
     print("BATCH GENERATION COMPLETE")
-    print("Check the 'batch_stories_ablation' folder.")
+    print(f"Check the '{output_root}' folder.")
     print("=" * 50)
+    print(TELEMETRY.report())
+    print(review_policy.report())
+    save_budget_records()
+    save_provenance_records()
+    TELEMETRY.save(os.path.join(output_root, "telemetry.json"))
 
 if __name__ == "__main__":
     run_batch_generation()
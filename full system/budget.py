@@ -0,0 +1,99 @@
+import contextlib
+import contextvars
+import threading
+import time
+from config import BUDGET_DEGRADE_AT
+
+_current = contextvars.ContextVar("budget", default=None)
+
+
+class Budget:
+    """Token, call and wall-time limits for one story or a whole batch.
+
+    A story budget can have a batch budget as its parent; usage is charged to
+    both, and the story counts as near its limit when either one is. A limit
+    of None means unlimited (usage is still tracked for reporting).
+    """
+
+    def __init__(self, max_tokens: int = None, max_calls: int = None, max_seconds: float = None,
+                 parent: "Budget" = None, degrade_at: float = BUDGET_DEGRADE_AT):
+        self.max_tokens = max_tokens
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self.parent = parent
+        self.degrade_at = degrade_at
+        self.tokens = 0
+        self.calls = 0
+        self.started = time.perf_counter()
+        self.degradations = []
+        self._lock = threading.Lock()
+
+    def charge(self, tokens: int, calls: int = 1):
+        with self._lock:
+            self.tokens += tokens
+            self.calls += calls
+        if self.parent:
+            self.parent.charge(tokens, calls)
+
+    def restart_clock(self):
+        """Count wall time from now on, e.g. once a story leaves the queue between pipeline stages."""
+        with self._lock:
+            self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def usage_fraction(self) -> float:
+        """Largest used share of any limit, including the parent's."""
+        fractions = [0.0]
+        if self.max_tokens:
+            fractions.append(self.tokens / self.max_tokens)
+        if self.max_calls:
+            fractions.append(self.calls / self.max_calls)
+        if self.max_seconds:
+            fractions.append(self.elapsed() / self.max_seconds)
+        if self.parent:
+            fractions.append(self.parent.usage_fraction())
+        return max(fractions)
+
+    def near_limit(self) -> bool:
+        return self.usage_fraction() >= self.degrade_at
+
+    def exhausted(self) -> bool:
+        return self.usage_fraction() >= 1.0
+
+    def degrade(self, name: str):
+        """Record that a degradation was applied (each kind once per budget)."""
+        with self._lock:
+            if name in self.degradations:
+                return
+            self.degradations.append(name)
+        print(f"  [Budget] {self.usage_fraction():.0%} of budget used -> degrading: {name}")
+
+    def summary(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "calls": self.calls,
+            "seconds": round(self.elapsed(), 1),
+            "degradations": list(self.degradations),
+        }
+
+
+def current_budget():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def use_budget(budget: Budget):
+    """Make `budget` the active budget for LLM calls made in this context."""
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit that carries the caller's active budget and trace span into the worker thread."""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
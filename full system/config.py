@@ -1,11 +1,98 @@
 # --- API Keys (replace with your own) ---
 OPENAI_API_KEY = "your api here"
 TAVILY_API_KEY = "your tavily api here"  # Only needed for search_service.py
+OPENAI_BASE_URL = None  # e.g. "http://127.0.0.1:8900/v1" for the local fault-injecting server (fake_openai_server.py)
 
 # --- Multi-Agent Hyperparameters ---
 NUM_AGENTS = 3             # Expert agents brainstorming each AP element
 NUM_ITERATIONS = 3         # Rounds of brainstorming per element
 MAX_CONCURRENT_STORIES = 5 # Parallel threads used in batch_run.py
+OBJECT_STRATEGY = "sequential" # "parallel" drafts the 6 objects concurrently, then reconciles them in one call
+
+# --- Staged Pipeline (batch_run.py) ---
+PIPELINE_MODE = "per_story"  # "staged" splits AP building and story writing into separate worker pools
+AP_STAGE_WORKERS = 4         # Stories building their AP model concurrently (each fans out to NUM_AGENTS calls)
+STORY_STAGE_WORKERS = 8      # Stories running the serial setting/outline stage concurrently
+PIPELINE_QUEUE_SIZE = 8      # Finished AP models waiting for a story worker; AP workers block when full
+
+# --- Fan-out Mode (batch_run.py) ---
+FANOUT_MODELS_PER_THEME = 0   # K > 0 builds K AP models per theme and reuses each for several stories
+FANOUT_STORIES_PER_MODEL = 10 # M independent story-stage passes per AP model
+
+# --- AP Model Store ---
+AP_STORE_PATH = "ap_models.sqlite"  # SQLite repository of every generated Stage 3 model
+
+# --- Budgets (None = unlimited) ---
+STORY_TOKEN_BUDGET = None   # Tokens one story may use (AP model + story stage; a fan-out model counts toward the batch only)
+STORY_CALL_BUDGET = None    # LLM calls one story may make
+STORY_TIME_BUDGET = None    # Wall-clock seconds one story may take (staged mode: from the start of its story stage)
+BATCH_TOKEN_BUDGET = None   # Tokens for the whole batch run
+BATCH_CALL_BUDGET = None    # LLM calls for the whole batch run
+BATCH_TIME_BUDGET = None    # Wall-clock seconds for the whole batch run
+BUDGET_DEGRADE_AT = 0.8     # Share of a budget after which the pipeline degrades instead of overrunning
+
+# --- Tracing ---
+TRACE_STORIES = False       # Write a Chrome/Perfetto trace per story to <output_dir>/traces/
+
+# --- Search Grounding (search_service.py) ---
+SEARCH_BACKEND = "tavily"        # "local" searches a BM25 index over SEARCH_CORPUS_DIRS instead of the web
+SEARCH_INDEX_PATH = "search_index.sqlite"
+SEARCH_CORPUS_DIRS = ["../stories"] # Directories of .txt/.json files indexed by the local backend
+SEARCH_RATE_PER_SECOND = 2.0     # Sustained search requests per second across all threads
+SEARCH_BURST = 4                 # Requests allowed back-to-back before the rate limit applies
+SEARCH_MAX_WORKERS = 12          # Arrows grounded concurrently by SearchService.ground_arrows
+SEARCH_BATCH_QUERIES = True      # Generate the queries for all arrows in one JSON-mode call
+SEARCH_CACHE_PATH = "search_cache.sqlite"
+SEARCH_CACHE_TTL = 7 * 24 * 3600 # Seconds a cached search result stays valid
+SEARCH_DEDUP_SIMILARITY = 0.8    # Word-set overlap at which two queries count as the same search
+GROUNDING_ENABLED = False        # Ground arrows with web search in the background while objects are brainstormed
+GROUNDING_MAX_WAIT = 5.0         # Seconds an arrow waits for its pending finding before generating without it
+
+# --- Role-based Model Routing ---
+# Every LLM call is tagged with a role; its profile sets the model, an output cap (max_tokens),
+# a per-request timeout in seconds and the temperature (None = API default).
+# Override per run with llm_client.override_role_profiles() or the AP_ROLE_PROFILES env var (JSON).
+ROLE_PROFILES = {
+    "persona_hire":           {"model": "gpt-4o-mini", "max_tokens": 800,  "timeout": 60, "temperature": 1.0},
+    "proposal":               {"model": "gpt-4o-mini", "max_tokens": 120,  "timeout": 30, "temperature": 1.2},
+    "judge":                  {"model": "gpt-4o-mini", "max_tokens": 400,  "timeout": 30, "temperature": 0},
+    "final_judge":            {"model": "gpt-4o-mini", "max_tokens": 400,  "timeout": 30, "temperature": 0},
+    "reconcile":              {"model": "gpt-4o-mini", "max_tokens": 1200, "timeout": 60, "temperature": 0},
+    "brief":                  {"model": "gpt-4o-mini", "max_tokens": 600,  "timeout": 60, "temperature": None},
+    "review":                 {"model": "gpt-4o-mini", "max_tokens": 400,  "timeout": 45, "temperature": None},
+    "setting":                {"model": "gpt-4o-mini", "max_tokens": 1200, "timeout": 60, "temperature": None},
+    "outline":                {"model": "gpt-4o-mini", "max_tokens": 500,  "timeout": 45, "temperature": None},
+    "query_generation":       {"model": "gpt-4o-mini", "max_tokens": 80,   "timeout": 30, "temperature": 0},
+    "query_generation_batch": {"model": "gpt-4o-mini", "max_tokens": 1000, "timeout": 45, "temperature": 0},  # all arrows in one JSON reply
+    "synthesis":              {"model": "gpt-4o-mini", "max_tokens": 400,  "timeout": 45, "temperature": None},
+    "digest":                 {"model": "gpt-4o-mini", "max_tokens": 1500, "timeout": 60, "temperature": 0},
+}
+MODEL_PRICES = {  # USD per 1M tokens, used for cost telemetry and planning
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+}
+
+# --- Request Hedging (critical-path tail latency) ---
+HEDGING_ENABLED = False    # Send a duplicate request when a critical-path call is slow
+HEDGE_PERCENTILE = 95      # Hedge once a call outlives this latency percentile of its role
+HEDGE_MAX_RATE = 0.1       # Global cap: at most this fraction of eligible calls are hedged
+HEDGE_MIN_SAMPLES = 20     # Latency samples per role needed before hedging starts
+HEDGE_MAX_WORKERS = 16     # Threads shared by hedged calls; a call that would queue for one runs unhedged
+HEDGE_ROLES = ["persona_hire", "judge", "final_judge", "reconcile", "brief", "review", "setting", "outline"]
+
+# --- Structured Outputs ---
+STRUCTURED_REPAIR_ATTEMPTS = 1  # In-call repair requests when a JSON-mode response fails its schema
+USE_NATIVE_JSON_SCHEMA = False  # Send schemas as response_format json_schema (strict) instead of json_object
+
+# --- AP Digest (compact AP model shared by all Overseer prompts) ---
+AP_DIGEST_SUMMARIZE = False  # One extra LLM call per model to condense the digest when it exceeds a budget
+AP_DIGEST_TOKEN_BUDGETS = {"brief": 4000, "review": 2500}  # Approx. prompt tokens the digest may use per role
+
+# --- Overseer Review Policy ---
+REVIEW_POLICY = "always"          # "always" reviews every draft; "adaptive" samples once acceptance is high
+REVIEW_SAMPLE_RATE = 0.3          # Share of first drafts still reviewed in adaptive mode (flagged drafts always are)
+REVIEW_MIN_OBSERVATIONS = 30      # Reviews per role before adaptive sampling may start
+REVIEW_ACCEPTANCE_THRESHOLD = 0.9 # Acceptance rate a role must sustain for sampling to stay on
 
 SYSTEM_PROMPT = """You are a science fiction expert who analyzes society based on the "Archaeological Prototyping (AP)" model. Here is an introduction to this model:
 
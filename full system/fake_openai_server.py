@@ -0,0 +1,216 @@
+"""Local OpenAI-compatible stand-in server with fault injection, for offline load tests.
+
+Implements POST /v1/chat/completions (plain text and JSON mode, with
+canned logprobs when requested) and
+POST /v1/embeddings, plus GET /stats with request and fault counters.
+Responses are canned per prompt template (see planner.CANNED_RESPONSES), so
+the full pipeline runs end to end. Point the project at it with
+OPENAI_BASE_URL = "http://127.0.0.1:8900/v1" in config.py (or the
+OPENAI_BASE_URL environment variable for evaluate.py / pick_topics.py).
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from planner import CANNED_RESPONSES, filler
+
+# ================= Configuration =================
+HOST = "127.0.0.1"
+PORT = 8900
+FAULTS = {
+    "latency_mean": 1.0,      # Seconds per request
+    "latency_jitter": 0.5,    # Uniform +/- jitter around the mean
+    "rate_429": 0.02,         # Share of requests rejected with 429 (rate limited)
+    "rate_5xx": 0.01,         # Share of requests failing with 500/502/503
+    "truncated_json": 0.02,   # Share of JSON-mode replies cut off mid-object
+    "malformed_json": 0.02,   # Share of JSON-mode replies wrapped in fences/prose or otherwise broken
+    "reject_rate": 0.2,       # Share of Global Overseer reviews that reject the draft
+}
+EMBEDDING_DIM = 1536
+SEED = 0
+# =================================================
+
+_EVALUATOR_MARKER = "You are a story evaluator"
+_OVERSEER_MARKER = "strict **Global Overseer**"
+
+
+def _usage(prompt_text: str, completion_text: str) -> dict:
+    prompt_tokens = len(prompt_text) // 4 + 1
+    completion_tokens = len(completion_text) // 4 + 1
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _logprobs(content: str, top_n: int) -> dict:
+    """Canned `logprobs` for a reply: score digits 1-5 get a spread around the digit chosen, other tokens are certain."""
+    entries = []
+    for token in re.findall(r"\d|[A-Za-z]+|\s+|[^\sA-Za-z\d]", content):
+        if token in "12345":
+            weights = {d: math.exp(-abs(d - int(token))) for d in range(1, 6)}
+            total = sum(weights.values())
+            alternatives = sorted(((str(d), math.log(w / total)) for d, w in weights.items()), key=lambda a: -a[1])
+        else:
+            alternatives = [(token, 0.0)]
+        entries.append({
+            "token": token,
+            "logprob": dict(alternatives)[token],
+            "bytes": list(token.encode("utf-8")),
+            "top_logprobs": [{"token": t, "logprob": lp, "bytes": list(t.encode("utf-8"))}
+                             for t, lp in alternatives[:top_n]],
+        })
+    return {"content": entries}
+
+
+def _embedding(text: str) -> list:
+    """Deterministic unit vector per text, so identical inputs embed identically."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(EMBEDDING_DIM)]
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
+
+
+class FaultInjector:
+    """Draws latency and faults for each request and counts what it injected."""
+
+    def __init__(self, faults: dict = None, seed: int = SEED):
+        self.faults = {**FAULTS, **(faults or {})}
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def chance(self, name: str) -> bool:
+        with self._lock:
+            hit = self._rng.random() < self.faults[name]
+        if hit:
+            self.count(name)
+        return hit
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def latency(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(-1.0, 1.0) * self.faults["latency_jitter"]
+        return max(0.0, self.faults["latency_mean"] + jitter)
+
+    def choice(self, options):
+        with self._lock:
+            return self._rng.choice(options)
+
+    def chat_content(self, request: dict) -> str:
+        prompt = request["messages"][-1]["content"]
+        if _EVALUATOR_MARKER in prompt:
+            criteria = ["Relevance", "Coherence", "Empathy", "Surprise", "Engagement", "Complexity"]
+            return "\n".join(f"{c}: {self.choice([2, 3, 4, 5])}" for c in criteria)
+        if "response_format" not in request:
+            return filler(50)
+
+        if _OVERSEER_MARKER in prompt:
+            approved = not self.chance("reject_rate")
+            payload = {"approved": approved, "feedback": "" if approved else filler(20)}
+        else:
+            payload = next((make() for marker, make in CANNED_RESPONSES if marker in prompt), {})
+        content = json.dumps(payload)
+
+        if self.chance("truncated_json"):
+            return content[:max(1, len(content) // 2)]
+        if self.chance("malformed_json"):
+            return self.choice([
+                f"```json\n{content}\n```",                   # recoverable: code fence
+                f"Here is the JSON you asked for:\n{content}",  # prose before the object
+                content.replace('"', "'"),                    # single quotes
+                content[:-1] + ",}",                          # trailing comma
+            ])
+        return content
+
+
+class _Handler(BaseHTTPRequestHandler):
+    injector: FaultInjector = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # hundreds of requests per second would drown the console
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str, headers: dict = None):
+        self._send(status, {"error": {"message": message, "type": "injected_fault", "code": status}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send(200, dict(self.injector.stats))
+        else:
+            self._error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        injector = self.injector
+        injector.count("requests")
+        time.sleep(injector.latency())
+
+        if injector.chance("rate_429"):
+            return self._error(429, "Rate limit reached (injected)", {"Retry-After": "1"})
+        if injector.chance("rate_5xx"):
+            return self._error(injector.choice([500, 502, 503]), "Server error (injected)")
+
+        if self.path.endswith("/chat/completions"):
+            content = injector.chat_content(request)
+            prompt_text = "".join(m.get("content") or "" for m in request.get("messages", []))
+            choice = {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            if request.get("logprobs"):
+                choice["logprobs"] = _logprobs(content, request.get("top_logprobs") or 0)
+            self._send(200, {
+                "id": f"chatcmpl-local-{injector.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "local"),
+                "choices": [choice],
+                "usage": _usage(prompt_text, content),
+            })
+        elif self.path.endswith("/embeddings"):
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send(200, {
+                "object": "list",
+                "model": request.get("model", "local"),
+                "data": [{"object": "embedding", "index": i, "embedding": _embedding(text)}
+                         for i, text in enumerate(inputs)],
+                "usage": _usage("".join(inputs), ""),
+            })
+        else:
+            self._error(404, f"Unknown path {self.path}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 resets connections under load
+
+
+def make_server(host: str = HOST, port: int = PORT, faults: dict = None, seed: int = SEED) -> ThreadingHTTPServer:
+    """Build (but do not start) a server; call serve_forever(), e.g. on a thread, to run it."""
+    handler = type("Handler", (_Handler,), {"injector": FaultInjector(faults, seed)})
+    return _Server((host, port), handler)
+
+
+if __name__ == "__main__":
+    server = make_server()
+    print(f"Fake OpenAI server on http://{HOST}:{PORT}/v1 with faults {FAULTS}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,128 @@
+import threading
+import time
+import concurrent.futures
+from telemetry import TELEMETRY
+
+
+class Hedger:
+    """Issue a duplicate request when a call outlives a learned latency percentile.
+
+    The hedge delay for each role is the `percentile`-th latency of that role's
+    primary requests recorded in telemetry. Hedges are capped globally so that
+    no more than `max_hedge_rate` of eligible calls are ever duplicated.
+
+    A call that cannot be hedged (fewer than `min_samples` latencies observed,
+    the cap already reached, or every worker busy) runs inline on the caller's
+    thread. Otherwise the primary and any hedge run on a shared pool of at most
+    `max_workers` threads; a call that would have to queue for a worker runs
+    inline instead, so hedging never delays a primary.
+
+    The losing request is abandoned, not cancelled: the sync OpenAI client
+    cannot abort a request in flight, so it runs to completion on its worker.
+    Its response is handed to `on_abandoned` so that the tokens it used are
+    still charged.
+    """
+
+    def __init__(self, telemetry=TELEMETRY, percentile: float = 95, max_hedge_rate: float = 0.1, min_samples: int = 20,
+                 max_workers: int = 16):
+        self.telemetry = telemetry
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._eligible = 0
+        self._sent = 0
+        self._busy = 0  # workers running or reserved
+
+    def hedge_delay(self, role: str):
+        if self.telemetry.sample_count(f"primary:{role}") < self.min_samples:
+            return None
+        return self.telemetry.latency_percentile(f"primary:{role}", self.percentile)
+
+    def _hedge_allowed(self) -> bool:
+        return self._sent + 1 <= self.max_hedge_rate * self._eligible
+
+    def _acquire_hedge_slot(self) -> bool:
+        with self._lock:
+            if not self._hedge_allowed():
+                return False
+            self._sent += 1
+            return True
+
+    def _reserve_workers(self, n: int) -> bool:
+        with self._lock:
+            if self._busy + n > self.max_workers:
+                return False
+            self._busy += n
+            return True
+
+    def _release_worker(self, _future=None):
+        with self._lock:
+            self._busy -= 1
+
+    def _submit(self, fn) -> concurrent.futures.Future:
+        """Run fn on a worker reserved with _reserve_workers; the worker is released when fn finishes."""
+        future = self._executor.submit(fn)
+        future.add_done_callback(self._release_worker)
+        return future
+
+    def _track_primary(self, role: str, fn):
+        start = time.perf_counter()
+
+        def tracked():
+            try:
+                return fn()
+            finally:
+                self.telemetry.record_latency(f"primary:{role}", time.perf_counter() - start)
+        return tracked
+
+    @staticmethod
+    def _abandoned_callback(on_abandoned):
+        def callback(future):
+            if on_abandoned is not None and not future.cancelled() and future.exception() is None:
+                on_abandoned(future.result())
+        return callback
+
+    def call(self, role: str, fn, on_abandoned=None):
+        """Run fn, hedging it with a second identical request if it is slow. First response wins.
+
+        on_abandoned(response) is called (possibly later, on the loser's thread)
+        for every losing request that also succeeded.
+        """
+        with self._lock:
+            self._eligible += 1
+            hedge_possible = self._hedge_allowed()
+        self.telemetry.incr(f"hedge.eligible.{role}")
+
+        delay = self.hedge_delay(role)
+        primary_fn = self._track_primary(role, fn)
+        # Room for the primary and a hedge, so neither waits for a worker
+        if delay is None or not hedge_possible or not self._reserve_workers(2):
+            return primary_fn()
+
+        primary = self._submit(primary_fn)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or not self._acquire_hedge_slot():
+            self._release_worker()  # the hedge's worker
+            return primary.result()
+
+        self.telemetry.incr(f"hedge.sent.{role}")
+        hedge = self._submit(fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is None:
+                if pending:
+                    continue  # the other request may still succeed
+                winner = next(iter(done))
+            # The loser keeps running until its response arrives; only its result is discarded
+            for loser in done | pending:
+                if loser is not winner:
+                    self.telemetry.incr(f"hedge.abandoned.{role}")
+                    loser.add_done_callback(self._abandoned_callback(on_abandoned))
+            if winner is hedge:
+                self.telemetry.incr(f"hedge.won.{role}")
+            return winner.result()
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+from config import (
+    ROLE_PROFILES, MODEL_PRICES, HEDGING_ENABLED, HEDGE_PERCENTILE, HEDGE_MAX_RATE, HEDGE_MIN_SAMPLES, HEDGE_MAX_WORKERS,
+    HEDGE_ROLES, STRUCTURED_REPAIR_ATTEMPTS, USE_NATIVE_JSON_SCHEMA,
+)
+from hedging import Hedger
+from budget import current_budget
+from schemas import validate
+from telemetry import TELEMETRY, current_telemetry
+from tracing import span
+from utils import try_parse_json
+
+HEDGER = Hedger(TELEMETRY, HEDGE_PERCENTILE, HEDGE_MAX_RATE, HEDGE_MIN_SAMPLES, HEDGE_MAX_WORKERS)
+
+_DEFAULT_PROFILE = {"model": "gpt-4o-mini", "max_tokens": None, "timeout": None, "temperature": None}
+_profile_overrides = json.loads(os.environ.get("AP_ROLE_PROFILES", "{}"))
+
+
+def override_role_profiles(overrides: dict):
+    """Per-run routing overrides, e.g. {"proposal": {"model": "gpt-4o", "max_tokens": 80}}."""
+    for role, fields in overrides.items():
+        _profile_overrides.setdefault(role, {}).update(fields)
+
+
+def role_profile(role: str) -> dict:
+    base_role = role.split(".")[0]  # repair calls ("judge.repair") use the base role's profile
+    profile = dict(_DEFAULT_PROFILE)
+    profile.update(ROLE_PROFILES.get(base_role, {}))
+    profile.update(_profile_overrides.get(base_role, {}))
+    return profile
+
+
+def _record_cost(model: str, usage, telemetry=None):
+    prices = MODEL_PRICES.get(model)
+    if usage is None or prices is None:
+        return
+    cost = ((usage.prompt_tokens or 0) * prices["input"] + (usage.completion_tokens or 0) * prices["output"]) / 1e6
+    (telemetry or current_telemetry()).incr(f"cost_micro_usd.{model}", round(cost * 1e6))
+
+
+def _charge_usage(role: str, model: str, response, budget, telemetry):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        telemetry.incr(f"tokens.prompt.{role}", usage.prompt_tokens or 0)
+        telemetry.incr(f"tokens.completion.{role}", usage.completion_tokens or 0)
+    _record_cost(model, usage, telemetry)
+    if budget is not None:
+        budget.charge((usage.prompt_tokens or 0) + (usage.completion_tokens or 0) if usage is not None else 0)
+
+
+def chat_completion(client, role: str, **kwargs):
+    """Single entry point for chat-completion calls, tagged with the pipeline role making them.
+
+    The role's profile supplies model, max_tokens, timeout and temperature
+    (explicit kwargs win). Records the call latency and token usage under `role`, charges the active
+    budget, emits a trace span, and, when hedging is enabled for that role, races a duplicate
+    request against a slow one. A losing duplicate is abandoned rather than cancelled, and its
+    usage is charged the same way once it completes.
+    """
+    profile = role_profile(role)
+    request = {k: v for k, v in profile.items() if v is not None}
+    request.update(kwargs)
+
+    def call():
+        return client.chat.completions.create(**request)
+
+    # Captured here: the abandoned loser completes on a thread the contextvars do not reach
+    budget = current_budget()
+    telemetry = current_telemetry()
+
+    def charge_abandoned(response):
+        _charge_usage(role, request["model"], response, budget, telemetry)
+
+    start = time.perf_counter()
+    with span(role, "llm", model=request["model"]):
+        # Hedge delays are learned from the process-wide telemetry, so calls recorded elsewhere are not hedged
+        if HEDGING_ENABLED and role in HEDGE_ROLES and telemetry is TELEMETRY:
+            response = HEDGER.call(role, call, on_abandoned=charge_abandoned)
+        else:
+            response = call()
+    elapsed = time.perf_counter() - start
+    telemetry.record_latency(role, elapsed)
+    telemetry.record_latency(f"profile:{request['model']}", elapsed)
+    _charge_usage(role, request["model"], response, budget, telemetry)
+    return response
+
+
+def structured_completion(client, role: str, schema: dict, **kwargs) -> dict | None:
+    """JSON-mode chat completion whose result is validated against `schema`.
+
+    An unparseable or invalid response is repaired in the same conversation by
+    showing the model its output and the violations, up to
+    STRUCTURED_REPAIR_ATTEMPTS times. Returns None if every repair fails, so
+    callers must handle an unusable reply explicitly.
+    """
+    if USE_NATIVE_JSON_SCHEMA:
+        kwargs["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": role, "schema": schema, "strict": True},
+        }
+    else:
+        kwargs["response_format"] = {"type": "json_object"}
+    messages = list(kwargs.pop("messages"))
+
+    for attempt in range(STRUCTURED_REPAIR_ATTEMPTS + 1):
+        response = chat_completion(client, role if attempt == 0 else f"{role}.repair", messages=messages, **kwargs)
+        content = response.choices[0].message.content or ""
+        parsed, error = try_parse_json(content)
+        if parsed is None:
+            current_telemetry().incr(f"structured.parse_failure.{role}")
+            errors = [error]
+        else:
+            errors = validate(parsed, schema)
+            if not errors:
+                if attempt:
+                    current_telemetry().incr(f"structured.repaired.{role}")
+                return parsed
+            current_telemetry().incr(f"structured.schema_failure.{role}")
+
+        messages = messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": (
+                "Your previous response could not be used:\n"
+                + "\n".join(f"- {e}" for e in errors)
+                + f"\n\nReturn ONLY the corrected JSON object matching this JSON schema:\n{json.dumps(schema)}"
+            )},
+        ]
+
+    current_telemetry().incr(f"structured.unrecovered.{role}")
+    print(f"  [Warning] {role} returned unusable JSON after {STRUCTURED_REPAIR_ATTEMPTS} repair(s): {errors}")
+    return None
@@ -1,15 +1,16 @@
 import json
 from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import OPENAI_API_KEY, OPENAI_BASE_URL, AP_STORE_PATH, NUM_AGENTS, NUM_ITERATIONS
 from ap_builder import APBuilder
 from story_generator import StoryGenerator
+from ap_store import APModelStore
 
 def main():
     if not OPENAI_API_KEY:
         print("Error: Please set OPENAI_API_KEY in config.py.")
         return
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
     tech_input = input("Enter the Technology/Theme for Future Sci-Fi (e.g., Dream Recording): ").strip()
     if not tech_input:
@@ -27,7 +28,10 @@ def main():
     filename_safe = tech_input.replace(' ', '_')
     with open(f"ap_model_{filename_safe}.json", "w", encoding='utf-8') as f:
         json.dump(all_stages_data, f, indent=2, ensure_ascii=False)
-    print("\nAP Model saved to JSON.")
+    model_id = APModelStore(AP_STORE_PATH).save(
+        tech_input, stage3_model, ap_builder.agent_manager.agents, NUM_AGENTS, NUM_ITERATIONS
+    )
+    print(f"\nAP Model saved to JSON and to {AP_STORE_PATH} (id {model_id}).")
 
     outline = story_gen.generate_outline(all_stages_data)
 
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+import traceback
+
+_DONE = object()  # sentinel telling a consumer that every producer has finished
+
+
+class StageStats:
+    """Busy time and queue-depth samples for the two stages of a pipeline run."""
+
+    def __init__(self, producer_workers: int, consumer_workers: int, queue_size: int):
+        self._lock = threading.Lock()
+        self.workers = {"producer": producer_workers, "consumer": consumer_workers}
+        self.busy = {"producer": 0.0, "consumer": 0.0}
+        self.blocked_on_put = 0.0  # producer time spent waiting for queue space (backpressure)
+        self.queue_size = queue_size
+        self.depth_samples = []
+        self.completed = {"producer": 0, "consumer": 0}
+        self.failed = {"producer": 0, "consumer": 0}
+        self.wall = 0.0
+
+    def add_busy(self, stage: str, seconds: float, ok: bool):
+        with self._lock:
+            self.busy[stage] += seconds
+            self.completed[stage] += ok
+            self.failed[stage] += not ok
+
+    def add_blocked(self, seconds: float):
+        with self._lock:
+            self.blocked_on_put += seconds
+
+    def sample_depth(self, depth: int):
+        with self._lock:
+            self.depth_samples.append(depth)
+
+    def utilisation(self, stage: str) -> float:
+        capacity = self.workers[stage] * self.wall
+        return self.busy[stage] / capacity if capacity else 0.0
+
+    def report(self, producer_name: str = "AP stage", consumer_name: str = "Story stage") -> str:
+        depths = self.depth_samples or [0]
+        return "\n".join([
+            f"[Pipeline] wall={self.wall:.1f}s queue max={self.queue_size} "
+            f"depth avg={sum(depths) / len(depths):.1f} peak={max(depths)}",
+            f"  {producer_name:<12} workers={self.workers['producer']} utilisation={self.utilisation('producer'):.0%} "
+            f"done={self.completed['producer']} failed={self.failed['producer']} blocked on full queue={self.blocked_on_put:.1f}s",
+            f"  {consumer_name:<12} workers={self.workers['consumer']} utilisation={self.utilisation('consumer'):.0%} "
+            f"done={self.completed['consumer']} failed={self.failed['consumer']}",
+        ])
+
+
+def run_two_stage(items, produce, consume, producer_workers: int, consumer_workers: int, queue_size: int) -> StageStats:
+    """Run produce(item) -> result on producer threads and consume(item, result) on consumer threads.
+
+    Results pass through a bounded queue, so producers block (backpressure)
+    when consumers fall behind. A failing item is logged and skipped without
+    stopping the pipeline.
+    """
+    stats = StageStats(producer_workers, consumer_workers, queue_size)
+    work = queue.Queue()
+    for item in items:
+        work.put(item)
+    handoff = queue.Queue(maxsize=queue_size)
+
+    def producer():
+        while True:
+            try:
+                item = work.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                result = produce(item)
+            except Exception as e:
+                stats.add_busy("producer", time.perf_counter() - start, False)
+                print(f"  [Pipeline] Producer failed on {item}: {e}")
+                traceback.print_exc()
+                continue
+            stats.add_busy("producer", time.perf_counter() - start, True)
+            wait_start = time.perf_counter()
+            handoff.put((item, result))
+            stats.add_blocked(time.perf_counter() - wait_start)
+            stats.sample_depth(handoff.qsize())
+
+    def consumer():
+        while True:
+            entry = handoff.get()
+            stats.sample_depth(handoff.qsize())
+            if entry is _DONE:
+                return
+            item, result = entry
+            start = time.perf_counter()
+            try:
+                consume(item, result)
+                ok = True
+            except Exception as e:
+                ok = False
+                print(f"  [Pipeline] Consumer failed on {item}: {e}")
+                traceback.print_exc()
+            stats.add_busy("consumer", time.perf_counter() - start, ok)
+
+    wall_start = time.perf_counter()
+    producers = [threading.Thread(target=producer) for _ in range(producer_workers)]
+    consumers = [threading.Thread(target=consumer) for _ in range(consumer_workers)]
+    for t in producers + consumers:
+        t.start()
+    for t in producers:
+        t.join()
+    for _ in consumers:
+        handoff.put(_DONE)
+    for t in consumers:
+        t.join()
+    stats.wall = time.perf_counter() - wall_start
+    return stats
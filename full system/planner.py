@@ -0,0 +1,347 @@
+"""Dry-run cost and latency planner for batch_run.py configurations.
+
+Call counts come from the pipeline structure; prompt tokens are measured by
+rendering the real prompt templates through a fake client; wall-clock is
+predicted from concurrency, RPM/TPM limits and a per-role latency profile.
+Pass a telemetry.json from a previous batch to calibrate latencies, completion
+sizes and retry rates against what actually happened.
+"""
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+from types import SimpleNamespace
+from config import (
+    NUM_AGENTS, NUM_ITERATIONS, OBJECT_STRATEGY, AP_MODEL_STRUCTURE, MODEL_PRICES, AP_DIGEST_SUMMARIZE,
+    GROUNDING_ENABLED, SEARCH_BATCH_QUERIES, SEARCH_RATE_PER_SECOND, STRUCTURED_REPAIR_ATTEMPTS,
+)
+from llm_client import role_profile
+from story_generator import _MAX_RETRIES, NARRATIVE_STEPS
+from telemetry import Telemetry, percentile, use_telemetry
+
+# ================= Configuration =================
+PLAN_GRID = {
+    "num_agents": [1, 3],
+    "num_iterations": [1, 3],
+    "stories": [400],
+    "concurrency": [5, 20],
+}
+RPM_LIMIT = 5000          # Requests per minute allowed by the API tier
+TPM_LIMIT = 2_000_000     # Tokens per minute allowed by the API tier
+CALIBRATION_TELEMETRY = "batch_stories_ablation/telemetry.json"  # Used if it exists
+# =================================================
+
+NUM_ARROWS = len(AP_MODEL_STRUCTURE["arrows"])
+NUM_ELEMENTS = len(AP_MODEL_STRUCTURE["objects"]) + NUM_ARROWS
+NUM_BEATS = len(NARRATIVE_STEPS)
+
+# Seconds per call and completion tokens per call, used until calibrated from telemetry
+DEFAULT_LATENCY_PROFILE = {
+    "persona_hire": 6.0, "proposal": 2.5, "judge": 2.0, "final_judge": 2.0, "reconcile": 6.0,
+    "brief": 4.0, "review": 2.5, "setting": 6.0, "outline": 4.0, "digest": 8.0,
+    "query_generation": 1.5, "query_generation_batch": 4.0, "synthesis": 3.0,
+}
+DEFAULT_COMPLETION_TOKENS = {
+    "persona_hire": 300, "proposal": 70, "judge": 120, "final_judge": 110, "reconcile": 500,
+    "brief": 200, "review": 60, "setting": 450, "outline": 170, "digest": 900,
+    "query_generation": 15, "query_generation_batch": 200, "synthesis": 120,
+}
+# Prompt tokens of calls the dry run does not render (search grounding is off there), until calibrated
+DEFAULT_PROMPT_TOKENS = {"query_generation": 150, "query_generation_batch": 700, "synthesis": 800}
+DEFAULT_ATTEMPTS = {"setting": 1.5, "outline": 1.3}  # expected drafts per settings / per beat
+# Share of drafts the Overseer reviews (the rest fail a pre-check or are skipped by the review policy),
+# and repair calls per structured call; without calibration every draft is reviewed and nothing is repaired
+DEFAULT_RATES = {"review": 1.0, "repair": {}}
+
+# Roles that go through structured_completion and so may be followed by "<role>.repair" calls
+STRUCTURED_ROLES = [
+    "persona_hire", "judge", "final_judge", "reconcile", "brief", "review", "setting", "outline",
+    "query_generation_batch", "synthesis",
+]
+
+_WORDS = "the future city hums while quiet networks reshape every habit and institution".split()
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.encoding_for_model("gpt-4o-mini")
+
+    def count_tokens(text: str) -> int:
+        return len(_ENCODING.encode(text))
+except Exception:  # tiktoken is optional; fall back to ~4 characters per token
+    def count_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+
+def filler(words: int) -> str:
+    return " ".join(itertools.islice(itertools.cycle(_WORDS), words))
+
+
+# Canned responses of realistic length, keyed by a phrase unique to each prompt template
+CANNED_RESPONSES = [
+    ("distinct expert agents", lambda: {"agents": [
+        {"name": f"Agent {i}", "expertise": filler(4), "personality": filler(4), "perspective": filler(20)}
+        for i in range(NUM_AGENTS)]}),
+    ("Sci-Fi Editor", lambda: {"selected_agent": "Agent 0", "selected_content": filler(50), "reason": filler(30)}),
+    ("Final Decision", lambda: {"final_content": filler(60), "reason": filler(30)}),
+    ("Chief Editor", lambda: {name: filler(60) for name in AP_MODEL_STRUCTURE["objects"]}),
+    ("Concept Brief", lambda: {"briefing_theme": filler(6), "relevant_data_points": filler(120)}),
+    ("strict **Global Overseer**", lambda: {"approved": True, "feedback": ""}),
+    ("**Setting Agent**", lambda: {"world_view": filler(150), "characters": [
+        {"name": f"Character {i}", "role": filler(6), "motivation": filler(20)} for i in range(4)]}),
+    ("**Outline Agent**", lambda: {"summary": filler(100)}),
+    ("ONE search query for EACH", lambda: {name: filler(8) for name in AP_MODEL_STRUCTURE["arrows"]}),
+    ("summarize the findings for the AP Model Arrow", lambda: {
+        "arrow_type": filler(2), "definition": filler(25), "example": filler(15), "target_node_content": filler(40)}),
+]
+
+
+class _DryRunClient:
+    """Stands in for OpenAI: answers instantly and reports locally counted prompt tokens."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if "response_format" not in kwargs:
+            content = filler(50)
+        else:
+            content = json.dumps(next((make() for marker, make in CANNED_RESPONSES if marker in prompt), {}))
+        prompt_tokens = sum(count_tokens(m["content"]) for m in kwargs["messages"])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=0),
+        )
+
+
+def measure_prompt_tokens() -> dict:
+    """Render one full story through the real prompt templates; returns mean prompt tokens per call by role."""
+    from ap_builder import APBuilder
+    from ap_digest import APDigest
+    from story_generator import StoryGenerator
+
+    # Measured into a private collector, so planning never touches a live run's telemetry
+    client = _DryRunClient()
+    with use_telemetry(Telemetry()) as telemetry, contextlib.redirect_stdout(io.StringIO()):
+        model = APBuilder(client).generate_future_stage_multi_agent("Dry Run Theme")
+        StoryGenerator(client).generate_outline({"Stage 3": model})
+    snapshot = telemetry.snapshot()
+    tokens = dict(DEFAULT_PROMPT_TOKENS)
+    # The dry-run model is small enough that the digest is never summarised; its prompt is the digest itself
+    tokens["digest"] = count_tokens(APDigest(model).text) + 60
+    tokens.update({
+        role: snapshot["counters"].get(f"tokens.prompt.{role}", 0) / len(samples)
+        for role, samples in snapshot["latencies"].items()
+        if samples and not role.startswith(("primary:", "phase.", "profile:"))
+    })
+    return tokens
+
+
+def load_calibration(telemetry_path: str) -> dict:
+    """Latency profile, completion sizes and retry rates observed in a previous run's telemetry.json."""
+    with open(telemetry_path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    latencies, counters = snapshot["latencies"], snapshot["counters"]
+    calibration = {"latency": {}, "latency_p90": {}, "completion_tokens": {}, "prompt_tokens": {}, "attempts": {},
+                   "rates": {"repair": {}}}
+    for role, samples in latencies.items():
+        if not samples or role.startswith(("primary:", "phase.", "profile:")):
+            continue
+        calibration["latency"][role] = sum(samples) / len(samples)
+        calibration["latency_p90"][role] = percentile(samples, 90)
+        completion = counters.get(f"tokens.completion.{role}")
+        if completion:
+            calibration["completion_tokens"][role] = completion / len(samples)
+        prompt = counters.get(f"tokens.prompt.{role}")
+        if prompt:
+            calibration["prompt_tokens"][role] = prompt / len(samples)
+    stories = len(latencies.get("brief", [])) / 2
+    if stories:
+        calibration["attempts"]["setting"] = len(latencies.get("setting", [])) / stories
+        calibration["attempts"]["outline"] = len(latencies.get("outline", [])) / (stories * NUM_BEATS)
+    drafts = len(latencies.get("setting", [])) + len(latencies.get("outline", []))
+    if drafts:
+        calibration["rates"]["review"] = len(latencies.get("review", [])) / drafts
+    for role in STRUCTURED_ROLES:
+        if latencies.get(role):
+            calibration["rates"]["repair"][role] = len(latencies.get(f"{role}.repair", [])) / len(latencies[role])
+    return calibration
+
+
+def calls_per_story(num_agents: int, num_iterations: int, attempts: dict, rates: dict = DEFAULT_RATES) -> dict:
+    """Expected LLM calls per story by role, derived from the pipeline structure and config.
+
+    `rates["review"]` scales reviews to the share of drafts that reach the
+    Overseer; `rates["repair"][role]` adds "<role>.repair" calls. The digest
+    summary is counted once per story whenever AP_DIGEST_SUMMARIZE is on,
+    although it only runs for digests over budget, and fan-out shares it
+    between the stories of a model.
+    """
+    settings_attempts, outline_attempts = attempts["setting"], attempts["outline"]
+    calls = {
+        "persona_hire": 1,
+        "proposal": NUM_ELEMENTS * num_iterations * num_agents,
+        "judge": NUM_ELEMENTS * num_iterations,
+        "final_judge": NUM_ELEMENTS,
+        "brief": 2,
+        "setting": settings_attempts,
+        "outline": NUM_BEATS * outline_attempts,
+        "review": (settings_attempts + NUM_BEATS * outline_attempts) * rates.get("review", 1.0),
+    }
+    if OBJECT_STRATEGY == "parallel":
+        calls["reconcile"] = 1
+    if AP_DIGEST_SUMMARIZE:
+        calls["digest"] = 1
+    if GROUNDING_ENABLED:
+        if SEARCH_BATCH_QUERIES:
+            calls["query_generation_batch"] = 1
+        else:
+            calls["query_generation"] = NUM_ARROWS
+        calls["synthesis"] = NUM_ARROWS
+    for role, rate in rates.get("repair", {}).items():
+        if role in calls and rate:
+            calls[f"{role}.repair"] = calls[role] * rate
+    return calls
+
+
+def searches_per_story() -> int:
+    """Web searches per story before cache hits and in-flight deduplication, which only lower it."""
+    return NUM_ARROWS if GROUNDING_ENABLED else 0
+
+
+def plan_notes(calibrated: bool) -> list:
+    """What the estimates assume about calls whose number depends on the run, for print_plan."""
+    notes = []
+    if not calibrated:
+        notes.append("Uncalibrated: every draft is assumed reviewed (none fail a pre-check or are skipped by "
+                     "the review policy) and no structured reply needs a repair call; 'worst' assumes "
+                     f"{STRUCTURED_REPAIR_ATTEMPTS} repair(s) per structured call.")
+    if AP_DIGEST_SUMMARIZE:
+        notes.append("Digest summaries are counted once per story; they only run for digests over budget.")
+    if GROUNDING_ENABLED:
+        notes.append("Search grounding runs in the background, so its calls are not on the story's critical path; "
+                     "web searches are an upper bound before cache hits and are rate-limited separately.")
+    return notes
+
+
+def serial_latency_per_story(num_agents: int, num_iterations: int, attempts: dict, latency: dict, latency_p90: dict) -> float:
+    """Critical-path seconds for one story.
+
+    Sequential objects: only the proposals of a round run in parallel, and every
+    element waits for the previous one. Parallel objects: the six object drafts
+    run concurrently, followed by one reconcile call, then the arrows in order.
+    """
+    # A round waits for its slowest proposal; approximate that by the p90 latency
+    proposal_round = latency_p90.get("proposal", latency["proposal"] * (1.25 if num_agents > 1 else 1.0))
+    element = num_iterations * (proposal_round + latency["judge"]) + latency["final_judge"]
+    if OBJECT_STRATEGY == "parallel":
+        # The object phase waits for its slowest draft, so every call in it is taken at p90
+        slowest_draft = (num_iterations * (proposal_round + latency_p90.get("judge", latency["judge"]))
+                         + latency_p90.get("final_judge", latency["final_judge"]))
+        ap_stage = slowest_draft + latency["reconcile"] + NUM_ARROWS * element
+    else:
+        ap_stage = NUM_ELEMENTS * element
+    if AP_DIGEST_SUMMARIZE:
+        ap_stage += latency["digest"]  # the story stage waits for the digest
+    story_stage = (2 * latency["brief"]
+                   + attempts["setting"] * (latency["setting"] + latency["review"])
+                   + NUM_BEATS * attempts["outline"] * (latency["outline"] + latency["review"]))
+    return latency["persona_hire"] + ap_stage + story_stage
+
+
+def plan(grid: dict = None, rpm_limit: int = RPM_LIMIT, tpm_limit: int = TPM_LIMIT, calibration_path: str = None) -> list:
+    """Estimate calls, tokens and wall-clock hours for every cell of a sweep grid."""
+    grid = grid or PLAN_GRID
+    prompt_tokens = measure_prompt_tokens()
+    latency = dict(DEFAULT_LATENCY_PROFILE)
+    latency_p90 = {}
+    completion_tokens = dict(DEFAULT_COMPLETION_TOKENS)
+    attempts = dict(DEFAULT_ATTEMPTS)
+    rates = {"review": DEFAULT_RATES["review"], "repair": dict(DEFAULT_RATES["repair"])}
+    calibrated = bool(calibration_path and os.path.exists(calibration_path))
+    if calibrated:
+        calibration = load_calibration(calibration_path)
+        latency.update(calibration["latency"])
+        latency_p90.update(calibration["latency_p90"])
+        completion_tokens.update(calibration["completion_tokens"])
+        # Measured prompts of calls the dry run cannot render (e.g. search grounding)
+        prompt_tokens.update({role: n for role, n in calibration["prompt_tokens"].items() if role not in prompt_tokens})
+        attempts.update(calibration["attempts"])
+        rates["review"] = calibration["rates"].get("review", rates["review"])
+        rates["repair"].update(calibration["rates"]["repair"])
+    worst_rates = {"review": 1.0, "repair": {role: STRUCTURED_REPAIR_ATTEMPTS for role in STRUCTURED_ROLES}}
+
+    rows = []
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        cell = dict(zip(keys, values))
+        a, i = cell["num_agents"], cell["num_iterations"]
+        calls = calls_per_story(a, i, attempts, rates)
+
+        # The dry run used the configured A and I; adjust prompts whose size depends on them
+        per_call_prompt = dict(prompt_tokens)
+        proposal_size = completion_tokens["proposal"]
+        per_call_prompt["judge"] = prompt_tokens.get("judge", 0) + (a - NUM_AGENTS) * proposal_size
+        per_call_prompt["proposal"] = prompt_tokens.get("proposal", 0) + ((i - 1) - (NUM_ITERATIONS - 1)) / 2 * proposal_size
+        # A repair resends the conversation with the rejected reply appended
+        call_completion = dict(completion_tokens)
+        for role in STRUCTURED_ROLES:
+            per_call_prompt[f"{role}.repair"] = per_call_prompt.get(role, 0) + completion_tokens.get(role, 0)
+            call_completion[f"{role}.repair"] = completion_tokens.get(role, 0)
+
+        tokens_per_story = sum(
+            n * (per_call_prompt.get(role, 0) + call_completion.get(role, 0)) for role, n in calls.items()
+        )
+        cost_per_story = 0.0
+        for role, n in calls.items():
+            prices = MODEL_PRICES.get(role_profile(role)["model"], {"input": 0.0, "output": 0.0})
+            cost_per_story += n * (per_call_prompt.get(role, 0) * prices["input"]
+                                   + call_completion.get(role, 0) * prices["output"]) / 1e6
+        calls_total = sum(calls.values()) * cell["stories"]
+        tokens_total = tokens_per_story * cell["stories"]
+        searches_total = searches_per_story() * cell["stories"]
+
+        story_seconds = serial_latency_per_story(a, i, attempts, latency, latency_p90)
+        bounds = {
+            "latency": math.ceil(cell["stories"] / cell["concurrency"]) * story_seconds,
+            "rpm": calls_total / rpm_limit * 60,
+            "tpm": tokens_total / tpm_limit * 60,
+        }
+        if searches_total:
+            bounds["search_rate"] = searches_total / SEARCH_RATE_PER_SECOND
+        bottleneck = max(bounds, key=bounds.get)
+        rows.append({
+            **cell,
+            "calls_per_story": sum(calls.values()),
+            "worst_calls_per_story": sum(calls_per_story(
+                a, i, {"setting": _MAX_RETRIES, "outline": _MAX_RETRIES}, worst_rates).values()),
+            "searches_per_story": searches_per_story(),
+            "tokens_per_story": tokens_per_story,
+            "total_calls": calls_total,
+            "total_tokens": tokens_total,
+            "total_cost_usd": cost_per_story * cell["stories"],
+            "story_latency_s": story_seconds,
+            "wall_clock_h": bounds[bottleneck] / 3600,
+            "bottleneck": bottleneck,
+            "notes": plan_notes(calibrated),
+        })
+    return rows
+
+
+def print_plan(rows: list):
+    print(f"{'A':>2} {'I':>2} {'stories':>7} {'conc':>4} {'calls/story':>11} {'worst':>5} "
+          f"{'tokens/story':>12} {'total tokens':>13} {'cost $':>8} {'story s':>8} {'hours':>6}  bottleneck")
+    for r in rows:
+        print(f"{r['num_agents']:>2} {r['num_iterations']:>2} {r['stories']:>7} {r['concurrency']:>4} "
+              f"{r['calls_per_story']:>11.1f} {r['worst_calls_per_story']:>5} {r['tokens_per_story']:>12,.0f} "
+              f"{r['total_tokens']:>13,.0f} {r['total_cost_usd']:>8.2f} {r['story_latency_s']:>8.0f} {r['wall_clock_h']:>6.2f}  {r['bottleneck']}")
+    if rows and rows[0]["searches_per_story"]:
+        print(f"Web searches per story: up to {rows[0]['searches_per_story']}")
+    for note in rows[0]["notes"] if rows else []:
+        print(f"Note: {note}")
+
+
+if __name__ == "__main__":
+    print_plan(plan(calibration_path=CALIBRATION_TELEMETRY))
@@ -0,0 +1,90 @@
+import random
+import threading
+from collections import defaultdict
+from config import MODEL_PRICES, REVIEW_POLICY, REVIEW_SAMPLE_RATE, REVIEW_MIN_OBSERVATIONS, REVIEW_ACCEPTANCE_THRESHOLD
+from llm_client import role_profile
+from telemetry import current_telemetry
+
+
+class ReviewPolicy:
+    """Decide whether a first draft needs an Overseer review, based on acceptance seen so far in the batch.
+
+    mode "always" reviews every draft (the original behaviour). Mode "adaptive"
+    keeps reviewing everything until a role has REVIEW_MIN_OBSERVATIONS reviews
+    with an acceptance rate of at least REVIEW_ACCEPTANCE_THRESHOLD; after that
+    only a random REVIEW_SAMPLE_RATE share of drafts, plus any draft flagged by
+    a cheap heuristic, is reviewed. Sampled reviews keep the acceptance rate
+    current, so the policy falls back to full review if quality drops.
+    One instance should be shared by every StoryGenerator in a batch.
+    """
+
+    def __init__(self, mode: str = REVIEW_POLICY, sample_rate: float = REVIEW_SAMPLE_RATE,
+                 min_observations: int = REVIEW_MIN_OBSERVATIONS, acceptance_threshold: float = REVIEW_ACCEPTANCE_THRESHOLD,
+                 seed: int = None):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.min_observations = min_observations
+        self.acceptance_threshold = acceptance_threshold
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reviewed = defaultdict(int)
+        self.approved = defaultdict(int)
+        self.skipped = defaultdict(int)
+
+    def acceptance_rate(self, role: str):
+        with self._lock:
+            if not self.reviewed[role]:
+                return None
+            return self.approved[role] / self.reviewed[role]
+
+    def _is_confident(self, role: str) -> bool:
+        with self._lock:
+            reviewed = self.reviewed[role]
+            return (reviewed >= max(self.min_observations, 1)
+                    and self.approved[role] / reviewed >= self.acceptance_threshold)
+
+    def should_review(self, role: str, flagged: bool = False, is_revision: bool = False) -> bool:
+        """Revisions of a rejected draft and heuristically flagged drafts are always reviewed."""
+        if self.mode == "always" or flagged or is_revision or not self._is_confident(role):
+            return True
+        with self._lock:
+            if self._rng.random() < self.sample_rate:
+                return True
+            self.skipped[role] += 1
+        current_telemetry().incr(f"review.policy_skipped.{role}")
+        return False
+
+    def record(self, role: str, approved: bool):
+        with self._lock:
+            self.reviewed[role] += 1
+            if approved:
+                self.approved[role] += 1
+
+    @staticmethod
+    def review_call_usage():
+        """Mean (prompt tokens, completion tokens, USD) of one review call seen so far."""
+        telemetry = current_telemetry()
+        calls = telemetry.sample_count("review")
+        if not calls:
+            return 0.0, 0.0, 0.0
+        prompt = telemetry.count("tokens.prompt.review") / calls
+        completion = telemetry.count("tokens.completion.review") / calls
+        prices = MODEL_PRICES.get(role_profile("review")["model"], {"input": 0.0, "output": 0.0})
+        return prompt, completion, (prompt * prices["input"] + completion * prices["output"]) / 1e6
+
+    def report(self) -> str:
+        review_latency = current_telemetry().latency_percentile("review", 50) or 0.0
+        prompt_tokens, completion_tokens, review_cost = self.review_call_usage()
+        lines = [f"[Review Policy] mode={self.mode}"]
+        for role in sorted(set(self.reviewed) | set(self.skipped)):
+            rate = self.acceptance_rate(role)
+            skipped = self.skipped[role]
+            # Each skipped draft would have been rejected with probability (1 - acceptance rate)
+            expected_misses = skipped * (1 - rate) if rate is not None else 0.0
+            lines.append(
+                f"  {role:<10} reviewed={self.reviewed[role]} acceptance={rate if rate is not None else 0:.1%} "
+                f"skipped={skipped} (~{skipped * review_latency:.0f}s serial latency, "
+                f"~{skipped * (prompt_tokens + completion_tokens):.0f} tokens, ~${skipped * review_cost:.4f} saved) "
+                f"est. unreviewed rejections={expected_misses:.1f}"
+            )
+        return "\n".join(lines)
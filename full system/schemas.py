@@ -0,0 +1,109 @@
+"""JSON schemas for every JSON-mode role, plus a small validator for the subset of JSON Schema they use.
+
+The schemas follow OpenAI strict structured-output rules (every property is
+required and objects are closed) so they can also be sent natively via
+`response_format={"type": "json_schema", ...}` when USE_NATIVE_JSON_SCHEMA is set.
+"""
+from config import AP_MODEL_STRUCTURE
+
+
+def _string_object(*keys: str) -> dict:
+    return {
+        "type": "object",
+        "properties": {k: {"type": "string"} for k in keys},
+        "required": list(keys),
+        "additionalProperties": False,
+    }
+
+
+AGENTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "agents": {
+            "type": "array",
+            "minItems": 1,
+            "items": _string_object("name", "expertise", "personality", "perspective"),
+        }
+    },
+    "required": ["agents"],
+    "additionalProperties": False,
+}
+
+JUDGE_SCHEMA = _string_object("selected_agent", "selected_content", "reason")
+
+FINAL_JUDGE_SCHEMA = _string_object("final_content", "reason")
+
+BRIEF_SCHEMA = _string_object("briefing_theme", "relevant_data_points")
+
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "approved": {"type": "boolean"},
+        "feedback": {"type": "string"},
+    },
+    "required": ["approved", "feedback"],
+    "additionalProperties": False,
+}
+
+SETTINGS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "world_view": {"type": "string"},
+        "characters": {
+            "type": "array",
+            "minItems": 1,
+            "items": _string_object("name", "role", "motivation"),
+        },
+    },
+    "required": ["world_view", "characters"],
+    "additionalProperties": False,
+}
+
+OUTLINE_STEP_SCHEMA = _string_object("summary")
+
+SYNTHESIS_SCHEMA = _string_object("arrow_type", "definition", "example", "target_node_content")
+
+RECONCILE_SCHEMA = _string_object(*AP_MODEL_STRUCTURE["objects"])
+
+
+def queries_schema(arrow_names) -> dict:
+    """One search query per requested arrow, keyed by arrow name."""
+    return _string_object(*arrow_names)
+
+
+QUERIES_SCHEMA = queries_schema(AP_MODEL_STRUCTURE["arrows"])
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "number": (int, float),
+    "integer": int,
+}
+
+
+def validate(instance, schema: dict, path: str = "$") -> list:
+    """Return a list of human-readable schema violations (empty when the instance is valid)."""
+    expected = schema.get("type")
+    if expected:
+        py_type = _TYPES[expected]
+        # bool is a subclass of int, so keep it out of numeric types
+        if not isinstance(instance, py_type) or (expected in ("number", "integer") and isinstance(instance, bool)):
+            return [f"{path}: expected {expected}, got {type(instance).__name__}"]
+
+    errors = []
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in instance:
+                errors.append(f"{path}: missing required key '{key}'")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in instance:
+                errors.extend(validate(instance[key], sub_schema, f"{path}.{key}"))
+    elif expected == "array":
+        if len(instance) < schema.get("minItems", 0):
+            errors.append(f"{path}: expected at least {schema['minItems']} items, got {len(instance)}")
+        if "items" in schema:
+            for i, item in enumerate(instance):
+                errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
@@ -0,0 +1,93 @@
+import re
+import sqlite3
+import threading
+import time
+from config import SEARCH_CACHE_PATH, SEARCH_CACHE_TTL, SEARCH_DEDUP_SIMILARITY
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "into", "is", "it",
+    "of", "on", "or", "the", "this", "to", "what", "which", "with",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    backend TEXT NOT NULL,       -- name of the search backend that produced the result
+    query_key TEXT NOT NULL,     -- normalised query
+    query TEXT NOT NULL,         -- first raw query seen for this key
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (backend, query_key)
+);
+"""
+
+
+def tokenize(text: str) -> list:
+    """Lowercase content words, in order."""
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in _STOPWORDS]
+
+
+def normalize_query(query: str) -> str:
+    """Order-insensitive key: lowercase content words, deduplicated and sorted."""
+    return " ".join(sorted(set(tokenize(query))))
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class SearchCache:
+    """Persistent TTL cache of search results keyed by backend name and normalised query.
+
+    A lookup first tries the exact normalised key, then any live entry from the
+    same backend whose word set overlaps at least SEARCH_DEDUP_SIMILARITY
+    (Jaccard), so near-identical queries from different stories and themes
+    share one result. Results from different backends are never mixed.
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL,
+                 similarity: float = SEARCH_DEDUP_SIMILARITY):
+        self.ttl = ttl
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(search_cache)")]
+            if columns and "backend" not in columns:
+                # Older caches did not record which backend a result came from, so they cannot be reused safely
+                self._conn.execute("DROP TABLE search_cache")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("DELETE FROM search_cache WHERE created_at < ?", (time.time() - ttl,))
+            rows = self._conn.execute("SELECT backend, query_key, created_at FROM search_cache").fetchall()
+        self._keys = {(backend, key): (frozenset(key.split()), created_at) for backend, key, created_at in rows}
+
+    def _live(self, created_at: float) -> bool:
+        return time.time() - created_at < self.ttl
+
+    def get(self, query: str, backend: str):
+        """Cached result of `backend` for `query` or a near-identical one, else None."""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._keys.get((backend, key))
+            if entry is None or not self._live(entry[1]):
+                words = frozenset(key.split())
+                key = next((k for (b, k), (other, created_at) in self._keys.items()
+                            if b == backend and self._live(created_at) and _similarity(words, other) >= self.similarity), None)
+                if key is None:
+                    return None
+            row = self._conn.execute("SELECT result FROM search_cache WHERE backend = ? AND query_key = ?",
+                                     (backend, key)).fetchone()
+        return row[0] if row else None
+
+    def put(self, query: str, result: str, backend: str):
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (backend, query_key, query, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (backend, key, query, result, now)
+            )
+            self._keys[(backend, key)] = (frozenset(key.split()), now)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,24 +1,60 @@
 import time
+import threading
+import concurrent.futures
 from openai import OpenAI
-from tavily import TavilyClient
-from config import SYSTEM_PROMPT, AP_MODEL_STRUCTURE
-from utils import parse_json_response
+from config import (
+    SYSTEM_PROMPT, AP_MODEL_STRUCTURE, OPENAI_BASE_URL,
+    SEARCH_RATE_PER_SECOND, SEARCH_BURST, SEARCH_MAX_WORKERS, SEARCH_BATCH_QUERIES,
+)
+from llm_client import chat_completion, structured_completion
+from schemas import SYNTHESIS_SCHEMA, queries_schema
+from search_cache import SearchCache, normalize_query
+from search_backends import SearchBackend, make_backend
+from telemetry import current_telemetry
+from budget import submit_in_context
+from tracing import span
+
+# (from, to) -> arrow name, so endpoint lookups don't scan the structure on every call
+_ARROW_BY_ENDPOINTS = {(info["from"], info["to"]): name for name, info in AP_MODEL_STRUCTURE["arrows"].items()}
+
+class RateLimiter:
+    """Token bucket shared by all threads: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float = SEARCH_RATE_PER_SECOND, burst: int = SEARCH_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class SearchService:
-    def __init__(self, openai_key, tavily_key):
-        self.client = OpenAI(api_key=openai_key)
-        self.tavily_client = TavilyClient(api_key=tavily_key)
+    def __init__(self, openai_key, tavily_key=None, cache: SearchCache = None, rate_limiter: RateLimiter = None,
+                 backend: SearchBackend = None):
+        self.client = OpenAI(api_key=openai_key, base_url=OPENAI_BASE_URL)
+        self.backend = backend or make_backend(tavily_key)
+        # Share one cache and limiter between services to deduplicate across stories and themes
+        self.cache = cache or SearchCache()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._inflight = {}  # normalised query -> Future of the search already running for it
+        self._inflight_lock = threading.Lock()
 
     def generate_question(self, start_node: str, target_node: str, tech_topic: str, era_context: str) -> str:
-        arrow_name = None
-        arrow_desc = ""
-        for name, info in AP_MODEL_STRUCTURE["arrows"].items():
-            if info["from"] == start_node and info["to"] == target_node:
-                arrow_name = name
-                arrow_desc = info["description"]
-                break
-
-        if not arrow_name:
+        arrow_name = _ARROW_BY_ENDPOINTS.get((start_node, target_node))
+        if arrow_name:
+            arrow_desc = AP_MODEL_STRUCTURE["arrows"][arrow_name]["description"]
+        else:
             arrow_desc = f"relationship between {start_node} and {target_node}"
 
         prompt = f"""
@@ -33,36 +69,103 @@ Context:
 The query should be designed to find real-world examples or factual data confirming this relationship in that specific era.
 Output ONLY the query string. No quotes, no explanations.
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = chat_completion(
+            self.client, "query_generation",
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ],
-            temperature=0
+            ]
         )
         return response.choices[0].message.content.strip()
 
-    def search_tavily(self, query: str) -> str:
+    def generate_questions(self, tech_topic: str, era_context: str, arrows: list = None) -> dict:
+        """Search queries for all 12 arrows (or the given subset) in one JSON-mode call; returns {arrow_name: query}.
+
+        Arrows the batched reply leaves out or blank fall back to generate_question.
+        """
+        arrows = arrows or list(AP_MODEL_STRUCTURE["arrows"])
+        arrow_lines = "\n".join(
+            f'- "{name}" (from "{AP_MODEL_STRUCTURE["arrows"][name]["from"]}" to "{AP_MODEL_STRUCTURE["arrows"][name]["to"]}"): '
+            f'{AP_MODEL_STRUCTURE["arrows"][name]["description"]}'
+            for name in arrows
+        )
+        prompt = f"""
+You are a query generator. Generate ONE search query for EACH of the following AP Model relationships:
+{arrow_lines}
+
+Context:
+- Detailed description: {tech_topic}
+- Time Period: {era_context}
+
+Each query should be designed to find real-world examples or factual data confirming that relationship in that specific era.
+Output in JSON format, one key per relationship name, each value being only the query string:
+{{ {", ".join(f'"{name}": "search query"' for name in arrows)} }}
+"""
+        result = structured_completion(
+            self.client, "query_generation_batch", queries_schema(arrows),
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        if result is None:
+            result = {}  # unusable reply: every arrow falls back to its own query call
+        queries = {}
+        for name in arrows:
+            query = str(result.get(name) or "").strip()
+            if not query:
+                info = AP_MODEL_STRUCTURE["arrows"][name]
+                query = self.generate_question(info["from"], info["to"], tech_topic, era_context)
+            queries[name] = query
+        return queries
+
+    def _search_network(self, query: str) -> str:
+        if self.backend.rate_limited:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        with span("search", "search"):
+            response = self.backend.search(query, max_results=10)
+        current_telemetry().record_latency("search", time.perf_counter() - start)
+        answer = response.get('answer', '')
+        if answer:
+            return answer
+        results = response.get('results', [])
+        if results:
+            return results[0].get('content', "No detailed information found.")
+        return "No information found."
+
+    def search(self, query: str) -> str:
+        """Cached search: near-identical queries are served from the cache or join the one already in flight."""
+        cached = self.cache.get(query, self.backend.name)
+        if cached is not None:
+            current_telemetry().incr("search.cache_hit")
+            return cached
+
+        key = normalize_query(query)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = concurrent.futures.Future()
+        if not leader:
+            current_telemetry().incr("search.deduplicated")
+            return future.result()
+
         try:
-            time.sleep(0.5)  # Avoid hitting rate limits during rapid calls
-            response = self.tavily_client.search(
-                query=query,
-                include_answer="advanced",
-                search_depth="advanced",
-                max_results=10
-            )
-            answer = response.get('answer', '')
-            if answer:
-                return answer
-            results = response.get('results', [])
-            if results:
-                return results[0].get('content', "No detailed information found.")
-            return "No information found."
+            result = self._search_network(query)
+            current_telemetry().incr("search.network")
+            self.cache.put(query, result, self.backend.name)
         except Exception as e:
-            return f"Search failed: {str(e)}"
+            result = f"Search failed: {str(e)}"  # failures are not cached
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+        future.set_result(result)
+        return result
 
-    def synthesize_node_data(self, start_node, target_node, arrow_name, search_result) -> dict:
+    search_tavily = search  # name used before backends were pluggable
+
+    def synthesize_node_data(self, start_node, target_node, arrow_name, search_result) -> dict | None:
         prompt = f"""
 Based on the search result below, summarize the findings for the AP Model Arrow "{arrow_name}"
 (which goes from "{start_node}" to "{target_node}").
@@ -78,12 +181,51 @@ Output in valid JSON format:
     "target_node_content": "Content derived for the object '{target_node}' based on this relationship"
 }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        return structured_completion(
+            self.client, "synthesis", SYNTHESIS_SCHEMA,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+            ]
         )
-        return parse_json_response(response.choices[0].message.content)
+
+    def ground_arrow(self, arrow_name: str, tech_topic: str, era_context: str, query: str = None) -> dict | None:
+        """Query generation (unless `query` is given), search and synthesis for one AP arrow; None if synthesis was unusable."""
+        info = AP_MODEL_STRUCTURE["arrows"][arrow_name]
+        query = query or self.generate_question(info["from"], info["to"], tech_topic, era_context)
+        result = self.search(query)
+        return self.synthesize_node_data(info["from"], info["to"], arrow_name, result)
+
+    def submit_grounding(self, executor, tech_topic: str, era_context: str, arrows: list = None) -> dict:
+        """Start grounding the arrows on `executor` without waiting; returns {arrow_name: Future of synthesis}."""
+        arrows = arrows or list(AP_MODEL_STRUCTURE["arrows"])
+        # Submitted first, so it is picked up before the arrow tasks that wait on it
+        queries = submit_in_context(executor, self.generate_questions, tech_topic, era_context, arrows) if SEARCH_BATCH_QUERIES else None
+
+        def ground(arrow_name):
+            query = queries.result().get(arrow_name) if queries else None
+            return self.ground_arrow(arrow_name, tech_topic, era_context, query)
+
+        return {arrow_name: submit_in_context(executor, ground, arrow_name) for arrow_name in arrows}
+
+    def ground_arrows(self, tech_topic: str, era_context: str, arrows: list = None) -> dict:
+        """Ground all 12 arrows (or the given subset) concurrently; returns {arrow_name: synthesis}."""
+        arrows = arrows or list(AP_MODEL_STRUCTURE["arrows"])
+        findings = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(SEARCH_MAX_WORKERS, len(arrows)) + 1) as executor:
+            future_to_arrow = {
+                future: arrow_name
+                for arrow_name, future in self.submit_grounding(executor, tech_topic, era_context, arrows).items()
+            }
+            for future in concurrent.futures.as_completed(future_to_arrow):
+                arrow_name = future_to_arrow[future]
+                try:
+                    finding = future.result()
+                except Exception as e:
+                    print(f"  [Search] Grounding '{arrow_name}' failed: {e}")
+                    continue
+                if finding is None:
+                    print(f"  [Search] Grounding '{arrow_name}' returned no usable synthesis.")
+                else:
+                    findings[arrow_name] = finding
+        return findings
@@ -1,11 +1,23 @@
 import json
-from config import SYSTEM_PROMPT
-from utils import parse_json_response
+from config import SYSTEM_PROMPT, OBJECT_STRATEGY
+from ap_digest import build_ap_digest
+from llm_client import structured_completion
+from schemas import BRIEF_SCHEMA, REVIEW_SCHEMA, SETTINGS_SCHEMA, OUTLINE_STEP_SCHEMA
+from telemetry import current_telemetry
+from review_policy import ReviewPolicy
+from budget import current_budget
+from tracing import span
 
 CREATIVE_SYSTEM_PROMPT = "You are an award-winning Science Fiction author. Your goal is to write compelling, logical, and creative narratives based on given data."
 
 _MAX_RETRIES = 3
 
+# Hard constraints checked locally before a draft is sent to the Overseer
+_NUM_CHARACTERS = 4
+_MIN_WORLD_VIEW_WORDS = 20
+_OUTLINE_STEP_WORD_RANGE = (50, 200)  # the Outline Agent is asked for ~100 words
+_UNUSABLE_REPLY = "The previous reply was not valid JSON in the requested format; follow the Output Format exactly."
+
 NARRATIVE_STEPS = [
     {"name": "1. Exposition",     "goal": "The story begins in the setting, introducing the characters and the setting of the story."},
     {"name": "2. Rising Action",  "goal": "An event or conflict is introduced and characters begin to face a series of challenges."},
@@ -16,16 +28,20 @@ NARRATIVE_STEPS = [
 
 
 class StoryGenerator:
-    def __init__(self, openai_client):
+    def __init__(self, openai_client, review_policy: ReviewPolicy = None, object_strategy: str = OBJECT_STRATEGY):
         self.client = openai_client
+        # Share one policy across a batch so acceptance rates are learned from every story
+        self.review_policy = review_policy or ReviewPolicy(mode="always")
+        # Strategy the AP model's objects were built with, so Overseer rejections can be compared per strategy
+        self._object_strategy = object_strategy
 
     # ------------------------------------------------------------------ #
     #  Overseer methods (coordination / review)                           #
     # ------------------------------------------------------------------ #
 
-    def _overseer_prepare_brief(self, ap_context_data: dict, target_type: str) -> dict:
+    def _overseer_prepare_brief(self, ap_digest, target_type: str) -> dict:
         print(f"  [Global Overseer] Preparing brief for {target_type}...")
-        ap_context_str = json.dumps(ap_context_data, indent=2, ensure_ascii=False)
+        ap_context_str = ap_digest.for_role("brief")
 
         if target_type == "setting":
             focus_instruction = "Extract ONLY the static elements relevant to World Building."
@@ -49,19 +65,21 @@ Create a **Concept Brief** for the {target_type} Agent.
     "relevant_data_points": "A summary of the specific AP model elements (Nodes/Arrows) that this Agent should focus on."
 }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        brief = structured_completion(
+            self.client, "brief", BRIEF_SCHEMA,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
+            ]
         )
-        return parse_json_response(response.choices[0].message.content)
+        if brief is None:
+            print(f"  [Warning] Brief for {target_type} was unusable; the agent works from its own instructions.")
+            return {}
+        return brief
 
-    def _global_check(self, content_type: str, content_data: dict, context_data, ap_master_data: dict, specific_criteria: str) -> dict:
+    def _global_check(self, content_type: str, content_data: dict, context_data, ap_digest, specific_criteria: str) -> dict | None:
         print(f"  [Global Overseer] Reviewing {content_type}...")
-        ap_master_str = json.dumps(ap_master_data, indent=2, ensure_ascii=False)
+        ap_master_str = ap_digest.for_role("review")
 
         prompt = f"""
 You are an award-winning Science Fiction author and editor. Now your role is a strict **Global Overseer**.
@@ -85,15 +103,13 @@ Your job is to ensure the content follows the logic of the **AP Model** and the
     "feedback": "If approved, keep empty. If rejected, provide specific advice on how to fix the contradiction with the AP Model or the Brief."
 }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        return structured_completion(
+            self.client, "review", REVIEW_SCHEMA,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
+            ]
         )
-        return parse_json_response(response.choices[0].message.content)
 
     # ------------------------------------------------------------------ #
     #  Creative agent methods (generation)                                #
@@ -122,20 +138,18 @@ You are the **Setting Agent**. Your task is to design amazing and creative World
     "characters": [ {{ "name": "...", "role": "...", "motivation": "..." }} ]
 }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        return structured_completion(
+            self.client, "setting", SETTINGS_SCHEMA,
             messages=[
                 {"role": "system", "content": CREATIVE_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+            ]
         )
-        return parse_json_response(response.choices[0].message.content)
 
     def _agent_build_outline_step(self, step_name: str, step_goal: str, settings: dict, plot_brief: dict, current_outline_history: dict, feedback: str = "") -> dict:
         print(f"  [Outline Agent] Drafting {step_name}... {(f'(Fixing: {feedback})' if feedback else '')}")
 
-        history_text = "\n".join([f"{k}: {v['summary']}" for k, v in current_outline_history.items()])
+        history_text = "\n".join([f"{k}: {v.get('summary', '')}" for k, v in current_outline_history.items()])
         settings_str = json.dumps(settings, indent=2, ensure_ascii=False)
         brief_str = json.dumps(plot_brief, indent=2, ensure_ascii=False)
 
@@ -162,41 +176,120 @@ You are the **Outline Agent**. Write the **{step_name}** of the story.
     "summary": "Detailed narrative paragraph of what happens. Focus on character actions and plot progression. (Approx 100 words)."
 }}
 """
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
+        return structured_completion(
+            self.client, "outline", OUTLINE_STEP_SCHEMA,
             messages=[
                 {"role": "system", "content": CREATIVE_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+            ]
         )
-        return parse_json_response(response.choices[0].message.content)
+
+    # ------------------------------------------------------------------ #
+    #  Local pre-checks (structural violations caught without an LLM)     #
+    # ------------------------------------------------------------------ #
+
+    def _precheck_settings(self, settings: dict | None) -> list:
+        if settings is None:
+            return [_UNUSABLE_REPLY]
+        problems = []
+        world_view = str(settings.get('world_view') or '').strip()
+        if not world_view:
+            problems.append("The 'world_view' field is missing or empty.")
+        elif len(world_view.split()) < _MIN_WORLD_VIEW_WORDS:
+            problems.append(f"The 'world_view' is too short; describe the year, background and state of the product in at least {_MIN_WORLD_VIEW_WORDS} words.")
+
+        characters = settings.get('characters')
+        if not isinstance(characters, list) or len(characters) != _NUM_CHARACTERS:
+            count = len(characters) if isinstance(characters, list) else 0
+            problems.append(f"Create EXACTLY {_NUM_CHARACTERS} characters (got {count}).")
+        else:
+            for i, c in enumerate(characters, 1):
+                missing = [k for k in ("name", "role", "motivation") if not str(c.get(k) or '').strip()]
+                if missing:
+                    problems.append(f"Character {i} is missing: {', '.join(missing)}.")
+            names = [str(c.get('name') or '').strip().lower() for c in characters]
+            if len(set(names)) != len(names):
+                problems.append("Every character needs a distinct name.")
+        return problems
+
+    def _precheck_outline_step(self, step_content: dict | None) -> list:
+        if step_content is None:
+            return [_UNUSABLE_REPLY]
+        summary = str(step_content.get('summary') or '').strip()
+        if not summary:
+            return ["The 'summary' field is missing or empty."]
+        words = len(summary.split())
+        low, high = _OUTLINE_STEP_WORD_RANGE
+        if not low <= words <= high:
+            return [f"The summary has {words} words; write approximately 100 words (between {low} and {high})."]
+        return []
+
+    def _flag_settings(self, settings: dict, ap_digest) -> bool:
+        """Cheap risk heuristic: the world view barely uses the vocabulary of the AP model."""
+        ap_words = {w.strip('.,;:()"\'').lower() for w in ap_digest.text.split() if len(w) >= 7}
+        draft_words = {w.strip('.,;:()"\'').lower() for w in json.dumps(settings, ensure_ascii=False).split()}
+        return len(ap_words & draft_words) < 5
+
+    def _flag_outline_step(self, step_content: dict, settings: dict) -> bool:
+        """Cheap risk heuristic: the beat mentions none of the characters by name."""
+        summary = step_content.get('summary', '').lower()
+        names = [str(c.get('name', '')).split()[0].lower() for c in settings.get('characters', []) if str(c.get('name', '')).split()]
+        return bool(names) and not any(n in summary for n in names)
+
+    def _over_budget(self, what: str) -> bool:
+        """Near the story budget, drafts are accepted without further Overseer review."""
+        budget = current_budget()
+        if budget and budget.near_limit():
+            budget.degrade("skip_review")
+            print(f"  [Budget] {what} accepted without Overseer review.")
+            return True
+        return False
+
+    def _record_review(self, role: str, review: dict):
+        approved = bool(review.get('approved'))
+        self.review_policy.record(role, approved)
+        current_telemetry().incr(f"review.{'approved' if approved else 'rejected'}.{self._object_strategy}")
 
     # ------------------------------------------------------------------ #
     #  Approval loops (retry until Overseer approves or retries exhaust)  #
     # ------------------------------------------------------------------ #
 
-    def _build_approved_settings(self, setting_brief: dict, future_context_data: dict) -> dict:
+    def _build_approved_settings(self, setting_brief: dict, ap_digest) -> dict:
         feedback = ""
         criteria = "Check if the 'World View' and 'Characters' logically reflect the Director's Brief AND do not contradict the Future AP Model."
         settings = {}
 
         for _ in range(_MAX_RETRIES):
             settings = self._agent_build_settings(setting_brief, feedback)
+            problems = self._precheck_settings(settings)
+            if problems:
+                current_telemetry().incr("review.skipped_by_precheck.settings")
+                feedback = " ".join(problems)
+                print(f"  [Pre-check] Settings failed structural checks: {feedback}")
+                continue
+            if self._over_budget("Settings"):
+                return settings
+            if not self.review_policy.should_review("settings", self._flag_settings(settings, ap_digest), bool(feedback)):
+                print("  [Review Policy] Settings accepted without Overseer review.")
+                return settings
             review = self._global_check(
                 "Story Settings", settings,
                 json.dumps(setting_brief, ensure_ascii=False),
-                future_context_data, criteria
+                ap_digest, criteria
             )
+            if review is None:
+                print("  [Global Overseer] Review reply was unusable; redrafting settings.")
+                continue
+            self._record_review("settings", review)
             if review.get('approved'):
                 print("  [Global Overseer] Settings Approved.")
                 return settings
             feedback = review.get('feedback', '')
             print(f"  [Global Overseer] Settings Rejected. Feedback: {feedback}")
 
-        return settings  # use last attempt if retries are exhausted
+        return settings or {}  # use last attempt if retries are exhausted
 
-    def _build_approved_outline_step(self, step: dict, settings: dict, plot_brief: dict, outline_so_far: dict, future_context_data: dict) -> dict:
+    def _build_approved_outline_step(self, step: dict, settings: dict, plot_brief: dict, outline_so_far: dict, ap_digest) -> dict:
         feedback = ""
         criteria = "Does this outline step follow the Director's Plot Brief AND remain consistent with the Future AP Model?"
         step_content = {}
@@ -205,8 +298,23 @@ You are the **Outline Agent**. Write the **{step_name}** of the story.
             step_content = self._agent_build_outline_step(
                 step['name'], step['goal'], settings, plot_brief, outline_so_far, feedback
             )
+            problems = self._precheck_outline_step(step_content)
+            if problems:
+                current_telemetry().incr("review.skipped_by_precheck.outline")
+                feedback = " ".join(problems)
+                print(f"  [Pre-check] {step['name']} failed structural checks: {feedback}")
+                continue
+            if self._over_budget(step['name']):
+                return step_content
+            if not self.review_policy.should_review("outline", self._flag_outline_step(step_content, settings), bool(feedback)):
+                print(f"  [Review Policy] {step['name']} accepted without Overseer review.")
+                return step_content
             context_for_review = f"PLOT BRIEF: {json.dumps(plot_brief)}\nPREVIOUS PLOT: {json.dumps(outline_so_far)}"
-            review = self._global_check(step['name'], step_content, context_for_review, future_context_data, criteria)
+            review = self._global_check(step['name'], step_content, context_for_review, ap_digest, criteria)
+            if review is None:
+                print(f"  [Global Overseer] Review reply was unusable; redrafting {step['name']}.")
+                continue
+            self._record_review("outline", review)
 
             if review.get('approved'):
                 print(f"  [Global Overseer] {step['name']} Approved.")
@@ -214,38 +322,44 @@ You are the **Outline Agent**. Write the **{step_name}** of the story.
             feedback = review.get('feedback', '')
             print(f"  [Global Overseer] {step['name']} Rejected. Feedback: {feedback}")
 
-        return step_content  # use last attempt if retries are exhausted
+        return step_content or {}  # use last attempt if retries are exhausted
 
     # ------------------------------------------------------------------ #
     #  Main entry point                                                   #
     # ------------------------------------------------------------------ #
 
-    def generate_outline(self, ap_data_dict: dict) -> str:
-        print("\n=== Starting Multi-Agent Story Generation ===")
-        future_context_data = ap_data_dict.get("Stage 3", ap_data_dict)
-
-        # Phase 1: Build and verify world settings
-        setting_brief = self._overseer_prepare_brief(future_context_data, "setting")
-        print(f"  > Setting Brief: {setting_brief.get('briefing_theme', 'Unknown Theme')}")
-        settings = self._build_approved_settings(setting_brief, future_context_data)
-        if not settings:
-            return "Error: Settings generation failed."
-
-        # Phase 2: Build each narrative beat sequentially
-        plot_brief = self._overseer_prepare_brief(future_context_data, "outline")
-        print(f"  > Plot Brief: {plot_brief.get('briefing_theme', 'Unknown Theme')}")
-        final_outline_steps = {}
-        for step in NARRATIVE_STEPS:
-            print(f"\n-- Processing {step['name']} --")
-            final_outline_steps[step['name']] = self._build_approved_outline_step(
-                step, settings, plot_brief, final_outline_steps, future_context_data
-            )
-
-        # Phase 3: Compile the 5 paragraphs into the final story text
-        print("\n=== Compiling Final Story ===")
-        paragraphs = [
-            final_outline_steps[step['name']].get('summary', '').strip()
-            for step in NARRATIVE_STEPS
-            if final_outline_steps.get(step['name'], {}).get('summary', '').strip()
-        ]
-        return "\n\n".join(paragraphs)
+    def generate_outline(self, ap_data_dict: dict, ap_digest=None) -> str:
+        with span("story_stage"):
+            print("\n=== Starting Multi-Agent Story Generation ===")
+            future_context_data = ap_data_dict.get("Stage 3", ap_data_dict)
+            # Serialise the AP model once; every brief and review below reuses it
+            ap_digest = ap_digest or build_ap_digest(future_context_data, self.client)
+
+            # Phase 1: Build and verify world settings
+            with span("settings phase"):
+                setting_brief = self._overseer_prepare_brief(ap_digest, "setting")
+                print(f"  > Setting Brief: {setting_brief.get('briefing_theme', 'Unknown Theme')}")
+                settings = self._build_approved_settings(setting_brief, ap_digest)
+            if not settings:
+                return "Error: Settings generation failed."
+
+            # Phase 2: Build each narrative beat sequentially
+            with span("outline phase"):
+                plot_brief = self._overseer_prepare_brief(ap_digest, "outline")
+                print(f"  > Plot Brief: {plot_brief.get('briefing_theme', 'Unknown Theme')}")
+                final_outline_steps = {}
+                for step in NARRATIVE_STEPS:
+                    print(f"\n-- Processing {step['name']} --")
+                    with span(step['name'], "beat"):
+                        final_outline_steps[step['name']] = self._build_approved_outline_step(
+                            step, settings, plot_brief, final_outline_steps, ap_digest
+                        )
+
+            # Phase 3: Compile the 5 paragraphs into the final story text
+            print("\n=== Compiling Final Story ===")
+            paragraphs = [
+                final_outline_steps[step['name']].get('summary', '').strip()
+                for step in NARRATIVE_STEPS
+                if final_outline_steps.get(step['name'], {}).get('summary', '').strip()
+            ]
+            return "\n\n".join(paragraphs)
@@ -0,0 +1,164 @@
+import contextlib
+import contextvars
+import json
+import math
+import threading
+from collections import defaultdict
+
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile of a list of numbers (None if the list is empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Telemetry:
+    """Thread-safe collector for per-role call latencies and event counters.
+
+    A single module-level instance (TELEMETRY) is shared by every builder and
+    generator in the process, so batch runs aggregate across all stories.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)  # role -> [seconds]
+        self.counters = defaultdict(int)    # counter name -> count
+
+    def record_latency(self, role: str, seconds: float):
+        with self._lock:
+            self.latencies[role].append(seconds)
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def sample_count(self, role: str) -> int:
+        with self._lock:
+            return len(self.latencies.get(role, []))
+
+    def latency_percentile(self, role: str, pct: float):
+        with self._lock:
+            values = list(self.latencies.get(role, []))
+        return percentile(values, pct)
+
+    def reset(self):
+        with self._lock:
+            self.latencies.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "latencies": {k: list(v) for k, v in self.latencies.items()},
+                "counters": dict(self.counters),
+            }
+
+    def save(self, path: str):
+        """Export raw latencies and counters as JSON for offline analysis."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def report(self) -> str:
+        """Human-readable summary of call latencies, hedging and structured-output failures."""
+        with self._lock:
+            latencies = {k: list(v) for k, v in self.latencies.items()}
+            counters = dict(self.counters)
+
+        lines = ["[Telemetry] Call latency by role (seconds):"]
+        for role in sorted(r for r in latencies if not r.startswith(("primary:", "phase.", "profile:"))):
+            values = latencies[role]
+            lines.append(
+                f"  {role:<16} n={len(values):<5} p50={percentile(values, 50):.2f} "
+                f"p95={percentile(values, 95):.2f} p99={percentile(values, 99):.2f}"
+            )
+
+        hedged_roles = sorted({k.split(".", 2)[2] for k in counters if k.startswith("hedge.eligible.")})
+        if hedged_roles:
+            lines.append("[Telemetry] Hedging:")
+            total_eligible = sum(counters.get(f"hedge.eligible.{r}", 0) for r in hedged_roles)
+            total_sent = sum(counters.get(f"hedge.sent.{r}", 0) for r in hedged_roles)
+            for role in hedged_roles:
+                eligible = counters.get(f"hedge.eligible.{role}", 0)
+                sent = counters.get(f"hedge.sent.{role}", 0)
+                won = counters.get(f"hedge.won.{role}", 0)
+                # The primary request always runs to completion in the background,
+                # so its latency is what the call would have cost without hedging.
+                p99_unhedged = percentile(latencies.get(f"primary:{role}", []), 99)
+                p99_observed = percentile(latencies.get(role, []), 99)
+                improvement = ""
+                if p99_unhedged is not None and p99_observed is not None:
+                    improvement = f" p99 {p99_unhedged:.2f}s -> {p99_observed:.2f}s"
+                lines.append(
+                    f"  {role:<16} hedge rate={sent / eligible if eligible else 0:.1%} "
+                    f"({sent}/{eligible}, {won} won){improvement}"
+                )
+            lines.append(f"  overall hedge rate={total_sent / total_eligible if total_eligible else 0:.1%}")
+
+        structured_roles = sorted({k.split(".", 2)[2] for k in counters if k.startswith("structured.")})
+        if structured_roles:
+            lines.append("[Telemetry] Structured output failures by role:")
+            for role in structured_roles:
+                lines.append(
+                    f"  {role:<16} parse={counters.get(f'structured.parse_failure.{role}', 0)} "
+                    f"schema={counters.get(f'structured.schema_failure.{role}', 0)} "
+                    f"repaired={counters.get(f'structured.repaired.{role}', 0)} "
+                    f"unrecovered={counters.get(f'structured.unrecovered.{role}', 0)}"
+                )
+
+        models = sorted(k.split(":", 1)[1] for k in latencies if k.startswith("profile:"))
+        if models:
+            lines.append("[Telemetry] Latency and cost by model profile:")
+            for model in models:
+                values = latencies[f"profile:{model}"]
+                cost = counters.get(f"cost_micro_usd.{model}", 0) / 1e6
+                lines.append(
+                    f"  {model:<16} calls={len(values)} mean={sum(values) / len(values):.2f}s "
+                    f"p95={percentile(values, 95):.2f}s cost=${cost:.4f}"
+                )
+
+        strategies = sorted({k.split(".", 2)[2] for k in latencies if k.startswith("phase.objects.")}
+                            | {k.split(".", 2)[2] for k in counters if k.startswith(("review.approved.", "review.rejected."))})
+        if strategies:
+            lines.append("[Telemetry] Object strategy comparison:")
+            for strategy in strategies:
+                phase = latencies.get(f"phase.objects.{strategy}", [])
+                approved = counters.get(f"review.approved.{strategy}", 0)
+                rejected = counters.get(f"review.rejected.{strategy}", 0)
+                reviews = approved + rejected
+                lines.append(
+                    f"  {strategy:<16} object phase mean={sum(phase) / len(phase) if phase else 0:.1f}s (n={len(phase)}) "
+                    f"overseer rejection rate={rejected / reviews if reviews else 0:.1%} ({rejected}/{reviews})"
+                )
+
+        skipped = {k.rsplit(".", 1)[1]: v for k, v in counters.items() if k.startswith("review.skipped_by_precheck.")}
+        if skipped:
+            lines.append("[Telemetry] Overseer reviews skipped by local pre-checks: "
+                         + ", ".join(f"{k}={v}" for k, v in sorted(skipped.items())))
+        return "\n".join(lines)
+
+
+TELEMETRY = Telemetry()
+
+_current = contextvars.ContextVar("telemetry", default=None)
+
+
+def current_telemetry() -> Telemetry:
+    """The collector LLM calls in this context record into (TELEMETRY unless overridden)."""
+    return _current.get() or TELEMETRY
+
+
+@contextlib.contextmanager
+def use_telemetry(telemetry: Telemetry):
+    """Record into a private collector in this context, e.g. for a dry run that must not skew live telemetry."""
+    token = _current.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _current.reset(token)
@@ -0,0 +1,125 @@
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+_current_tracer = contextvars.ContextVar("tracer", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+
+class Tracer:
+    """Collects timed spans for one story and exports them as Chrome Trace Event JSON.
+
+    Spans nest through a context variable, so spans opened on worker threads
+    (submitted with budget.submit_in_context) keep their parent. Open the
+    resulting file in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "stage", **args):
+        span_id = next(self._ids)
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append({
+                    "id": span_id, "parent": parent, "name": name, "cat": cat,
+                    "start": start - self._origin, "end": end - self._origin,
+                    "tid": threading.get_ident(), "args": args,
+                })
+
+    def critical_path(self) -> set:
+        """Ids of the spans on the longest dependent chain.
+
+        Starting from the end of each parent, walk backwards picking the child
+        that finished last before the cursor; its start becomes the new cursor.
+        Children run in parallel with the chosen one are, by definition, not
+        on the critical path.
+        """
+        children = {}
+        for s in self.spans:
+            children.setdefault(s["parent"], []).append(s)
+        critical = set()
+
+        def walk(parent_id, cursor):
+            candidates = sorted(children.get(parent_id, []), key=lambda s: s["end"], reverse=True)
+            while True:
+                chosen = next((s for s in candidates if s["end"] <= cursor + 1e-9), None)
+                if chosen is None:
+                    return
+                critical.add(chosen["id"])
+                walk(chosen["id"], chosen["end"])
+                cursor = chosen["start"]
+                candidates = [s for s in candidates if s["end"] <= cursor + 1e-9]
+
+        with self._lock:
+            end = max((s["end"] for s in self.spans), default=0.0)
+        walk(None, end)
+        return critical
+
+    def critical_path_summary(self) -> list:
+        """(name, total seconds) of critical spans, longest first; only leaf-level time is counted."""
+        critical = self.critical_path()
+        parents = {s["parent"] for s in self.spans if s["id"] in critical}
+        totals = {}
+        for s in self.spans:
+            if s["id"] in critical and s["id"] not in parents:
+                totals[s["name"]] = totals.get(s["name"], 0.0) + s["end"] - s["start"]
+        return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+
+    def to_chrome_trace(self) -> dict:
+        critical = self.critical_path()
+        tids = {}
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.name}}]
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        for s in spans:
+            tid = tids.setdefault(s["tid"], len(tids) + 1)
+            events.append({
+                "name": s["name"], "cat": s["cat"] + (",critical" if s["id"] in critical else ""),
+                "ph": "X", "pid": 1, "tid": tid,
+                "ts": round(s["start"] * 1e6), "dur": round((s["end"] - s["start"]) * 1e6),
+                "args": {**s["args"], "critical_path": s["id"] in critical},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}.trace.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+        summary = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.critical_path_summary()[:5])
+        print(f"  [Trace] Saved {path}. Critical path leaders: {summary}")
+        return path
+
+
+@contextlib.contextmanager
+def use_tracer(tracer):
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def span(name: str, cat: str = "stage", **args):
+    """Span on the active tracer, or a no-op when tracing is off."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, cat, **args)
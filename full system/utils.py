@@ -1,15 +1,30 @@
+import hashlib
 import json
 import re
 
-def parse_json_response(gpt_output: str) -> dict:
+def _strip_code_fence(gpt_output: str) -> str:
     result_str = gpt_output.strip()
     # GPT sometimes wraps JSON in markdown code blocks, so strip them if present
     if result_str.startswith("```") and result_str.endswith("```"):
         result_str = re.sub(r'^```[^\n]*\n', '', result_str)
         result_str = re.sub(r'\n```$', '', result_str)
         result_str = result_str.strip()
+    return result_str
+
+def try_parse_json(gpt_output: str):
+    """Return (parsed, error). `parsed` is None and `error` describes the problem on failure."""
     try:
-        return json.loads(result_str)
-    except json.JSONDecodeError:
-        print(f"JSON Parsing Error. Raw output:\n{result_str}")
+        return json.loads(_strip_code_fence(gpt_output or "")), None
+    except json.JSONDecodeError as e:
+        return None, f"Invalid JSON: {e}"
+
+def parse_json_response(gpt_output: str) -> dict:
+    parsed, _ = try_parse_json(gpt_output)
+    if parsed is None:
+        print(f"JSON Parsing Error. Raw output:\n{_strip_code_fence(gpt_output or '')}")
         return {}
+    return parsed
+
+def content_hash(data) -> str:
+    """Stable SHA-256 of a JSON-serialisable object (key order does not matter)."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
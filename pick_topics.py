@@ -1,12 +1,14 @@
+import os
 import numpy as np
 from openai import OpenAI
 from sklearn.metrics.pairwise import cosine_similarity
 
 # ================= 配置区域 =================
 API_KEY = "sk-xxxxxxxxxxxxxxxxxxxxxxxx" # your api
+BASE_URL = os.environ.get("OPENAI_BASE_URL") # 可指向本地故障注入服务器, 如 http://127.0.0.1:8900/v1
 # ===========================================
 
-client = OpenAI()
+client = OpenAI(base_url=BASE_URL)
 
 # 1. 准备 100 个常见的日常物品单词 (模拟输入)
 words_pool = [
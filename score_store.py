@@ -0,0 +1,75 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# 每个故事的评分按 (内容哈希, 评估模型, 提示词版本) 存储
+# 重新运行时只评估新增或修改过的故事, 中断后可从断点继续
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    path TEXT,
+    theme TEXT,
+    scores TEXT NOT NULL,      -- JSON: 六个维度的分数
+    raw_output TEXT,          -- 评估模型的原始输出
+    expected TEXT,            -- JSON: 由 logprobs 得到的每个维度的期望分数和标准差 (可为空)
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_hash, model, prompt_version)
+);
+"""
+
+
+def story_hash(story_content):
+    """故事正文的 sha256 (去掉首尾空白)"""
+    return hashlib.sha256(story_content.strip().encode("utf-8")).hexdigest()
+
+
+class ScoreStore:
+    """SQLite 评分库, 每个评分结果写入后立即提交, 可多线程共用"""
+
+    def __init__(self, path="evaluation_scores.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(scores)")}
+            if "expected" not in columns: # 旧版评分库
+                self._conn.execute("ALTER TABLE scores ADD COLUMN expected TEXT")
+
+    def get(self, content_hash, model, prompt_version):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM scores WHERE content_hash = ? AND model = ? AND prompt_version = ?",
+                (content_hash, model, prompt_version)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**dict(row), "scores": json.loads(row["scores"]),
+                "expected": json.loads(row["expected"]) if row["expected"] else None}
+
+    def scored_hashes(self, model, prompt_version):
+        """已评估过的内容哈希集合, 用于一次性过滤待评估文件"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content_hash FROM scores WHERE model = ? AND prompt_version = ?", (model, prompt_version)
+            ).fetchall()
+        return {r["content_hash"] for r in rows}
+
+    def put(self, content_hash, model, prompt_version, scores, raw_output=None, path=None, theme=None, expected=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scores "
+                "(content_hash, model, prompt_version, path, theme, scores, raw_output, expected, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, model, prompt_version, path, theme, json.dumps(scores), raw_output,
+                 json.dumps(expected) if expected else None, time.time())
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
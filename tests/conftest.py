@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Root scripts and the "full system" modules import their siblings by module name
+sys.path[:0] = [ROOT, os.path.join(ROOT, "full system")]
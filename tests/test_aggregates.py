@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from aggregates import GroupedStats, RunningStats
+
+
+def filled(values, weights):
+    stats = RunningStats(weights.shape[1])
+    for value, w in zip(values, weights):
+        stats.add(value, w)
+    return stats
+
+
+def test_running_mean_and_variance_match_numpy():
+    rng = np.random.default_rng(1)
+    values = rng.normal(3.0, 1.5, 200)
+    stats = filled(values, rng.poisson(1.0, (200, 10)))
+    assert stats.n == 200
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.variance == pytest.approx(values.var(ddof=1))
+
+
+def test_merge_equals_adding_everything_to_one():
+    rng = np.random.default_rng(2)
+    values = rng.uniform(1, 5, 150)
+    weights = rng.poisson(1.0, (150, 50)).astype(float)
+    whole = filled(values, weights)
+    left, right = filled(values[:40], weights[:40]), filled(values[40:], weights[40:])
+    left.merge(right)
+    assert left.n == whole.n
+    assert left.mean == pytest.approx(whole.mean)
+    assert left.variance == pytest.approx(whole.variance)
+    assert left.confidence_interval() == pytest.approx(whole.confidence_interval())
+
+
+def test_merge_with_empty_stats():
+    stats = filled([2.0, 4.0], np.ones((2, 5)))
+    stats.merge(RunningStats(5))
+    assert (stats.n, stats.mean, stats.variance) == (2, 3.0, 2.0)
+    empty = RunningStats(5)
+    empty.merge(stats)
+    assert (empty.n, empty.mean, empty.variance) == (2, 3.0, 2.0)
+
+
+def test_bootstrap_interval_covers_the_mean_and_matches_normal_width():
+    rng = np.random.default_rng(3)
+    values = rng.normal(10.0, 2.0, 400)
+    stats = filled(values, rng.poisson(1.0, (400, 2000)))
+    low, high = stats.confidence_interval(0.95)
+    assert low < values.mean() < high
+    # Percentile bootstrap of a mean: close to +-1.96 standard errors
+    assert (high - low) / 2 == pytest.approx(1.96 * values.std(ddof=1) / np.sqrt(400), rel=0.15)
+
+
+def test_interval_without_observations_is_the_mean():
+    assert RunningStats(10).confidence_interval() == (0.0, 0.0)
+
+
+def test_grouped_rollup_combines_groups():
+    grouped = GroupedStats(resamples=200, seed=0)
+    for value in (1, 2, 3):
+        grouped.add(("baseline", "Grocery"), {"Relevance": value})
+    for value in (4, 5):
+        grouped.add(("baseline", "Soccer"), {"Relevance": value})
+    grouped.add(("full_system", "Grocery"), {"Relevance": 5})
+    grouped.rollup(lambda group: (group[0], "ALL"))
+    overall = grouped.get(("baseline", "ALL"), "Relevance")
+    assert (overall.n, overall.mean) == (5, 3.0)
+    assert overall.variance == pytest.approx(2.5)
+    assert grouped.get(("full_system", "ALL"), "Relevance").n == 1
+    rows = {(group, metric): row for group, metric, *row in grouped.rows()}
+    assert rows[(("baseline", "ALL"), "Relevance")][:2] == [5, 3.0]
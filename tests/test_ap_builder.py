@@ -0,0 +1,93 @@
+import pytest
+from ap_builder import APBuilder
+from config import AP_MODEL_STRUCTURE
+
+
+def test_affected_elements_adds_arrows_touching_an_invalidated_object():
+    affected = APBuilder.affected_elements(["Institutions"])
+    expected_arrows = {
+        name for name, info in AP_MODEL_STRUCTURE["arrows"].items()
+        if "Institutions" in (info["from"], info["to"])
+    }
+    assert affected == {"Institutions"} | expected_arrows
+    assert {"Media", "Standardization", "Habituation", "Business Ecosystem"} <= affected
+    assert "Communication" not in affected
+
+
+def test_affected_elements_arrow_only_does_not_cascade():
+    assert APBuilder.affected_elements(["Media"]) == {"Media"}
+
+
+def test_affected_elements_nothing_invalidated():
+    assert APBuilder.affected_elements([]) == set()
+
+
+def test_affected_elements_rejects_unknown_names():
+    with pytest.raises(ValueError, match="Unknown AP elements"):
+        APBuilder.affected_elements(["Institutions", "Not An Element"])
+
+
+def test_failed_build_still_shuts_down_grounding():
+    class Pool:
+        shut_down = False
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            self.shut_down = True
+
+    def fail(topic):
+        raise RuntimeError("persona hire failed")
+
+    pool = Pool()
+    builder = APBuilder(None)
+    builder._start_grounding = lambda topic: pool
+    builder._grounding = {"Media": object()}
+    builder.agent_manager.generate_agents = fail
+    with pytest.raises(RuntimeError):
+        builder.generate_future_stage_multi_agent("Grocery")
+    assert pool.shut_down
+    assert builder._grounding == {}
+
+
+def full_model():
+    return {
+        "stage": "Stage 3",
+        "nodes": {name: f"old {name}" for name in AP_MODEL_STRUCTURE["objects"]},
+        "arrows": [
+            {"source": info["from"], "target": info["to"], "type": name, "definition": f"old {name}"}
+            for name, info in AP_MODEL_STRUCTURE["arrows"].items()
+        ],
+    }
+
+
+def test_rebuild_reports_reused_and_recomputed_elements():
+    builder = APBuilder(None)
+    original_agents = [{"name": "Builder's own"}]
+    builder.agent_manager.agents = original_agents
+    contexts = {}
+
+    def generate(element_type, element_desc, topic, full_context_str):
+        contexts[element_type] = (full_context_str, builder.agent_manager.agents)
+        return f"new {element_type}"
+
+    builder.agent_manager.run_multi_agent_generation = generate
+    model = full_model()
+    new_model, report = builder.rebuild_elements(model, "Grocery", ["Institutions"], agents=[{"name": "Original"}])
+
+    affected = APBuilder.affected_elements(["Institutions"])
+    everything = AP_MODEL_STRUCTURE["objects"] + list(AP_MODEL_STRUCTURE["arrows"])
+    assert report == {
+        "recomputed": [e for e in everything if e in affected],
+        "reused": [e for e in everything if e not in affected],
+    }
+    assert new_model["nodes"]["Institutions"] == "new Object: Institutions"
+    assert all(new_model["nodes"][name] == f"old {name}" for name in AP_MODEL_STRUCTURE["objects"] if name != "Institutions")
+    assert [a["type"] for a in new_model["arrows"]] == list(AP_MODEL_STRUCTURE["arrows"])
+    for arrow in new_model["arrows"]:
+        expected = f"new Arrow: {arrow['type']}" if arrow["type"] in affected else f"old {arrow['type']}"
+        assert arrow["definition"] == expected
+    assert model == full_model()  # the input model is not modified
+
+    context, agents = contexts["Object: Institutions"]
+    assert "old Institutions" not in context and "old Social Issues" in context
+    assert agents == [{"name": "Original"}]
+    assert builder.agent_manager.agents is original_agents
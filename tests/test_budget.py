@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import budget as budget_module
+from budget import Budget
+
+
+def test_degrade_records_each_kind_once(capsys):
+    budget = Budget(max_tokens=100)
+    budget.charge(90)
+    budget.degrade("skip_review")
+    budget.degrade("skip_review")
+    budget.degrade("fewer_iterations")
+    assert budget.degradations == ["skip_review", "fewer_iterations"]
+    assert budget.summary()["degradations"] == ["skip_review", "fewer_iterations"]
+    assert capsys.readouterr().out.count("skip_review") == 1
+
+
+def test_degrade_reports_usage_including_parent(capsys):
+    batch = Budget(max_tokens=1000)
+    story = Budget(max_tokens=10_000, parent=batch)
+    story.charge(900)
+    assert batch.tokens == 900
+    assert story.near_limit()
+    story.degrade("skip_review")
+    assert "90% of budget used" in capsys.readouterr().out
+    assert batch.degradations == []
+
+
+def test_unlimited_budget_never_near_limit():
+    budget = Budget()
+    budget.charge(10 ** 9)
+    assert budget.usage_fraction() == 0.0
+    assert not budget.near_limit()
+
+
+def test_restart_clock_leaves_earlier_time_out(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(budget_module, "time", SimpleNamespace(perf_counter=lambda: now[0]))
+    budget = Budget(max_seconds=60)
+    now[0] += 50  # e.g. queued between pipeline stages
+    assert budget.near_limit()
+    budget.restart_clock()
+    now[0] += 10
+    assert budget.elapsed() == 10
+    assert not budget.near_limit()
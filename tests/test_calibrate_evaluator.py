@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from calibrate_evaluator import bootstrap_metrics, kendall_tau_b, pearson, spearman
+
+
+def scores(rng, n, columns):
+    """Evaluator-like data: half-point gold, integer predictions, many ties."""
+    gold = np.round(rng.uniform(1, 5, (n, columns)) * 2) / 2
+    pred = np.clip(np.round(gold + rng.normal(0, 1, (n, columns))), 1, 5)
+    return gold, pred
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_kendall_tau_b_matches_scipy(seed):
+    rng = np.random.default_rng(seed)
+    gold, pred = scores(rng, 60, 4)
+    tau = kendall_tau_b(gold, pred)
+    for k in range(4):
+        assert tau[k] == pytest.approx(stats.kendalltau(gold[:, k], pred[:, k], variant="b").statistic)
+
+
+def test_kendall_tau_b_on_resample_counts_matches_scipy_on_materialised_resamples():
+    rng = np.random.default_rng(7)
+    gold, pred = scores(rng, 30, 2)
+    indices = rng.integers(0, 30, size=(5, 30))
+    tau = bootstrap_metrics(gold, pred, indices)["kendall"]
+    for b, rows in enumerate(indices):
+        for k in range(2):
+            expected = stats.kendalltau(gold[rows, k], pred[rows, k], variant="b").statistic
+            assert tau[b, k] == pytest.approx(expected)
+
+
+def test_kendall_tau_b_undefined_for_a_constant_column():
+    gold = np.array([[1.0], [2.0], [3.0]])
+    assert np.isnan(kendall_tau_b(gold, np.ones_like(gold))[0])
+
+
+def test_pearson_and_spearman_match_scipy():
+    rng = np.random.default_rng(11)
+    gold, pred = scores(rng, 50, 3)
+    for k in range(3):
+        assert pearson(gold, pred)[k] == pytest.approx(stats.pearsonr(gold[:, k], pred[:, k]).statistic)
+        assert spearman(gold, pred)[k] == pytest.approx(stats.spearmanr(gold[:, k], pred[:, k]).statistic)
@@ -0,0 +1,289 @@
+import asyncio
+import csv
+import math
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import evaluate
+from evaluate import AdaptiveLimiter, CRITERIA, expected_scores, load_hanna_stories, make_packs, match_hanna_story, parse_packed_scores
+
+
+# ==================== AdaptiveLimiter ====================
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_slow_start_adds_one_per_success():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=4, minimum=4, maximum=100, target_latency=30)
+        for _ in range(6):
+            await limiter.acquire()
+            await limiter.release(latency=1.0)
+        return limiter
+    limiter = run(scenario())
+    assert limiter.limit == 10
+    assert limiter.slow_start
+
+
+def test_throttle_halves_once_per_round_trip_then_grows_additively():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=40, minimum=4, maximum=100, target_latency=30)
+        for _ in range(2):
+            await limiter.acquire()
+        await limiter.release(latency=2.0, throttled=True)
+        await limiter.release(latency=2.0, throttled=True)  # same round trip: no second cut
+        assert limiter.limit == 20 and not limiter.slow_start
+        for _ in range(20):
+            await limiter.acquire()
+            await limiter.release(latency=1.0)
+        return limiter
+    limiter = run(scenario())
+    # Congestion avoidance: about +1 per round of `limit` successes
+    assert 20.9 < limiter.limit < 21.1
+
+
+def test_limit_stays_within_bounds():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=5, minimum=4, maximum=6, target_latency=30)
+        for _ in range(10):
+            await limiter.acquire()
+            await limiter.release(latency=1.0)
+        assert limiter.limit == 6
+        limiter._last_decrease = -math.inf
+        await limiter.acquire()
+        await limiter.release(latency=1.0, throttled=True)
+        return limiter
+    assert run(scenario()).limit == 4
+
+
+def test_slow_response_ends_slow_start_without_growth():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=4, target_latency=30)
+        await limiter.acquire()
+        await limiter.release(latency=45.0)
+        return limiter
+    limiter = run(scenario())
+    assert limiter.limit == 4 and not limiter.slow_start
+
+
+def test_waiters_are_woken_one_per_free_slot_in_order():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=2)
+        await limiter.acquire()
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(n)) for n in "abc"]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 2 and len(limiter._waiters) == 3
+        await limiter.release(latency=1.0)
+        await asyncio.sleep(0)
+        assert order == ["a"] and limiter.in_flight == 2
+        await limiter.release(latency=1.0)
+        await limiter.release(latency=1.0)
+        await asyncio.gather(*tasks)
+        return order, limiter
+    order, limiter = run(scenario())
+    assert order == ["a", "b", "c"]
+    assert limiter.in_flight == 2
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+        await limiter.acquire()
+        pending = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        pending.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        await limiter.release(latency=1.0)
+        return limiter
+    limiter = run(scenario())
+    assert limiter.in_flight == 0 and not limiter._waiters
+
+
+
+class CountingLimiter(AdaptiveLimiter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decreases = 0
+
+    async def release(self, latency, throttled=False):
+        before = self.limit
+        await super().release(latency, throttled)
+        self.decreases += self.limit < before
+
+
+class FlakyClient:
+    """AsyncOpenAI stand-in: raises the given errors first, then answers with valid scores."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        text = "\n".join(f"{c}: 4" for c in CRITERIA)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), logprobs=None)])
+
+
+class MemoryStore:
+    def __init__(self):
+        self.rows = {}
+
+    def put(self, content_hash, model, version, scores, *args):
+        self.rows[content_hash] = scores
+
+
+def rate_limit_error():
+    # Built without an HTTP response; evaluate.py only looks at the status code
+    error = openai.RateLimitError.__new__(openai.RateLimitError)
+    error.status_code = 429
+    return error
+
+
+def test_async_client_leaves_retries_to_the_limiter(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    assert evaluate.make_async_client().max_retries == 0
+
+
+def test_one_429_causes_exactly_one_limiter_decrease(monkeypatch):
+    monkeypatch.setattr(evaluate.random, "uniform", lambda a, b: 0.0)  # no backoff sleep
+    client = FlakyClient([rate_limit_error()])
+    limiter = CountingLimiter(initial=40, minimum=4, maximum=100)
+    store = MemoryStore()
+    item = {"hash": "h", "path": "story.txt", "theme": "Grocery", "filename": "story.txt"}
+    scored, failed, requeue = asyncio.run(evaluate.evaluate_pack_async(client, [(item, "text")], limiter, store, "v1"))
+    assert scored == [item] and failed == [] and requeue == []
+    assert client.requests == 2
+    assert limiter.decreases == 1
+    assert limiter.limit == pytest.approx(20 + 1 / 20)
+    assert limiter.in_flight == 0
+
+# ==================== Packed evaluation ====================
+
+def block(number, scores=(4, 3, 5, 2, 4, 3), header="Story {}:"):
+    lines = [header.format(number)] + [f"{c}: {s}" for c, s in zip(CRITERIA, scores)]
+    return "\n".join(lines)
+
+
+def test_parse_packed_scores_in_order():
+    text = "\n\n".join([block(1), block(2, (1, 2, 3, 4, 5, 5))])
+    first, second = parse_packed_scores(text, 2)
+    assert first == dict(zip(CRITERIA, (4, 3, 5, 2, 4, 3)))
+    assert second == dict(zip(CRITERIA, (1, 2, 3, 4, 5, 5)))
+
+
+def test_parse_packed_scores_accepts_markdown_headers_and_any_order():
+    text = "\n".join([block(2, header="**Story {}**"), block(1, header="### Story {}.")])
+    assert all(parse_packed_scores(text, 2))
+
+
+def test_parse_packed_scores_marks_missing_incomplete_and_duplicate_blocks():
+    incomplete = "Story 2:\nRelevance: 4\nCoherence: 3"
+    text = "\n".join([block(1), incomplete, block(3), block(3)])
+    assert parse_packed_scores(text, 4) == [dict(zip(CRITERIA, (4, 3, 5, 2, 4, 3))), None, None, None]
+
+
+def test_parse_packed_scores_rejects_misaligned_numbering():
+    text = "\n".join([block(1), block(2), block(3)])
+    assert parse_packed_scores(text, 2) == [None, None]
+
+
+def test_parse_packed_scores_without_blocks():
+    assert parse_packed_scores(block(1).split("\n", 1)[1], 3) == [None, None, None]
+
+
+def test_make_packs_never_mixes_conditions_or_themes():
+    items = [
+        {"condition": condition, "theme": theme, "content": f"{condition} {theme} {i}"}
+        for condition in ("baseline", "full_system_A3_I3")
+        for theme in ("Grocery", "Soccer")
+        for i in range(3)
+    ]
+    packs = make_packs(items, 2)
+    assert len(packs) == 8
+    for pack in packs:
+        assert len({(item["condition"], item["theme"]) for item, _ in pack}) == 1
+        assert all(content == item["content"] for item, content in pack)
+
+
+def test_hanna_reference_records_match_full_stories(tmp_path):
+    path = tmp_path / "hanna.csv"
+    header = ["Story ID", "Prompt", "Human", "Story", "Model"] + CRITERIA
+    rows = [
+        ["1", "A dragon opens a bakery in a small town and nobody notices for years.", "", "Story one.", "GPT-2"] + r
+        for r in (["4", "3", "2", "5", "4", "3"], ["4", "4", "2", "4", "4", "3"], ["3", "3", "2", "4", "4", "3"])
+    ] + [
+        ["2", "A dragon opens a bakery in a small town and nobody notices for years.", "", "Story two.", "BertGeneration"] + r
+        for r in (["1", "1", "1", "1", "1", "1"],) * 3
+    ]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows([header] + rows)
+
+    stories = load_hanna_stories(str(path))
+    assert stories["1"]["gold"]["relevance"] == 3.7 and stories["2"]["gold"]["surprise"] == 1.0
+    snippet = "Writing Prompt:\nA dragon opens a bakery in a small town and..."
+    gold = {"relevance": 3.7, "coherence": 3.3, "empathy": 2.0, "surprise": 4.3, "engagement": 4.0, "complexity": 3.0}
+    assert match_hanna_story(snippet, gold, stories) == "1"
+    assert match_hanna_story(snippet, {c: 5.0 for c in gold}, stories) is None
+    assert match_hanna_story("Writing Prompt:\nSomething else...", gold, stories) is None
+
+
+# ==================== Logprob scores ====================
+
+def tokenize_response(lines):
+    """[(text, {alternative: probability})] -> (response text, logprob tokens as returned by the API)"""
+    tokens = [
+        SimpleNamespace(token=text, top_logprobs=[
+            SimpleNamespace(token=alt, logprob=math.log(p)) for alt, p in (alternatives or {}).items()
+        ])
+        for text, alternatives in lines
+    ]
+    return "".join(t.token for t in tokens), tokens
+
+
+def test_expected_score_is_probability_weighted():
+    text, tokens = tokenize_response([
+        ("Relevance", None), (":", None), (" ", None), ("4", {"4": 0.5, "5": 0.3, "3": 0.2}), ("\n", None),
+        ("Coherence", None), (": ", None), ("2", {"2": 1.0}),
+    ])
+    expected = expected_scores(text, tokens)
+    assert set(expected) == {"Relevance", "Coherence"}
+    mean = 4 * 0.5 + 5 * 0.3 + 3 * 0.2
+    assert expected["Relevance"]["mean"] == pytest.approx(mean, abs=1e-4)
+    std = math.sqrt(0.5 * (4 - mean) ** 2 + 0.3 * (5 - mean) ** 2 + 0.2 * (3 - mean) ** 2)
+    assert expected["Relevance"]["std"] == pytest.approx(std, abs=1e-4)
+    assert expected["Coherence"] == {"mean": 2.0, "std": 0.0}
+
+
+def test_expected_score_renormalises_over_valid_scores():
+    # " [" and "N" are not scores; the digits are renormalised over the remaining mass
+    text, tokens = tokenize_response([("Surprise: ", None), ("[3", {"[3": 0.3, "3": 0.3, " [": 0.2, "N": 0.2}), ("]", None)])
+    assert expected_scores(text, tokens)["Surprise"] == {"mean": 3.0, "std": 0.0}
+
+
+def test_expected_scores_limited_to_a_packed_block():
+    text, tokens = tokenize_response([
+        ("Story 1:\nEmpathy: ", None), ("5", {"5": 1.0}), ("\nStory 2:\nEmpathy: ", None), ("1", {"1": 0.6, "2": 0.4}),
+    ])
+    start = text.index("Story 2")
+    assert expected_scores(text, tokens, start=start)["Empathy"]["mean"] == pytest.approx(1.4)
+    assert expected_scores(text, tokens, end=start)["Empathy"]["mean"] == 5.0
+
+
+def test_expected_scores_require_tokens_matching_the_text():
+    text, tokens = tokenize_response([("Relevance: ", None), ("4", {"4": 1.0})])
+    assert expected_scores(text, None) == {}
+    assert expected_scores(text + " extra", tokens) == {}
@@ -0,0 +1,45 @@
+import threading
+
+import openai
+import pytest
+
+from evaluate import CRITERIA, expected_scores, parse_scores
+from fake_openai_server import make_server
+
+NO_FAULTS = {"latency_mean": 0.0, "latency_jitter": 0.0, "rate_429": 0.0, "rate_5xx": 0.0,
+             "truncated_json": 0.0, "malformed_json": 0.0}
+
+
+@pytest.fixture
+def client():
+    server = make_server(port=0, faults=NO_FAULTS)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield openai.OpenAI(api_key="test", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+    server.shutdown()
+    server.server_close()
+
+
+def evaluate(client, **kwargs):
+    return client.chat.completions.create(
+        model="local", messages=[{"role": "user", "content": "You are a story evaluator. Rate this story."}], **kwargs
+    ).choices[0]
+
+
+def test_evaluator_reply_carries_logprobs_when_asked(client):
+    choice = evaluate(client, logprobs=True, top_logprobs=5)
+    text = choice.message.content
+    tokens = choice.logprobs.content
+    assert "".join(t.token for t in tokens) == text
+
+    expected = expected_scores(text, tokens)
+    assert set(expected) == set(CRITERIA)
+    scores = parse_scores(text)
+    for criterion in CRITERIA:
+        # The spread is symmetric around the sampled digit, so the mean leans toward 3
+        assert min(scores[criterion], 3) <= expected[criterion]["mean"] <= max(scores[criterion], 3)
+        assert expected[criterion]["std"] > 0
+
+
+def test_no_logprobs_unless_asked(client):
+    assert evaluate(client).logprobs is None
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from hedging import Hedger
+from telemetry import Telemetry
+
+HEDGE_DELAY = 0.02
+
+
+def make_hedger(max_hedge_rate=1.0, max_workers=4):
+    """Hedger whose "judge" calls are hedged after HEDGE_DELAY seconds."""
+    telemetry = Telemetry()
+    for _ in range(20):
+        telemetry.record_latency("primary:judge", HEDGE_DELAY)
+    return Hedger(telemetry, percentile=50, max_hedge_rate=max_hedge_rate, min_samples=20, max_workers=max_workers)
+
+
+def scripted(*durations):
+    """fn whose n-th invocation sleeps durations[n] and returns n."""
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            n = len(calls)
+            calls.append(threading.current_thread())
+        time.sleep(durations[n])
+        return n
+    return fn, calls
+
+
+def test_runs_inline_until_a_percentile_is_learned():
+    hedger = Hedger(Telemetry(), min_samples=20)
+    fn, calls = scripted(0.0)
+    assert hedger.call("judge", fn) == 0
+    assert calls == [threading.current_thread()]
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = make_hedger()
+    fn, calls = scripted(0.0)
+    assert hedger.call("judge", fn) == 0
+    assert len(calls) == 1
+    assert hedger.telemetry.count("hedge.sent.judge") == 0
+
+
+def test_hedge_fires_after_the_percentile_and_first_response_wins():
+    hedger = make_hedger()
+    fn, calls = scripted(0.5, 0.0)
+    abandoned = []
+    charged = threading.Event()
+
+    def on_abandoned(response):
+        abandoned.append(response)
+        charged.set()
+
+    start = time.perf_counter()
+    assert hedger.call("judge", fn, on_abandoned=on_abandoned) == 1
+    assert HEDGE_DELAY <= time.perf_counter() - start < 0.4
+    assert hedger.telemetry.count("hedge.sent.judge") == 1
+    assert hedger.telemetry.count("hedge.won.judge") == 1
+    # The slow primary still completes; its result is only passed on to be charged
+    assert charged.wait(2)
+    assert abandoned == [0]
+    assert hedger.telemetry.count("hedge.abandoned.judge") == 1
+
+
+def test_hedge_rate_cap_holds():
+    hedger = make_hedger(max_hedge_rate=0.5)
+    for _ in range(4):
+        fn, _ = scripted(0.05, 0.05)
+        hedger.call("judge", fn)
+    assert hedger.telemetry.count("hedge.eligible.judge") == 4
+    assert hedger.telemetry.count("hedge.sent.judge") == 2
+
+
+def test_runs_inline_when_every_worker_is_busy():
+    hedger = make_hedger(max_workers=1)  # no room for a primary and its hedge
+    fn, calls = scripted(0.05)
+    assert hedger.call("judge", fn) == 0
+    assert calls == [threading.current_thread()]
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent_manager import AgentManager
+from llm_client import structured_completion
+from schemas import JUDGE_SCHEMA
+from telemetry import Telemetry, use_telemetry
+
+VALID = '{"selected_agent": "A", "selected_content": "An idea", "reason": "Bold"}'
+
+
+class ScriptedClient:
+    """Chat client returning the given contents in order and recording every request."""
+
+    def __init__(self, contents):
+        self.contents = list(contents)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **request):
+        self.requests.append(request)
+        message = SimpleNamespace(content=self.contents.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def judge(client):
+    return structured_completion(client, "judge", JUDGE_SCHEMA, messages=[{"role": "user", "content": "pick"}])
+
+
+def test_invalid_reply_is_repaired_in_the_same_conversation():
+    client = ScriptedClient(['{"selected_agent": "A"}', VALID])
+    telemetry = Telemetry()
+    with use_telemetry(telemetry):
+        result = judge(client)
+
+    assert result == {"selected_agent": "A", "selected_content": "An idea", "reason": "Bold"}
+    repair = client.requests[1]["messages"]
+    assert repair[1] == {"role": "assistant", "content": '{"selected_agent": "A"}'}
+    assert "selected_content" in repair[2]["content"]
+    assert telemetry.count("structured.schema_failure.judge") == 1
+    assert telemetry.count("structured.repaired.judge") == 1
+    assert telemetry.count("structured.unrecovered.judge") == 0
+
+
+def test_unrecovered_reply_returns_none():
+    client = ScriptedClient(["not json", '{"selected_agent": "A"}'])
+    telemetry = Telemetry()
+    with use_telemetry(telemetry):
+        result = judge(client)
+
+    assert result is None
+    assert len(client.requests) == 2
+    assert telemetry.count("structured.parse_failure.judge") == 1
+    assert telemetry.count("structured.schema_failure.judge") == 1
+    assert telemetry.count("structured.unrecovered.judge") == 1
+
+
+def test_unusable_judgments_are_left_out_of_the_final_judge(monkeypatch):
+    monkeypatch.setattr("agent_manager.NUM_ITERATIONS", 2)
+    manager = AgentManager(None)
+    manager.agents = [{"name": "A"}]
+    manager._agent_think = lambda agent, element, context, history: "idea"
+    judgments = iter([None, {"selected_agent": "A", "selected_content": "Round two", "reason": "ok"}])
+    manager._judge_proposals = lambda proposals, element_type, topic: next(judgments)
+    seen = []
+
+    def final_judge(iteration_results, element_type, topic):
+        seen.extend(iteration_results)
+        return None  # unusable: the latest usable round's pick is kept
+
+    manager._final_judge = final_judge
+    assert manager.run_multi_agent_generation("Object", "desc", "topic", "") == "Round two"
+    assert [r["iteration"] for r in seen] == [2]
+
+
+def test_no_usable_judgment_skips_the_final_judge(monkeypatch):
+    monkeypatch.setattr("agent_manager.NUM_ITERATIONS", 2)
+    manager = AgentManager(None)
+    manager.agents = [{"name": "A"}]
+    manager._agent_think = lambda agent, element, context, history: "idea"
+    manager._judge_proposals = lambda proposals, element_type, topic: None
+    manager._final_judge = lambda *args: pytest.fail("final judge called without candidates")
+    assert manager.run_multi_agent_generation("Object", "desc", "topic", "") is None
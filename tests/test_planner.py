@@ -0,0 +1,26 @@
+import planner
+from planner import NUM_ARROWS, NUM_BEATS, calls_per_story
+
+ATTEMPTS = {"setting": 2, "outline": 1}
+
+
+def test_reviews_scale_with_the_reviewed_share_of_drafts():
+    calls = calls_per_story(1, 1, ATTEMPTS, {"review": 0.5, "repair": {}})
+    assert calls["review"] == (2 + NUM_BEATS) * 0.5
+
+
+def test_repair_calls_follow_their_role():
+    calls = calls_per_story(1, 1, ATTEMPTS, {"review": 1.0, "repair": {"judge": 0.1, "synthesis": 0.5}})
+    assert calls["judge.repair"] == calls["judge"] * 0.1
+    assert "synthesis.repair" not in calls  # grounding is off
+
+
+def test_digest_and_grounding_calls_are_counted_when_enabled(monkeypatch):
+    assert "digest" not in calls_per_story(1, 1, ATTEMPTS)
+    monkeypatch.setattr(planner, "AP_DIGEST_SUMMARIZE", True)
+    monkeypatch.setattr(planner, "GROUNDING_ENABLED", True)
+    monkeypatch.setattr(planner, "SEARCH_BATCH_QUERIES", False)
+    calls = calls_per_story(1, 1, ATTEMPTS)
+    assert calls["digest"] == 1
+    assert calls["query_generation"] == calls["synthesis"] == NUM_ARROWS
+    assert planner.searches_per_story() == NUM_ARROWS
@@ -0,0 +1,64 @@
+from review_policy import ReviewPolicy
+from telemetry import Telemetry, use_telemetry
+
+
+def make_policy(sample_rate=0.25, seed=1):
+    return ReviewPolicy(mode="adaptive", sample_rate=sample_rate, min_observations=10,
+                        acceptance_threshold=0.8, seed=seed)
+
+
+def record(policy, role, approved, rejected=0):
+    for _ in range(approved):
+        policy.record(role, True)
+    for _ in range(rejected):
+        policy.record(role, False)
+
+
+def test_reviews_everything_until_confident():
+    policy = make_policy(sample_rate=0.0)
+    record(policy, "outline", approved=9)
+    assert all(policy.should_review("outline") for _ in range(20))
+    record(policy, "outline", approved=1)
+    assert not policy.should_review("outline")
+    # Confidence is per role
+    assert policy.should_review("settings")
+
+
+def test_samples_a_share_of_drafts_once_confident():
+    policy = make_policy(sample_rate=0.25)
+    record(policy, "outline", approved=10)
+    telemetry = Telemetry()
+    with use_telemetry(telemetry):
+        reviewed = sum(policy.should_review("outline") for _ in range(2000))
+    assert 400 < reviewed < 600
+    assert policy.skipped["outline"] == 2000 - reviewed
+    assert telemetry.count("review.policy_skipped.outline") == 2000 - reviewed
+
+
+def test_flagged_drafts_and_revisions_are_always_reviewed():
+    policy = make_policy(sample_rate=0.0)
+    record(policy, "outline", approved=10)
+    assert policy.should_review("outline", flagged=True)
+    assert policy.should_review("outline", is_revision=True)
+    assert ReviewPolicy(mode="always").should_review("outline")
+
+
+def test_full_review_resumes_when_acceptance_drops():
+    policy = make_policy(sample_rate=0.0)
+    record(policy, "outline", approved=10)
+    assert not policy.should_review("outline")
+    record(policy, "outline", approved=0, rejected=3)  # 10/13 < 0.8
+    assert policy.should_review("outline")
+    record(policy, "outline", approved=3)  # 13/16 >= 0.8: sampling again
+    assert not policy.should_review("outline")
+
+
+def test_review_usage_comes_from_the_active_telemetry():
+    telemetry = Telemetry()
+    telemetry.record_latency("review", 1.0)
+    telemetry.record_latency("review", 3.0)
+    telemetry.incr("tokens.prompt.review", 1000)
+    telemetry.incr("tokens.completion.review", 100)
+    with use_telemetry(telemetry):
+        prompt, completion, cost = ReviewPolicy.review_call_usage()
+    assert (prompt, completion) == (500, 50)
@@ -0,0 +1,108 @@
+import math
+import os
+import random
+
+from search_backends import BM25Backend
+from search_cache import SearchCache, tokenize
+
+PASSAGES = [
+    "Grocery drones deliver fresh food to every balcony in the future city.",
+    "Passwords vanish in the future; people unlock doors with a heartbeat.",
+    "The future of soccer is played by robots while fans vote on tactics.",
+    "In the future, grocery stores become community kitchens and gardens.",
+]
+
+
+def make_backend(tmp_path, passages=PASSAGES):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "notes.txt").write_text("\n\n".join(passages), encoding="utf-8")
+    return BM25Backend(str(tmp_path / "index.sqlite"), corpus_dirs=[str(corpus)])
+
+
+def test_ranks_passages_matching_rare_terms_first(tmp_path):
+    backend = make_backend(tmp_path)
+    results = backend.search("future passwords heartbeat")["results"]
+    assert results[0]["content"] == PASSAGES[1]
+    # "future" occurs everywhere, so it barely separates the remaining passages
+    assert results[0]["score"] > 2 * results[1]["score"]
+
+
+def test_more_matching_terms_rank_higher(tmp_path):
+    backend = make_backend(tmp_path)
+    contents = [r["content"] for r in backend.search("grocery community kitchens")["results"]]
+    assert contents[:2] == [PASSAGES[3], PASSAGES[0]]
+
+
+def test_unmatched_query_and_empty_index(tmp_path):
+    assert make_backend(tmp_path).search("zeppelin")["results"] == []
+    empty = BM25Backend(str(tmp_path / "missing.sqlite"))
+    assert empty.search("future") == {"answer": "", "results": []}
+
+
+def test_answer_is_the_best_passage_opening(tmp_path):
+    response = make_backend(tmp_path).search("soccer robots")
+    assert response["answer"] == PASSAGES[2]
+
+
+def brute_force_scores(backend, query):
+    """BM25 of every passage, straight from the formula."""
+    n = len(backend.passages)
+    avg_length = backend.total_length / n
+    scores = {}
+    for term in set(tokenize(query)):
+        docs = backend.postings.get(term, {})
+        idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+        for pid, tf in docs.items():
+            norm = backend.k1 * (1 - backend.b + backend.b * backend.passages[pid]["length"] / avg_length)
+            scores[pid] = scores.get(pid, 0.0) + idf * tf * (backend.k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_scores_are_exact(tmp_path):
+    rng = random.Random(7)
+    words = ["future", "grocery", "robot", "city", "privacy", "data", "farm", "school", "drone", "garden"]
+    passages = [" ".join(rng.choices(words, k=rng.randint(3, 30))) for _ in range(300)]
+    backend = make_backend(tmp_path, passages)
+    backend.load()
+    for query in ["future", "future city privacy", "robot drone garden school", "data farm"]:
+        expected = sorted(brute_force_scores(backend, query).values(), reverse=True)[:10]
+        results = backend.search(query)["results"]
+        assert [r["score"] for r in results] == [round(score, 4) for score in expected]
+
+
+def test_index_is_read_on_first_use_and_persisted(tmp_path):
+    backend = make_backend(tmp_path)
+    assert backend.passages == {}
+    backend.search("future")
+    assert len(backend.passages) == len(PASSAGES)
+    reloaded = BM25Backend(str(tmp_path / "index.sqlite"))
+    assert reloaded.search("passwords")["results"][0]["content"] == PASSAGES[1]
+
+
+def test_changed_and_deleted_files_update_only_their_rows(tmp_path):
+    backend = make_backend(tmp_path)
+    extra = tmp_path / "corpus" / "extra.txt"
+    extra.write_text("Zeppelins carry commuters over the flooded future city.", encoding="utf-8")
+    backend.search("future")
+    kept = {pid for pid, p in backend.passages.items() if p["path"].endswith("notes.txt")}
+
+    extra.write_text("Zeppelins are banned; commuters ride underwater trains.", encoding="utf-8")
+    os.utime(extra, (1, 1))  # a new signature even within the mtime resolution
+    assert backend.add_directory(str(tmp_path / "corpus")) == 1
+    assert backend.search("underwater")["results"][0]["url"] == str(extra)
+    assert {pid for pid, p in backend.passages.items() if p["path"].endswith("notes.txt")} == kept
+
+    extra.unlink()
+    assert backend.add_directory(str(tmp_path / "corpus")) == 1
+    reloaded = BM25Backend(str(tmp_path / "index.sqlite"))
+    assert reloaded.search("zeppelins")["results"] == []
+    assert set(reloaded.passages) == kept
+
+
+def test_cache_does_not_mix_backends(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    cache.put("future grocery habits", "web result", "tavily")
+    assert cache.get("habits of future grocery", "tavily") == "web result"
+    assert cache.get("future grocery habits", "local") is None
+    cache.close()
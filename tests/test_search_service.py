@@ -0,0 +1,120 @@
+import contextvars
+import threading
+from types import SimpleNamespace
+
+import search_cache
+import search_service
+from search_cache import SearchCache
+from search_service import RateLimiter, SearchService
+from telemetry import Telemetry, use_telemetry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def monotonic(self):
+        return self.now
+
+
+def test_rate_limiter_allows_a_burst_then_paces(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(search_service, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    limiter = RateLimiter(rate=2.0, burst=3)
+    times = []
+    for _ in range(5):
+        limiter.acquire()
+        times.append(clock.now - 1000.0)
+    assert times == [0.0, 0.0, 0.0, 0.5, 1.0]
+
+
+def test_rate_limiter_refills_while_idle(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(search_service, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    limiter = RateLimiter(rate=2.0, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+    clock.now += 10  # the bucket refills, but never beyond the burst size
+    start = clock.now
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.now - start == 0.5
+
+
+def test_cache_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.put("future grocery habits", "result", "local")
+    now[0] += 59
+    assert cache.get("future grocery habits", "local") == "result"
+    now[0] += 2
+    assert cache.get("future grocery habits", "local") is None
+    assert cache.get("future grocery habits shopping", "local") is None  # expired entries are not near matches either
+    cache.close()
+    # Expired rows are purged when the cache is reopened
+    reopened = SearchCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    assert reopened._keys == {}
+    reopened.close()
+
+
+def test_cache_serves_near_identical_queries(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), similarity=0.8)
+    cache.put("future grocery shopping habits cities", "result", "local")
+    # 4 of 5 words shared with nothing new: Jaccard 0.8
+    assert cache.get("the future grocery shopping habits", "local") == "result"
+    # 4 shared, 1 new: Jaccard 4/6
+    assert cache.get("future grocery shopping habits villages", "local") is None
+    cache.close()
+
+
+class BlockingBackend:
+    name = "fake"
+    rate_limited = False
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def search(self, query, max_results=10):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return {"answer": f"answer to {query}", "results": []}
+
+
+def test_identical_queries_in_flight_share_one_search(tmp_path):
+    backend = BlockingBackend()
+    service = SearchService("test", cache=SearchCache(str(tmp_path / "cache.sqlite")), backend=backend)
+    telemetry = Telemetry()
+    results = {}
+
+    def search(name, query):
+        with use_telemetry(telemetry):
+            results[name] = service.search(query)
+
+    leader = threading.Thread(target=contextvars.copy_context().run, args=(search, "leader", "future grocery habits"))
+    leader.start()
+    assert backend.started.wait(5)
+    follower = threading.Thread(target=contextvars.copy_context().run, args=(search, "follower", "habits of future grocery"))
+    follower.start()
+    for _ in range(500):  # until the follower has joined the leader's search
+        if telemetry.count("search.deduplicated"):
+            break
+        follower.join(0.01)
+    backend.release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert backend.calls == 1
+    assert results == {"leader": "answer to future grocery habits", "follower": "answer to future grocery habits"}
+    assert telemetry.count("search.network") == 1
+    # Once finished, the result is served from the cache
+    with use_telemetry(telemetry):
+        assert service.search("grocery future habits") == "answer to future grocery habits"
+    assert telemetry.count("search.cache_hit") == 1
+    service.cache.close()
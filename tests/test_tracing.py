@@ -0,0 +1,44 @@
+from tracing import Tracer
+
+
+def make_tracer(spans):
+    """Tracer with hand-made spans: (id, parent, name, start, end)."""
+    tracer = Tracer("test")
+    tracer.spans = [
+        {"id": i, "parent": parent, "name": name, "cat": "stage", "start": start, "end": end, "tid": 1, "args": {}}
+        for i, parent, name, start, end in spans
+    ]
+    return tracer
+
+
+def test_critical_path_follows_the_longest_chain():
+    tracer = make_tracer([
+        (1, None, "ap_stage", 0.0, 10.0),
+        (2, 1, "fast_search", 0.0, 3.0),   # parallel with the slow one
+        (3, 1, "slow_search", 0.0, 6.0),
+        (4, 1, "arrows", 6.0, 10.0),
+        (5, None, "story_stage", 10.0, 15.0),
+    ])
+    assert tracer.critical_path() == {1, 3, 4, 5}
+
+
+def test_critical_path_skips_children_finishing_after_the_cursor():
+    tracer = make_tracer([
+        (1, None, "objects", 0.0, 4.0),
+        (2, None, "grounding", 1.0, 9.0),  # overlaps arrows, finishes before them
+        (3, None, "arrows", 4.0, 10.0),
+    ])
+    assert tracer.critical_path() == {1, 3}
+
+
+def test_critical_path_summary_counts_leaf_time_only():
+    tracer = make_tracer([
+        (1, None, "ap_stage", 0.0, 10.0),
+        (2, 1, "proposal", 0.0, 4.0),
+        (3, 1, "proposal", 4.0, 10.0),
+    ])
+    assert tracer.critical_path_summary() == [("proposal", 10.0)]
+
+
+def test_critical_path_of_an_empty_trace():
+    assert make_tracer([]).critical_path() == set()